@@ -0,0 +1,3 @@
+"""
+Benchmarks of the store parsers and readers over a synthetic email corpus, run with ``python -m benchmarks``
+"""
@@ -0,0 +1,70 @@
+"""
+Compare two results files of ``python -m benchmarks``: ``python -m benchmarks.compare baseline.json new.json``
+"""
+import argparse
+import json
+import typing
+
+# The fields identifying a benchmark and the metric compared, for every section of the results
+SECTIONS = {
+    "parse": (("store", "items"), ("emails_per_second", "peak_memory_kib")),
+    "reader": (("reader", "workers", "processes", "latency", "items", "emails", "partial_fetch"),
+               ("emails_per_second",)),
+    "models": (("items", "items_per_order"), ("bytes_per_item",))
+}
+
+
+def compare(baseline: dict, current: dict) -> typing.List[dict]:
+    """
+    Returns
+    -------
+    One entry per metric of the benchmarks found in both files, with the current value relative to the baseline
+    """
+    changes = []
+    for section, (keys, metrics) in SECTIONS.items():
+        previous = {tuple(result.get(key) for key in keys): result for result in baseline.get(section, [])}
+        for result in current.get(section, []):
+            benchmark = tuple(result.get(key) for key in keys)
+            old = previous.get(benchmark)
+            if old is None:
+                continue
+            for metric in metrics:
+                if not old.get(metric):
+                    continue
+                changes.append({
+                    "section": section,
+                    "benchmark": " ".join(str(value) for value in benchmark),
+                    "metric": metric,
+                    "baseline": old[metric],
+                    "current": result[metric],
+                    "ratio": result[metric] / old[metric]
+                })
+    return changes
+
+
+def format_changes(changes: typing.List[dict]) -> str:
+    if not changes:
+        return "No benchmarks in common"
+    width = max(len(f"{change['section']} {change['benchmark']}") for change in changes)
+    lines = []
+    for change in changes:
+        name = f"{change['section']} {change['benchmark']}".ljust(width)
+        lines.append(f"{name}  {change['metric']:<18} {change['baseline']:>12.1f} -> {change['current']:>12.1f}"
+                     f"  x{change['ratio']:.2f}")
+    return "\n".join(lines)
+
+
+def main(argv: typing.List[str] = None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.compare", description=__doc__)
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    args = parser.parse_args(argv)
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    print(format_changes(compare(baseline, current)))
+
+
+if __name__ == "__main__":
+    main()
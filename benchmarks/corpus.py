@@ -0,0 +1,220 @@
+"""
+Synthetic store emails shaped like the real ones the parsers were written against
+"""
+import typing
+from email.message import EmailMessage
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from email_scrapper.models import Stores, StoreEmail
+
+DATE = "Mon, 12 Oct 2020 10:00:00 -0700"
+
+USER_EMAIL = "buyer@example.com"
+
+# Best Buy invoice rows per pdf page
+PDF_ROWS_PER_PAGE = 40
+
+# Every store email gets a style block and a footer of about this many links, like the marketing templates do
+FOOTER_LINKS = 30
+
+STYLE = "<style>" + "".join(f".c{i}{{font-family:Arial,sans-serif;padding:{i}px;color:#333}}"
+                            for i in range(40)) + "</style>"
+
+
+def _footer(store: str) -> str:
+    links = "".join(f'<div class="c{i % 40}"><a href="https://www.{store}.ca/help/{i}">Help topic {i}</a></div>'
+                    for i in range(FOOTER_LINKS))
+    return f'<div class="footer">{links}<p>You are receiving this email because you placed an order.</p></div>'
+
+
+def _headers(message, store: Stores, subject: str, message_id: str):
+    message["From"] = StoreEmail[store.name].value
+    message["To"] = USER_EMAIL
+    message["Subject"] = subject
+    message["Date"] = DATE
+    message["Message-ID"] = f"<{message_id}@{store.name.lower()}.example.com>"
+
+
+# The Lego and EB Games mailers quoted-printable encode more than they have to, the parsers used to match these
+_mailer_escapes = [("=", "=3D"), ('"', "=22"), (".", "=2E"), ("|", "=7C"), ("\n", "=0A")]
+
+
+def _quoted_printable(store: Stores, subject: str, message_id: str, body: str) -> bytes:
+    for character, escaped in _mailer_escapes:
+        body = body.replace(character, escaped)
+    message = EmailMessage()
+    _headers(message, store, subject, message_id)
+    message["MIME-Version"] = "1.0"
+    message["Content-Type"] = 'text/html; charset="utf-8"'
+    message["Content-Transfer-Encoding"] = "quoted-printable"
+    message.set_payload(body)
+    return message.as_bytes()
+
+
+def amazon_email(items: int, order_number: str = "702-1234567-1234567") -> bytes:
+    """
+    multipart/alternative with a 7bit html part, one table row per item
+    """
+    rows = "".join(f'<tr><td><a href="https://www.amazon.ca/dp/B0{i:08d}">{"2x " if i % 3 == 0 else ""}'
+                   f'Widget Deluxe Edition number {i}</a><br>Sold by Amazon.com.ca, Inc.</td>'
+                   f'<td><strong>CDN$ {10 + i}.99</strong></td></tr>\n' for i in range(items))
+    body = (f"<html><head>{STYLE}</head><body><p>Order #{order_number}</p>\n<p>\nDate: {DATE}\n</p>\n"
+            f"<table>{rows}</table><p>Promotion: -CDN$ 5.00\n</p>{_footer('amazon')}</body></html>")
+    message = MIMEMultipart("alternative")
+    _headers(message, Stores.AMAZONCA, "Your Amazon.ca order has shipped", f"{order_number}.{items}")
+    message.attach(MIMEText("Your order has shipped", "plain"))
+    message.attach(MIMEText(body, "html"))
+    return message.as_bytes()
+
+
+def walmart_email(items: int, order_number: str = "100200300") -> bytes:
+    """
+    multipart/alternative with a base64 utf-8 html part full of Walmart's xml-ish order tags
+    """
+    rows = "".join(f'<tr valign="top"><td><itemname>Household item {i}</itemname></td>'
+                   f'<td><quantity>{i % 4 + 1}</quantity></td><td><price>${i % 50 + 1}.50</price></td></tr>\n'
+                   for i in range(items))
+    body = (f'<html><head>{STYLE}</head><body><orderdate>October 10, 2020</orderdate>'
+            f'<ordernumber>{order_number}</ordernumber><table cellpadding="5" cellspacing="0">'
+            f'<tr valign="top"><td>Item</td><td>Qty</td><td>Price</td></tr>{rows}</table>'
+            f'Savings -CDN$ 2.00\n{_footer("walmart")}</body></html>')
+    message = MIMEMultipart("alternative")
+    _headers(message, Stores.WALMART, "Your order has shipped", f"{order_number}.{items}")
+    message.attach(MIMEText(body, "html", "utf-8"))
+    return message.as_bytes()
+
+
+def lego_email(items: int, order_number: str = "T123456789") -> bytes:
+    """
+    single quoted-printable html part
+    """
+    rows = "".join(f'<tr><td class="padT15">LEGO Set {i} Castle</td><td class="w50pc alignR">Qty: {i % 3 + 1}</td>'
+                   f'<td class="w50pc alignR">CA$ {i % 90 + 10}.99</td></tr>\n' for i in range(items))
+    body = (f'<html><head>{STYLE}</head><body><h1>Order Confirmation</h1><table><tr><td>Shop</td><td>Help</td>'
+            f'<td>VIP</td><td>Stores</td><td>Account</td><td>Order Number: {order_number}</td></tr>\n{rows}'
+            f'</table>{_footer("lego")}</body></html>\n')
+    return _quoted_printable(Stores.LEGOCA, "Order Confirmation", f"{order_number}.{items}", body)
+
+
+def ebgames_email(items: int, order_number: str = "5551234") -> bytes:
+    """
+    single quoted-printable html part
+    """
+    rows = "".join(f'<td>SKU{i:06d}</td><td>Game Title {i}</td><td>PS4</td><td>{i % 2 + 1}</td>'
+                   f'<td>{i % 50 + 10}.99</td>' for i in range(items))
+    body = (f'<html><head>{STYLE}</head><body><p>EB Games</p><p>Thank you</p>'
+            f'<p>Your Order number\n{order_number} | placed online</p><table><tr><td>Sku</td><td>Item</td>'
+            f'<td>Platform</td><td>Qty</td><td>Price</td>{rows}</tr></table>{_footer("ebgames")}</body></html>\n')
+    return _quoted_printable(Stores.EBGAMES, "Your EB Games order", f"{order_number}.{items}", body)
+
+
+def _escape_pdf(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(pages: typing.List[typing.List[typing.Tuple[int, int, bool, str]]]) -> bytes:
+    """
+    A minimal pdf drawing each page's (x, y, bold, text) with the standard Helvetica fonts, and a rule under
+    every page's first line like the invoice table borders
+    """
+    objects = [b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold >>"]
+    contents = []
+    for texts in pages:
+        operators = [f"BT /F{2 if bold else 1} 9 Tf {x} {y} Td ({_escape_pdf(text)}) Tj ET"
+                     for x, y, bold, text in texts]
+        operators.append("40 760 m 560 760 l S")
+        data = "\n".join(operators).encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(data) + data + b"\nendstream")
+        contents.append(len(objects))
+    pages_id = len(objects) + len(contents) + 1
+    kids = []
+    for content in contents:
+        objects.append(b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 612 792] /Contents %d 0 R "
+                       b"/Resources << /Font << /F1 1 0 R /F2 2 0 R >> >> >>" % (pages_id, content))
+        kids.append(b"%d 0 R" % len(objects))
+    objects.append(b"<< /Type /Pages /Kids [" + b" ".join(kids) + b"] /Count %d >>" % len(kids))
+    objects.append(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+    pdf = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    pdf += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    pdf += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, len(objects), xref)
+    return bytes(pdf)
+
+
+def bestbuy_invoice(items: int, order_number: str = "1234567890", terms_pages: int = 2,
+                    repeat_labels: bool = True) -> bytes:
+    """
+    An invoice with the order table spread over as many pages as it needs, followed by pages of terms. Without
+    repeat_labels only the first page has the order number and the column labels
+    """
+    pages = []
+    for start in range(0, max(1, items), PDF_ROWS_PER_PAGE):
+        rows = range(start, min(items, start + PDF_ROWS_PER_PAGE))
+        texts = []
+        if start == 0 or repeat_labels:
+            texts = [(50, 740, True, "Order Number:"), (140, 740, False, order_number),
+                     (50, 720, False, "Order Date: 12-Oct-2020 10:00:00 AM (PST)"),
+                     (50, 680, True, "Product Description"), (330, 680, True, "Qty"), (420, 680, True, "Total")]
+        for line, row in enumerate(rows):
+            y = 666 - 14 * line
+            texts += [(50, y, False, f"Widget Model {row} & Co"), (330, y, False, str(row % 3 + 1)),
+                      (420, y, False, f"{(row % 3 + 1) * 10.5:.2f}")]
+        pages.append(texts)
+    for page in range(terms_pages):
+        pages.append([(50, 740 - 14 * line, False, f"Terms and conditions {page}.{line} lorem ipsum dolor sit amet")
+                      for line in range(45)])
+    return make_pdf(pages)
+
+
+def bestbuy_email(items: int, order_number: str = "1234567890") -> bytes:
+    """
+    plain text body with the invoice as a base64 pdf attachment
+    """
+    message = EmailMessage()
+    _headers(message, Stores.BESTBUYCA, "Your order has shipped", f"{order_number}.{items}")
+    message.set_content("Your invoice is attached.")
+    message.add_attachment(bestbuy_invoice(items, order_number), maintype="application", subtype="pdf",
+                           filename=f"invoice-{order_number}.pdf")
+    return message.as_bytes()
+
+
+generators: typing.Dict[Stores, typing.Callable[..., bytes]] = {
+    Stores.AMAZONCA: amazon_email,
+    Stores.BESTBUYCA: bestbuy_email,
+    Stores.EBGAMES: ebgames_email,
+    Stores.LEGOCA: lego_email,
+    Stores.WALMART: walmart_email
+}
+
+
+def store_email(store: Stores, items: int, order_number: str = None) -> bytes:
+    if order_number is None:
+        return generators[store](items)
+    return generators[store](items, order_number)
+
+
+def order_number(store: Stores, index: int) -> str:
+    """
+    A distinct order number in the format the store's parser expects
+    """
+    if store == Stores.AMAZONCA:
+        return f"702-{index:07d}-1234567"
+    elif store == Stores.LEGOCA:
+        return f"T{index:09d}"
+    return f"{index + 1000000:d}"
+
+
+def mailbox(emails_per_store: int, items: int, stores: typing.Iterable[Stores] = None) -> typing.List[bytes]:
+    """
+    emails_per_store emails with distinct order numbers for each store, interleaved like a real inbox
+    """
+    stores = list(stores or generators)
+    return [store_email(store, items, order_number(store, index))
+            for index in range(emails_per_store) for store in stores]
@@ -0,0 +1,287 @@
+"""
+A local IMAP server holding one inbox, with just enough of RFC 3501 for the readers. It runs its own event loop in
+a thread so blocking and asyncio readers can both use it
+"""
+import asyncio
+import email
+import enum
+import re
+import threading
+import typing
+from email.utils import parseaddr
+
+from email_scrapper import utils
+
+_quoted = re.compile(r"""['"]([^'"]*)['"]""")
+_header_fields = re.compile(r"HEADER\.FIELDS \(([^)]*)\)", re.IGNORECASE)
+_fetch_items = re.compile(r"BODYSTRUCTURE|RFC822|BODY(?:\.PEEK)?\[([^\]]*)\]", re.IGNORECASE)
+
+
+def _split(raw: bytes) -> typing.Tuple[bytes, bytes]:
+    """
+    (header with the blank line after it, body) of an email or body part
+    """
+    if raw.startswith(b"\r\n"):
+        return b"\r\n", raw[2:]
+    header, _, body = raw.partition(b"\r\n\r\n")
+    return header + b"\r\n\r\n", body
+
+
+def _subparts(raw: bytes) -> typing.List[bytes]:
+    """
+    The body parts of a multipart email or body part, empty for any other type
+    """
+    header, body = _split(raw)
+    boundary = email.message_from_bytes(header).get_boundary()
+    if boundary is None:
+        return []
+    parts = []
+    for piece in (b"\r\n" + body).split(b"\r\n--" + boundary.encode())[1:]:
+        if piece.startswith(b"--"):
+            break
+        parts.append(piece.partition(b"\r\n")[2])
+    return parts
+
+
+def _quote(value: str) -> str:
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _params(pairs: typing.List[typing.Tuple[str, str]]) -> str:
+    if not pairs:
+        return "NIL"
+    return "(" + " ".join(f"{_quote(name.upper())} {_quote(value)}" for name, value in pairs) + ")"
+
+
+def _bodystructure(raw: bytes) -> str:
+    header, body = _split(raw)
+    message = email.message_from_bytes(header)
+    params = _params((message.get_params() or [])[1:])
+    if message.get_content_maintype() == "multipart":
+        children = "".join(_bodystructure(part) for part in _subparts(raw))
+        return f"({children} {_quote(message.get_content_subtype().upper())} {params} NIL NIL NIL)"
+    encoding = _quote(message.get("Content-Transfer-Encoding", "7BIT").upper())
+    fields = (f"{_quote(message.get_content_maintype().upper())} {_quote(message.get_content_subtype().upper())} "
+              f"{params} NIL NIL {encoding} {len(body)}")
+    if message.get_content_maintype() == "text":
+        fields += " " + str(body.count(b"\n") + 1)
+    disposition = message.get_params(header="Content-Disposition")
+    if disposition:
+        disposition = f"({_quote(disposition[0][0].upper())} {_params(disposition[1:])})"
+    return f"({fields} NIL {disposition or 'NIL'} NIL NIL)"
+
+
+class _Message:
+    __slots__ = ("raw", "headers", "sender", "subject")
+
+    def __init__(self, raw: bytes):
+        self.raw = raw.replace(b"\r\n", b"\n").replace(b"\n", b"\r\n")
+        self.headers = self.raw.split(b"\r\n\r\n", 1)[0] + b"\r\n"
+        message = email.message_from_bytes(self.headers)
+        self.sender = parseaddr(utils.get_header(message, "From"))[1].lower()
+        self.subject = utils.get_header(message, "Subject").lower()
+
+    def get_section(self, section: str) -> bytes:
+        """
+        The bytes of ``BODY[<section>]``: "", HEADER, or a part number optionally followed by .MIME
+        """
+        if not section:
+            return self.raw
+        if section.upper() == "HEADER":
+            return _split(self.raw)[0]
+        numbers = section.split(".")
+        mime = numbers[-1].upper() == "MIME"
+        part = self.raw
+        for number in numbers[:-1] if mime else numbers:
+            subparts = _subparts(part)
+            if not subparts and number == "1":  # The body of a single part email is part 1
+                continue
+            part = subparts[int(number) - 1]
+        header, body = _split(part)
+        return header if mime else body
+
+    def get_header_fields(self, fields: typing.List[str]) -> bytes:
+        wanted = {field.lower() for field in fields}
+        message = email.message_from_bytes(self.headers)
+        lines = [f"{name}: {value}" for name, value in message.items() if name.lower() in wanted]
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("utf-8", "replace")
+
+
+class ImapServer:
+    """
+    Serves the messages of a single inbox, numbered from UID 1 in the given order. Use as a context manager::
+
+        with ImapServer(messages) as server:
+            reader = SmtpReader("user", "password", settings=server.settings, use_ssl=False)
+    """
+
+    def __init__(self, messages: typing.List[bytes], host: str = "127.0.0.1", uid_validity: int = 1,
+                 latency: float = 0.0):
+        """
+
+        :param messages: The raw emails of the inbox
+        :param host: The address to listen on, the port is picked by the OS
+        :param uid_validity: The inbox's UIDVALIDITY
+        :param latency: Seconds every command waits before its response is written, to stand in for a real
+            server's round-trip time
+        """
+        self.messages = {uid: _Message(raw) for uid, raw in enumerate(messages, 1)}
+        self.host = host
+        self.port = None
+        self.uid_validity = uid_validity
+        self.latency = latency
+        self.commands = 0
+        # The query of every UID SEARCH and the UID set of every UID FETCH, in the order they were received
+        self.searches: typing.List[str] = []
+        self.fetched_uid_sets: typing.List[str] = []
+        # UID FETCH commands including any of these UIDs fail with NO
+        self.failing_uids: typing.Set[int] = set()
+        # SELECT of these folders fails with NO, every other name selects the inbox
+        self.missing_folders: typing.Set[str] = set()
+        self._loop = None
+        self._server = None
+        self._thread = None
+
+    @property
+    def settings(self):
+        """
+        An enum member standing in for :class:`email_scrapper.email_settings.Email`
+        """
+        return enum.Enum("LocalEmail", {"LOCAL": (self.host, self.port)}).LOCAL
+
+    def __enter__(self) -> "ImapServer":
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def start(self):
+        self._loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        def serve():
+            asyncio.set_event_loop(self._loop)
+            self._server = self._loop.run_until_complete(asyncio.start_server(self._handle, self.host, 0))
+            self.port = self._server.sockets[0].getsockname()[1]
+            started.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=serve, name="imap-server", daemon=True)
+        self._thread.start()
+        started.wait()
+
+    def stop(self):
+        if self._loop is None:
+            return
+
+        async def close():
+            self._server.close()
+            await self._server.wait_closed()
+            self._loop.stop()
+
+        self._loop.call_soon_threadsafe(asyncio.ensure_future, close())
+        self._thread.join()
+        self._loop.close()
+        self._loop = None
+
+    def _expand_uids(self, uid_set: str) -> typing.List[int]:
+        newest = max(self.messages, default=0)
+        uids = []
+        for part in uid_set.split(","):
+            start, _, end = part.partition(":")
+            start = newest if start == "*" else int(start)
+            end = start if not end else newest if end == "*" else int(end)
+            uids.extend(uid for uid in range(min(start, end), max(start, end) + 1) if uid in self.messages)
+        return uids
+
+    def search(self, query: str) -> typing.List[int]:
+        """
+        Evaluates the parts of the query the readers send: every FROM is OR'ed, SUBJECT and UID n:* narrow it down.
+        SINCE and TO match every message
+        """
+        senders = {sender.lower() for sender in re.findall(r"FROM\s+['\"]?([^'\"\s)]+)", query)}
+        subject = re.search(r"SUBJECT\s+(\S+)", query)
+        subject = _quoted.sub(r"\1", subject.group(1)).lower().rstrip(")") if subject else None
+        after = re.search(r"UID\s+(\d+):\*", query)
+        # Like a real server, n:* always includes the newest message
+        newest = max(self.messages, default=0)
+        return [uid for uid, message in self.messages.items()
+                if (not after or uid >= int(after.group(1)) or uid == newest) and
+                (not senders or message.sender in senders) and (subject is None or subject in message.subject)]
+
+    def _fetch(self, uid_set: str, items: str) -> typing.Iterator[bytes]:
+        for sequence, uid in enumerate(self._expand_uids(uid_set), 1):
+            message = self.messages[uid]
+            response = f"* {sequence} FETCH (UID {uid}".encode()
+            for item in _fetch_items.finditer(items):
+                fields = _header_fields.search(item.group(1) or "")
+                if item.group(0).upper() == "BODYSTRUCTURE":
+                    response += f" BODYSTRUCTURE {_bodystructure(message.raw)}".encode()
+                    continue
+                if item.group(0).upper() == "RFC822":
+                    name, data = "RFC822", message.raw
+                elif fields:
+                    name = f"BODY[HEADER.FIELDS ({fields.group(1)})]"
+                    data = message.get_header_fields(fields.group(1).split())
+                else:
+                    name, data = f"BODY[{item.group(1).upper()}]", message.get_section(item.group(1))
+                response += f" {name} {{{len(data)}}}\r\n".encode() + data
+            yield response + b")\r\n"
+
+    def _respond(self, tag: str, command: str, arguments: str) -> typing.Iterator[bytes]:
+        newest = max(self.messages, default=0)
+        if command == "CAPABILITY":
+            yield b"* CAPABILITY IMAP4rev1\r\n"
+        elif command in ("SELECT", "EXAMINE"):
+            if arguments.strip('"') in self.missing_folders:
+                yield f"{tag} NO Mailbox doesn't exist\r\n".encode()
+                return
+            yield (f"* {len(self.messages)} EXISTS\r\n* 0 RECENT\r\n* OK [UIDVALIDITY {self.uid_validity}] UIDs "
+                   f"valid\r\n* OK [UIDNEXT {newest + 1}] Predicted next UID\r\n").encode()
+        elif command == "STATUS":
+            folder = arguments.split(" ", 1)[0]
+            yield (f"* STATUS {folder} (MESSAGES {len(self.messages)} UIDNEXT {newest + 1} "
+                   f"UIDVALIDITY {self.uid_validity})\r\n").encode()
+        elif command == "UID":
+            sub_command, _, arguments = arguments.partition(" ")
+            if sub_command.upper() == "SEARCH":
+                self.searches.append(arguments)
+                uids = " ".join(str(uid) for uid in self.search(arguments))
+                yield f"* SEARCH {uids}\r\n".encode()
+            elif sub_command.upper() == "FETCH":
+                uid_set, _, items = arguments.partition(" ")
+                self.fetched_uid_sets.append(uid_set)
+                if self.failing_uids.intersection(self._expand_uids(uid_set)):
+                    yield f"{tag} NO Message unavailable\r\n".encode()
+                    return
+                yield from self._fetch(uid_set, items)
+            else:
+                yield f"{tag} BAD Unknown UID command\r\n".encode()
+                return
+        elif command == "LOGOUT":
+            yield b"* BYE Logging out\r\n"
+        yield f"{tag} OK {command} completed\r\n".encode()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        writer.write(b"* OK [CAPABILITY IMAP4rev1] Local benchmark server ready\r\n")
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                tag, _, rest = line.decode().rstrip("\r\n").partition(" ")
+                command, _, arguments = rest.partition(" ")
+                command = command.upper()
+                self.commands += 1
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                for response in self._respond(tag, command, arguments):
+                    writer.write(response)
+                await writer.drain()
+                if command == "LOGOUT":
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
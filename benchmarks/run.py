@@ -0,0 +1,240 @@
+"""
+Parser, reader and order model benchmarks, written as JSON to be compared with ``python -m benchmarks.compare``
+"""
+import argparse
+import asyncio
+import datetime
+import email
+import json
+import logging
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import typing
+
+from email_scrapper.metrics import RecordingMetrics
+from email_scrapper.models import Item, Order, Stores
+from email_scrapper.readers import AsyncSmtpReader, SmtpReader
+from email_scrapper.stores import amazon, ebgames, lego, walmart
+from email_scrapper.stores.bestbuy import BestBuyReader
+
+from benchmarks import corpus
+from benchmarks.imap_server import ImapServer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SIZES = (1, 10, 100, 500)
+
+DEFAULT_MODEL_ITEMS = 1000000
+
+processors = {
+    Stores.AMAZONCA: amazon.get_data,
+    Stores.BESTBUYCA: BestBuyReader().save_attachment,
+    Stores.EBGAMES: ebgames.parse_ebgames_email,
+    Stores.LEGOCA: lego.parse_lego_email,
+    Stores.WALMART: walmart.parse_walmart_email
+}
+
+
+def _parse(store: Stores, raw_email: bytes):
+    # What the readers do for every downloaded email
+    return processors[store](email.message_from_bytes(raw_email))
+
+
+def bench_parse(store: Stores, items: int, min_time: float = 1.0, min_emails: int = 3) -> dict:
+    """
+    Parse the same email until at least min_time seconds and min_emails emails have gone by, then once more under
+    tracemalloc for the peak memory of a single parse
+    """
+    raw_email = corpus.store_email(store, items)
+    order = _parse(store, raw_email)
+    emails = 0
+    start = time.perf_counter()
+    elapsed = 0.0
+    while elapsed < min_time or emails < min_emails:
+        _parse(store, raw_email)
+        emails += 1
+        elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    try:
+        _parse(store, raw_email)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "store": store.name,
+        "items": items,
+        "email_bytes": len(raw_email),
+        "emails": emails,
+        "seconds": elapsed,
+        "emails_per_second": emails / elapsed,
+        "peak_memory_kib": peak / 1024,
+        "parsed_items": len(order.cart) if order else 0
+    }
+
+
+def _run_reader(reader_name: str, server: ImapServer, partial_fetch: bool = False, **reader_kwargs) -> list:
+    date_from = datetime.datetime.now() - datetime.timedelta(days=30)
+    if reader_name == "AsyncSmtpReader":
+        reader = AsyncSmtpReader("benchmark", "password", settings=server.settings, email_address=corpus.USER_EMAIL,
+                                 date_from=date_from, use_ssl=False, partial_fetch=partial_fetch, **reader_kwargs)
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(reader.run())
+        finally:
+            loop.close()
+    reader = SmtpReader("benchmark", "password", settings=server.settings, email_address=corpus.USER_EMAIL,
+                        date_from=date_from, use_ssl=False, partial_fetch=partial_fetch, **reader_kwargs)
+    return reader.run()
+
+
+def bench_reader(reader_name: str, emails_per_store: int, items: int, workers: int = 1, processes: int = 0,
+                 latency: float = 0.0, stage_metrics: bool = False, partial_fetch: bool = False) -> dict:
+    """
+    Scrape a mailbox of emails_per_store emails of every store with items items each from a local IMAP server
+    """
+    messages = corpus.mailbox(emails_per_store, items)
+    metrics = RecordingMetrics() if stage_metrics else None
+    with ImapServer(messages, latency=latency) as server:
+        start = time.perf_counter()
+        orders = _run_reader(reader_name, server, partial_fetch, workers=workers, processes=processes,
+                             metrics=metrics)
+        elapsed = time.perf_counter() - start
+        commands = server.commands
+    result = {
+        "reader": reader_name,
+        "workers": workers,
+        "processes": processes,
+        "latency": latency,
+        "partial_fetch": partial_fetch,
+        "items": items,
+        "emails": len(messages),
+        "mailbox_bytes": sum(len(message) for message in messages),
+        "seconds": elapsed,
+        "emails_per_second": len(messages) / elapsed,
+        "orders": len(orders),
+        "imap_commands": commands
+    }
+    if metrics is not None:
+        result["stages"] = metrics.snapshot()
+    return result
+
+
+def bench_models(items: int, items_per_order: int = 10) -> dict:
+    """
+    Measure the memory held by orders of items_per_order items, items in total
+    """
+    purchased = datetime.datetime(2020, 10, 12)
+    tracemalloc.start()
+    try:
+        start = time.perf_counter()
+        orders = []
+        for index in range(max(1, items // items_per_order)):
+            order_number = corpus.order_number(Stores.AMAZONCA, index)
+            orders.append(Order(order_number, purchased, Stores.AMAZONCA,
+                                [Item(f"Household item {item}", 10.5, 1, order_number)
+                                 for item in range(items_per_order)]))
+        elapsed = time.perf_counter() - start
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    count = len(orders) * items_per_order
+    del orders
+    return {
+        "items": count,
+        "items_per_order": items_per_order,
+        "seconds": elapsed,
+        "memory_mib": current / 1024 / 1024,
+        "bytes_per_item": current / count
+    }
+
+
+def _git_revision() -> typing.Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL,
+                                       universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment() -> dict:
+    return {
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "revision": _git_revision(),
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine()
+    }
+
+
+def run(stores: typing.List[Stores], sizes: typing.List[int], min_time: float, readers: typing.List[str],
+        emails_per_store: int, reader_items: int, workers: typing.List[int], processes: int,
+        latency: float, stage_metrics: bool = False, partial_fetch: bool = False,
+        model_items: int = DEFAULT_MODEL_ITEMS) -> dict:
+    results = {"environment": environment(), "parse": [], "reader": [], "models": []}
+    for store in stores:
+        for items in sizes:
+            result = bench_parse(store, items, min_time)
+            logger.log(logging.INFO, f"parse {store.name} {items} items: {result['emails_per_second']:.1f} emails/s, "
+                                     f"{result['peak_memory_kib']:.0f} KiB peak")
+            results["parse"].append(result)
+    for reader_name in readers:
+        for worker_count in workers:
+            result = bench_reader(reader_name, emails_per_store, reader_items, worker_count, processes, latency,
+                                  stage_metrics, partial_fetch)
+            logger.log(logging.INFO, f"{reader_name} {worker_count} workers: {result['emails_per_second']:.1f} "
+                                     f"emails/s, {result['orders']} orders")
+            results["reader"].append(result)
+    if model_items:
+        result = bench_models(model_items)
+        logger.log(logging.INFO, f"models {result['items']} items: {result['memory_mib']:.1f} MiB, "
+                                 f"{result['bytes_per_item']:.0f} bytes per item")
+        results["models"].append(result)
+    return results
+
+
+def main(argv: typing.List[str] = None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__)
+    parser.add_argument("--stores", nargs="+", choices=[store.name for store in corpus.generators],
+                        default=[store.name for store in corpus.generators])
+    parser.add_argument("--sizes", nargs="+", type=int, default=list(DEFAULT_SIZES),
+                        help="Items per email of the parse benchmarks")
+    parser.add_argument("--min-time", type=float, default=1.0,
+                        help="Seconds every parse benchmark runs for at least")
+    parser.add_argument("--readers", nargs="*", choices=["SmtpReader", "AsyncSmtpReader"],
+                        default=["SmtpReader", "AsyncSmtpReader"], help="Readers of the end to end benchmarks")
+    parser.add_argument("--emails", type=int, default=20, help="Emails per store in the end to end mailbox")
+    parser.add_argument("--reader-items", type=int, default=10, help="Items per email in the end to end mailbox")
+    parser.add_argument("--workers", nargs="+", type=int, default=[1, 4])
+    parser.add_argument("--processes", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="Seconds the local IMAP server waits before every response")
+    parser.add_argument("--stage-metrics", action="store_true",
+                        help="Record the time spent in every stage of the end to end benchmarks")
+    parser.add_argument("--partial-fetch", action="store_true",
+                        help="The readers only download the body parts the parsers read")
+    parser.add_argument("--model-items", type=int, default=DEFAULT_MODEL_ITEMS,
+                        help="Items held in orders by the model memory benchmark, 0 skips it")
+    parser.add_argument("--output", "-o", default="benchmark-results.json")
+    parser.add_argument("--compare", metavar="BASELINE", help="Print the change from an earlier results file")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s", stream=sys.stderr)
+    logging.getLogger("email_scrapper").setLevel(logging.WARNING)
+
+    results = run([Stores[name] for name in args.stores], args.sizes, args.min_time, args.readers, args.emails,
+                  args.reader_items, args.workers, args.processes, args.latency, args.stage_metrics,
+                  args.partial_fetch, args.model_items)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    logger.log(logging.INFO, f"Results written to {args.output}")
+    if args.compare:
+        from benchmarks import compare
+        with open(args.compare) as f:
+            print(compare.format_changes(compare.compare(json.load(f), results)))
+
+
+if __name__ == "__main__":
+    main()
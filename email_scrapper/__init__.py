@@ -1,4 +1,6 @@
 from .email_settings import Email
-from .models import Order, Stores, StoreEmail
+from .models import Order, OrderEvent, Stores, StoreEmail
 from .readers import *
+from .export import ArrowExporter, CsvExporter, export_orders
+from .orchestrator import Account, AccountResult, Orchestrator, merge_results
 from .utils import store_to_dict
@@ -0,0 +1,192 @@
+import asyncio
+import collections
+import re
+import ssl
+import typing
+
+IMAP4_SSL_PORT = 993
+
+_literal = re.compile(rb"\{(\d+)\}$")
+_response_code = re.compile(rb"\[(?P<type>[A-Z-]+)( (?P<data>[^\]]*))?\]")
+_untagged_status = re.compile(rb"(?P<data>\d+) (?P<type>[A-Z-]+)( (?P<data2>.*))?$")
+_untagged_response = re.compile(rb"(?P<type>[A-Z-]+)( (?P<data>.*))?$")
+
+
+class IMAP4Error(Exception):
+    pass
+
+
+def _quote(value: str) -> str:
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+class AsyncIMAP4:
+    """
+    A small asyncio IMAP4rev1 client covering what the readers need. Responses have the same shape as
+    :mod:`imaplib`'s
+    """
+
+    def __init__(self, host: str, port: int = IMAP4_SSL_PORT, ssl_context: ssl.SSLContext = None,
+                 use_ssl: bool = True):
+        self.host = host
+        self.port = port
+        self.ssl_context = ssl_context or (ssl.create_default_context() if use_ssl else None)
+        self._reader: typing.Optional[asyncio.StreamReader] = None
+        self._writer: typing.Optional[asyncio.StreamWriter] = None
+        self._tag_counter = 0
+        self._lock = asyncio.Lock()
+        self._response_codes: typing.Dict[str, typing.List[bytes]] = {}
+
+    @property
+    def closed(self) -> bool:
+        return self._writer is None
+
+    async def connect(self):
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port, ssl=self.ssl_context)
+        greeting = await self._readline()
+        if not greeting.startswith(b"* OK") and not greeting.startswith(b"* PREAUTH"):
+            raise IMAP4Error(f"Unexpected greeting {greeting!r}")
+
+    def response(self, code: str) -> typing.Tuple[str, typing.List[typing.Optional[bytes]]]:
+        """
+        Same as :meth:`imaplib.IMAP4.response`, the data of the last response code ``code`` e.g. UIDVALIDITY
+        """
+        return code, self._response_codes.pop(code.upper(), [None])
+
+    async def login(self, user: str, password: str) -> typing.Tuple[str, list]:
+        return await self._simple_command("LOGIN", "LOGIN", _quote(user), _quote(password))
+
+    async def select(self, mailbox: str = "INBOX", readonly: bool = False) -> typing.Tuple[str, list]:
+        self._response_codes.clear()
+        return await self._simple_command("EXISTS", "EXAMINE" if readonly else "SELECT", _quote(mailbox))
+
+    async def uid(self, command: str, *args) -> typing.Tuple[str, list]:
+        command = command.upper()
+        return await self._simple_command(command, "UID", command, *(arg for arg in args if arg is not None))
+
+    async def noop(self) -> typing.Tuple[str, list]:
+        return await self._simple_command("NOOP", "NOOP")
+
+    async def logout(self) -> typing.Tuple[str, list]:
+        try:
+            return await self._simple_command("BYE", "LOGOUT")
+        finally:
+            self.close()
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    async def pipeline(self, commands: typing.Iterable[typing.Tuple[str, ...]], depth: int = 4) -> \
+            typing.AsyncIterator[typing.Tuple[str, list]]:
+        """
+        Send the ``UID`` commands keeping up to ``depth`` of them in flight, e.g. ``("FETCH", "101:200",
+        "(RFC822)")``. The connection is unusable if the generator is abandoned half way, so it is closed.
+
+        Yields
+        -------
+        (result, data) of every command in order
+        """
+        async with self._lock:
+            pending = collections.deque()
+            reading = False
+            try:
+                for command in commands:
+                    name = command[0].upper()
+                    pending.append((await self._send("UID", name, *command[1:]), name))
+                    while len(pending) >= depth:
+                        reading = True
+                        response = await self._read_response(*pending.popleft())
+                        reading = False
+                        yield response
+                while pending:
+                    reading = True
+                    response = await self._read_response(*pending.popleft())
+                    reading = False
+                    yield response
+            except BaseException:
+                if pending or reading:
+                    self.close()
+                raise
+
+    async def _simple_command(self, name: str, *args: str) -> typing.Tuple[str, list]:
+        async with self._lock:
+            tag = await self._send(*args)
+            try:
+                result, data = await self._read_response(tag, name)
+            except BaseException:
+                # The rest of the response would be read as the next command's
+                self.close()
+                raise
+        if result == "BAD":
+            raise IMAP4Error(f"{args[0]} command error: {data}")
+        return result, data
+
+    async def _send(self, *args: str) -> bytes:
+        if self._writer is None:
+            raise IMAP4Error("Not connected")
+        self._tag_counter += 1
+        tag = f"A{self._tag_counter:04d}".encode()
+        self._writer.write(tag + b" " + " ".join(args).encode() + b"\r\n")
+        await self._writer.drain()
+        return tag
+
+    async def _readline(self) -> bytes:
+        line = await self._reader.readline()
+        if not line:
+            raise IMAP4Error("Connection closed by server")
+        return line.rstrip(b"\r\n")
+
+    async def _read_response(self, tag: bytes, name: str) -> typing.Tuple[str, list]:
+        """
+        Read up to the tagged completion of ``tag``
+
+        Returns
+        -------
+        The completion result and the data of the untagged ``name`` responses, or the completion text when there
+        are none
+        """
+        untagged: typing.Dict[str, list] = {}
+        while True:
+            line = await self._readline()
+            if line.startswith(b"* "):
+                response_type, data = await self._read_untagged(line[2:])
+                untagged.setdefault(response_type, []).extend(data)
+                continue
+            if line.startswith(b"+"):
+                raise IMAP4Error(f"Unexpected continuation {line!r}")
+            response_tag, _, rest = line.partition(b" ")
+            if response_tag != tag:
+                raise IMAP4Error(f"Unexpected response {line!r}")
+            result, _, text = rest.partition(b" ")
+            self._save_response_code(text)
+            return result.decode(), untagged.get(name, [text])
+
+    async def _read_untagged(self, line: bytes) -> typing.Tuple[str, list]:
+        match = _untagged_status.match(line)
+        if match:
+            response_type = match.group("type")
+            data = match.group("data")
+            if match.group("data2"):
+                data += b" " + match.group("data2")
+        else:
+            match = _untagged_response.match(line)
+            if not match:
+                raise IMAP4Error(f"Unexpected response {line!r}")
+            response_type, data = match.group("type"), match.group("data") or b""
+        if response_type in (b"OK", b"NO", b"BAD"):
+            self._save_response_code(data)
+        items = []
+        literal = _literal.search(data)
+        while literal:
+            items.append((data, await self._reader.readexactly(int(literal.group(1)))))
+            data = await self._readline()
+            literal = _literal.search(data)
+        items.append(data)
+        return response_type.decode(), items
+
+    def _save_response_code(self, text: bytes):
+        match = _response_code.match(text)
+        if match:
+            self._response_codes.setdefault(match.group("type").decode(), []).append(match.group("data"))
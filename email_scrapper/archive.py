@@ -0,0 +1,170 @@
+import datetime
+import email.parser
+import mmap
+import os
+import re
+import sqlite3
+import threading
+import time
+import typing
+from email.message import Message
+from email.utils import parsedate_to_datetime
+
+from email_scrapper import utils
+from email_scrapper.models import Stores
+
+
+_header_end = re.compile(rb"\r?\n\r?\n")
+
+
+def _body_length(raw_email: bytes) -> int:
+    match = _header_end.search(raw_email)
+    return len(raw_email) - match.end() if match else 0
+
+
+def _get_date(headers: Message) -> typing.Optional[float]:
+    try:
+        return parsedate_to_datetime(utils.get_header(headers, "Date")).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+class MessageArchive:
+    """
+    Append-only archive of raw emails: ``messages.mbox``, an mboxcl2 file, and ``index.sqlite3``, the offset and
+    length of every email by account, store and message key. Only one process may write to it at a time
+    """
+
+    def __init__(self, path: str = "email_scrapper_archive"):
+        """
+
+        :param path: The directory of the archive, created if it doesn't exist
+        """
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(path, "index.sqlite3"), check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS messages ("
+                         "account TEXT NOT NULL, store TEXT NOT NULL, message_key TEXT NOT NULL, "
+                         "offset INTEGER NOT NULL, length INTEGER NOT NULL, date REAL, subject TEXT, "
+                         "archived REAL NOT NULL, PRIMARY KEY (account, store, message_key))")
+        self._db.execute("CREATE INDEX IF NOT EXISTS messages_store_date ON messages (store, date)")
+        self._db.commit()
+        self._file = open(os.path.join(path, "messages.mbox"), "ab+")
+        self._map: typing.Optional[mmap.mmap] = None
+        # Maps replaced by a larger one stay open while views of them may be alive
+        self._old_maps: typing.List[mmap.mmap] = []
+        self._header_parser = email.parser.BytesHeaderParser()
+
+    def __enter__(self) -> "MessageArchive":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __contains__(self, entry: typing.Tuple[str, Stores, str]) -> bool:
+        account, store, key = entry
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM messages WHERE account = ? AND store = ? AND message_key = ?",
+                                    (account or "", store.name, key)).fetchone() is not None
+
+    def put(self, account: str, store: Stores, key: str, raw_email: bytes) -> bool:
+        """
+        Append the email unless it is archived already
+
+        Returns
+        -------
+        Whether the email was added
+        """
+        headers = self._header_parser.parsebytes(bytes(raw_email[:64 * 1024]))
+        separator = (f"From MAILER-DAEMON {time.asctime(time.gmtime())}\n"
+                     f"Content-Length: {_body_length(raw_email)}\n").encode()
+        with self._lock:
+            if self._db.execute("SELECT 1 FROM messages WHERE account = ? AND store = ? AND message_key = ?",
+                                (account or "", store.name, key)).fetchone() is not None:
+                return False
+            self._file.seek(0, os.SEEK_END)
+            offset = self._file.tell() + len(separator)
+            self._file.write(separator)
+            self._file.write(raw_email)
+            self._file.write(b"\n\n")
+            self._file.flush()
+            self._db.execute("INSERT INTO messages VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                             (account or "", store.name, key, offset, len(raw_email), _get_date(headers),
+                              utils.get_header(headers, "Subject").lower(), datetime.datetime.now().timestamp()))
+            self._db.commit()
+        return True
+
+    def keys(self, store: Stores, account: str = None, date_from: datetime.datetime = None,
+             subject: str = None) -> typing.List[str]:
+        """
+        Returns
+        -------
+        The message keys of the store's emails sent since date_from whose subject contains subject, in the order
+        they were archived. Emails without a readable Date header are always included
+        """
+        query = "SELECT message_key FROM messages WHERE store = ?"
+        params = [store.name]
+        if account is not None:
+            query += " AND account = ?"
+            params.append(account)
+        if date_from is not None:
+            query += " AND (date IS NULL OR date >= ?)"
+            params.append(date_from.timestamp())
+        if subject:
+            query += " AND instr(subject, ?) > 0"
+            params.append(subject.lower())
+        with self._lock:
+            return [key for key, in self._db.execute(query + " ORDER BY offset", params)]
+
+    def _get_map(self, end: int) -> mmap.mmap:
+        if self._map is None or len(self._map) < end:
+            if self._map is not None:
+                self._old_maps.append(self._map)
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map
+
+    def iter_messages(self, store: Stores, keys: typing.List[str], account: str = None) -> \
+            typing.Iterator[typing.Tuple[str, memoryview]]:
+        """
+        Yields
+        -------
+        (key, raw email) of every archived key. The raw email is a memoryview of the mmapped archive
+        """
+        for chunk in utils.chunked(keys, 500):
+            query = (f"SELECT message_key, offset, length FROM messages WHERE store = ? "
+                     f"AND message_key IN ({','.join('?' * len(chunk))})")
+            params = [store.name, *chunk]
+            if account is not None:
+                query += " AND account = ?"
+                params.append(account)
+            with self._lock:
+                rows = self._db.execute(query + " ORDER BY offset", params).fetchall()
+                if not rows:
+                    continue
+                archive = memoryview(self._get_map(max(offset + length for key, offset, length in rows)))
+            for key, offset, length in rows:
+                yield key, archive[offset:offset + length]
+
+    def get(self, store: Stores, key: str, account: str = None) -> typing.Optional[memoryview]:
+        for key, raw_email in self.iter_messages(store, [key], account):
+            return raw_email
+        return None
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            for archive_map in self._old_maps + [self._map]:
+                if archive_map is None:
+                    continue
+                try:
+                    archive_map.close()
+                except BufferError:  # A message is still referenced, the map is closed once it is released
+                    pass
+            self._map = None
+            self._old_maps = []
+            self._file.close()
+            self._db.close()
@@ -0,0 +1,245 @@
+import hashlib
+import logging
+import re
+import typing
+
+from email_scrapper.stores import bestbuy
+
+logger = logging.getLogger(__name__)
+
+# Top level header fields replaced by the multipart/mixed header of a partial email
+_replaced_headers = {b"content-type", b"content-transfer-encoding", b"mime-version"}
+
+_literal = re.compile(rb"\{(\d+)\}\r\n")
+
+
+class BodyPart:
+    """
+    A part of an IMAP BODYSTRUCTURE. ``section`` is the part specifier of ``BODY[<section>]``, "" for the
+    top level multipart
+    """
+    __slots__ = ("section", "content_type", "params", "disposition", "disposition_params", "parts")
+
+    def __init__(self, section: str, content_type: str, params: typing.Dict[str, str] = None,
+                 disposition: str = None, disposition_params: typing.Dict[str, str] = None,
+                 parts: typing.List["BodyPart"] = None):
+        self.section = section
+        self.content_type = content_type
+        self.params = params or {}
+        self.disposition = disposition
+        self.disposition_params = disposition_params or {}
+        self.parts = parts or []
+
+    def __repr__(self):
+        return f"<BodyPart {self.section or 'TEXT'} - {self.content_type}>"
+
+    @property
+    def is_multipart(self) -> bool:
+        return self.content_type.startswith("multipart/")
+
+    @property
+    def filename(self) -> typing.Optional[str]:
+        """
+        Same lookup as Message.get_filename, without decoding RFC 2231 values
+        """
+        return self.disposition_params.get("filename") or self.params.get("name")
+
+    def walk(self) -> typing.Iterator["BodyPart"]:
+        """
+        Every part depth first, in the order Message.walk yields them
+        """
+        yield self
+        for part in self.parts:
+            yield from part.walk()
+
+
+def _tokenize(data: bytes) -> list:
+    """
+    The parenthesized lists of a FETCH response as nested lists of bytes, None for NIL
+
+    Raises
+    -------
+    ValueError when a list, quoted string or literal is cut off
+    """
+    stack = [[]]
+    i = 0
+    while i < len(data):
+        char = data[i:i + 1]
+        if char in b" \r\n":
+            i += 1
+        elif char == b"(":
+            stack.append([])
+            i += 1
+        elif char == b")":
+            if len(stack) == 1:  # The end of a list opened before data
+                break
+            value = stack.pop()
+            stack[-1].append(value)
+            i += 1
+        elif char == b'"':
+            value = bytearray()
+            i += 1
+            while data[i:i + 1] != b'"':
+                if i >= len(data):
+                    raise ValueError("Unterminated quoted string")
+                if data[i:i + 1] == b"\\":
+                    i += 1
+                value += data[i:i + 1]
+                i += 1
+            stack[-1].append(bytes(value))
+            i += 1
+        elif char == b"{":
+            match = _literal.match(data, i)
+            if match is None:
+                raise ValueError(f"Invalid literal at {i}")
+            size = int(match.group(1))
+            if match.end() + size > len(data):
+                raise ValueError("Literal cut off")
+            stack[-1].append(data[match.end():match.end() + size])
+            i = match.end() + size
+        else:
+            end = i
+            while end < len(data) and data[end:end + 1] not in b" ()\r\n":
+                end += 1
+            atom = data[i:end]
+            stack[-1].append(None if atom.upper() == b"NIL" else atom)
+            i = end
+    if len(stack) > 1:
+        raise ValueError("Unterminated list")
+    return stack[0]
+
+
+def _text(value) -> str:
+    return value.decode("utf-8", "replace") if isinstance(value, bytes) else ""
+
+
+def _params(values) -> typing.Dict[str, str]:
+    if not isinstance(values, list):
+        return {}
+    return {_text(key).lower(): _text(value) for key, value in zip(values[::2], values[1::2])}
+
+
+def _disposition(value) -> typing.Tuple[typing.Optional[str], typing.Dict[str, str]]:
+    if not isinstance(value, list) or not value:
+        return None, {}
+    return _text(value[0]).lower(), _params(value[1] if len(value) > 1 else None)
+
+
+def _get(values: list, index: int):
+    return values[index] if index < len(values) else None
+
+
+def _build(node: list, section: str) -> BodyPart:
+    if node and isinstance(node[0], list):
+        count = next((i for i, child in enumerate(node) if not isinstance(child, list)), len(node))
+        children, extension = node[:count], node[count:]
+        disposition, disposition_params = _disposition(_get(extension, 2))
+        parts = [_build(child, f"{section}.{i}" if section else str(i)) for i, child in enumerate(children, 1)]
+        return BodyPart(section, f"multipart/{_text(_get(extension, 0)).lower()}", _params(_get(extension, 1)),
+                        disposition, disposition_params, parts)
+    content_type = f"{_text(_get(node, 0)).lower()}/{_text(_get(node, 1)).lower()}"
+    # md5 follows the body fields, the lines of text parts and the envelope, body and lines of messages
+    md5_index = 7 + (1 if content_type.startswith("text/") else 3 if content_type == "message/rfc822" else 0)
+    disposition, disposition_params = _disposition(_get(node, md5_index + 1))
+    return BodyPart(section, content_type, _params(_get(node, 2)), disposition, disposition_params)
+
+
+def parse_bodystructure(data: bytes) -> typing.Optional[BodyPart]:
+    """
+    Parse the BODYSTRUCTURE of a FETCH response, literals inlined as ``{size}\\r\\n<bytes>``
+
+    Returns
+    -------
+    The top level part, None when the response has no BODYSTRUCTURE or it can't be parsed
+    """
+    match = re.search(rb"BODYSTRUCTURE \(", data)
+    if match is None:
+        return None
+    try:
+        tokens = _tokenize(data[match.end() - 1:])
+    except ValueError as e:
+        logger.log(logging.WARNING, f"Could not parse BODYSTRUCTURE: {e}")
+        return None
+    if not tokens or not isinstance(tokens[0], list):
+        return None
+    root = tokens[0]
+    if root and isinstance(root[0], list):
+        return _build(root, "")
+    return _build(root, "1")
+
+
+def from_gmail_payload(payload: dict) -> BodyPart:
+    """
+    The parts of the payload of a Gmail ``messages().get(format="full")`` response, sections are its partIds
+    """
+    disposition = None
+    for header in payload.get("headers", []):
+        if header.get("name", "").lower() == "content-disposition":
+            disposition = header.get("value", "").split(";", 1)[0].strip().lower()
+    filename = payload.get("filename")
+    return BodyPart(payload.get("partId", ""), payload.get("mimeType", "").lower(), {}, disposition,
+                    {"filename": filename} if filename else {},
+                    [from_gmail_payload(part) for part in payload.get("parts", [])])
+
+
+def html_parts(root: BodyPart) -> typing.List[BodyPart]:
+    """
+    The part markup.get_html_part reads: the first text/html part, or the first text part
+    """
+    text_parts = [part for part in root.walk() if part.content_type.startswith("text/")]
+    html = [part for part in text_parts if part.content_type == "text/html"]
+    return (html or text_parts)[:1]
+
+
+def pdf_parts(root: BodyPart) -> typing.List[BodyPart]:
+    """
+    The attachments BestBuyReader.save_attachment reads
+    """
+    return [part for part in root.walk() if part.disposition is not None and not part.is_multipart and
+            (part.content_type in bestbuy.PDF_CONTENT_TYPES or
+             part.content_type == "application/octet-stream" and (part.filename or "").lower().endswith(".pdf"))]
+
+
+def can_fetch_parts(root: typing.Optional[BodyPart]) -> bool:
+    """
+    Whether the email can be rebuilt from some of its parts. Single part emails have nothing to leave out and the
+    parts of attached emails are numbered differently, so those are downloaded whole
+    """
+    return root is not None and root.is_multipart and \
+        not any(part.content_type == "message/rfc822" for part in root.walk())
+
+
+def _header_fields(header: bytes) -> typing.Iterator[bytes]:
+    field = b""
+    for line in header.splitlines(keepends=True):
+        if line.strip() == b"":
+            break
+        if line[:1] in b" \t" and field:
+            field += line
+            continue
+        if field:
+            yield field
+        field = line
+    if field:
+        yield field
+
+
+def build_partial_email(header: bytes, parts: typing.List[typing.Tuple[bytes, bytes]]) -> bytes:
+    """
+    A multipart/mixed RFC822 email with the top level header fields of the original and only the given parts
+
+    :param header: The top level header, ``BODY[HEADER]``
+    :param parts: (MIME header, still transfer encoded body) of every part, ``BODY[n.MIME]`` and ``BODY[n]``
+    """
+    boundary = "==email_scrapper_" + hashlib.sha1(b"".join(body for mime, body in parts)).hexdigest()
+    lines = [field if field.endswith(b"\n") else field + b"\r\n" for field in _header_fields(header)
+             if field.split(b":", 1)[0].strip().lower() not in _replaced_headers]
+    lines.append(b"MIME-Version: 1.0\r\n")
+    lines.append(f'Content-Type: multipart/mixed; boundary="{boundary}"\r\n\r\n'.encode())
+    for mime, body in parts:
+        lines.append(f"--{boundary}\r\n".encode())
+        # BODY[n.MIME] ends with the blank line, BODY[n] without the line break before the next boundary
+        lines.append(mime if mime.endswith((b"\r\n\r\n", b"\n\n")) or not mime.strip() else mime + b"\r\n")
+        lines.append(body + b"\r\n")
+    lines.append(f"--{boundary}--\r\n".encode())
+    return b"".join(lines)
@@ -0,0 +1,112 @@
+import datetime
+import logging
+import pickle
+import sqlite3
+import threading
+import typing
+
+from email_scrapper.models import Order, Stores
+
+logger = logging.getLogger(__name__)
+
+
+class MessageCache:
+    """
+    SQLite cache of parse results by the reader's message key. Entries of another parser version are misses
+    """
+
+    def __init__(self, path: str = "email_scrapper_cache.sqlite3", max_age: datetime.timedelta = None,
+                 max_entries: int = None):
+        """
+
+        :param path: The sqlite database file. ":memory:" keeps the cache for the life of the object only
+        :param max_age: Entries older than this are evicted. Defaults to 90 days
+        :param max_entries: Once there are more entries than this the oldest ones are evicted
+        """
+        self.path = path
+        self.max_age = max_age or datetime.timedelta(days=90)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS messages ("
+                         "account TEXT NOT NULL, store TEXT NOT NULL, message_key TEXT NOT NULL, "
+                         "parser_version INTEGER NOT NULL, created REAL NOT NULL, result BLOB, "
+                         "PRIMARY KEY (account, store, message_key))")
+        self._db.execute("CREATE INDEX IF NOT EXISTS messages_created ON messages (created)")
+        self._db.commit()
+
+    def __enter__(self) -> "MessageCache":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def get_many(self, account: str, store: Stores, keys: typing.Iterable[str], parser_version: int) -> \
+            typing.Dict[str, typing.Optional[Order]]:
+        """
+        Returns
+        -------
+        The cached results for the keys that were hit. A value of None means the email was not an order
+        """
+        hits = {}
+        keys = list(keys)
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows = self._db.execute(
+                    f"SELECT message_key, result FROM messages WHERE account = ? AND store = ? AND parser_version = ? "
+                    f"AND message_key IN ({','.join('?' * len(chunk))})",
+                    [account or "", store.name, parser_version, *chunk])
+                for key, result in rows:
+                    try:
+                        hits[key] = pickle.loads(result) if result is not None else None
+                    except Exception as e:
+                        logger.log(logging.ERROR, f"Dropping unreadable cache entry {key}: {e}")
+        return hits
+
+    def put(self, account: str, store: Stores, key: str, parser_version: int, order: typing.Optional[Order]):
+        result = pickle.dumps(order) if order is not None else None
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO messages VALUES (?, ?, ?, ?, ?, ?)",
+                             (account or "", store.name, key, parser_version, _now(), result))
+            self._db.commit()
+
+    def invalidate(self, store: Stores = None, older_than_version: int = None):
+        """
+        Drop the entries of a store, or of every store. When older_than_version is given only entries written
+        by an earlier parser version are dropped.
+        """
+        query = "DELETE FROM messages WHERE 1 = 1"
+        params = []
+        if store is not None:
+            query += " AND store = ?"
+            params.append(store.name)
+        if older_than_version is not None:
+            query += " AND parser_version < ?"
+            params.append(older_than_version)
+        with self._lock:
+            self._db.execute(query, params)
+            self._db.commit()
+
+    def evict(self):
+        """
+        Remove entries older than max_age, then the oldest entries above max_entries
+        """
+        with self._lock:
+            self._db.execute("DELETE FROM messages WHERE created < ?", (_now() - self.max_age.total_seconds(),))
+            if self.max_entries is not None:
+                self._db.execute("DELETE FROM messages WHERE rowid IN (SELECT rowid FROM messages "
+                                 "ORDER BY created DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+            self._db.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def _now() -> float:
+    return datetime.datetime.now().timestamp()
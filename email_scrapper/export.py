@@ -0,0 +1,295 @@
+import csv
+import datetime
+import typing
+
+from email_scrapper.models import Order, Stores
+
+ORDER_COLUMNS = ("order_id", "store", "purchased", "tracking", "shipped", "discount")
+
+ITEM_COLUMNS = ("order_id", "store", "name", "unit_price", "quantity", "item_page")
+
+# Rows per Arrow record batch
+BATCH_SIZE = 65536
+
+
+def _timestamp(value) -> typing.Optional[datetime.datetime]:
+    """
+    Parsers return naive dates and dates with a utc offset, aware ones are converted to naive UTC so the column
+    has a single type
+    """
+    if not isinstance(value, datetime.datetime):
+        return None
+    if value.tzinfo is not None:
+        return value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _store_name(store) -> str:
+    return store.name if isinstance(store, Stores) else store
+
+
+def _quantity(value) -> typing.Optional[int]:
+    return int(value) if value is not None else None
+
+
+def _float(value) -> typing.Optional[float]:
+    return float(value) if value is not None else None
+
+
+def _order_row(order: Order) -> tuple:
+    return (order.id, _store_name(order.store), _timestamp(order.purchased), order.tracking, order.shipped,
+            _float(order.discount))
+
+
+def _item_rows(order: Order) -> typing.Iterator[tuple]:
+    store = _store_name(order.store)
+    for item in order.cart:
+        yield order.id, store, item.name, _float(item.unit_price), _quantity(item.quantity), item.item_page
+
+
+class Exporter:
+    """
+    Streams orders into an orders table and an items table, either path can be None to skip it. Orders are
+    written as they are given, so export the result of run or iter_orders with ``updates=False``::
+
+        with CsvExporter("orders.csv", "items.csv") as exporter:
+            exporter.write_many(order for event, order in reader.iter_orders(updates=False))
+    """
+
+    def __init__(self, orders_path: typing.Optional[str], items_path: typing.Optional[str] = None):
+        self.orders_path = orders_path
+        self.items_path = items_path
+        self.orders = 0
+        self.items = 0
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def open(self):
+        raise NotImplementedError
+
+    def close(self):
+        raise NotImplementedError
+
+    def write(self, order: Order):
+        raise NotImplementedError
+
+    def write_many(self, orders: typing.Iterable[Order]) -> int:
+        """
+        Returns
+        -------
+        How many orders were written
+        """
+        count = 0
+        for order in orders:
+            self.write(order)
+            count += 1
+        return count
+
+
+class CsvExporter(Exporter):
+    """
+    Writes every row as soon as its order is given. Dates are written as "YYYY-MM-DD HH:MM:SS", missing values
+    are empty cells
+    """
+
+    def __init__(self, orders_path: typing.Optional[str], items_path: typing.Optional[str] = None,
+                 encoding: str = "utf-8", dialect: str = "excel"):
+        """
+
+        Parameters
+        ----------
+        orders_path: str
+        The csv file of the orders table
+        items_path: str
+        The csv file of the items table
+        encoding: str
+        Use "utf-8-sig" for files opened in Excel
+        dialect: str
+        The csv dialect of both files
+        """
+        super(CsvExporter, self).__init__(orders_path, items_path)
+        self.encoding = encoding
+        self.dialect = dialect
+        self._files = []
+        self._orders_writer = None
+        self._items_writer = None
+
+    def _open_writer(self, path: str, columns: typing.Tuple[str, ...]):
+        f = open(path, "w", newline="", encoding=self.encoding)
+        self._files.append(f)
+        writer = csv.writer(f, dialect=self.dialect)
+        writer.writerow(columns)
+        return writer
+
+    def open(self):
+        if self.orders_path is not None:
+            self._orders_writer = self._open_writer(self.orders_path, ORDER_COLUMNS)
+        if self.items_path is not None:
+            self._items_writer = self._open_writer(self.items_path, ITEM_COLUMNS)
+
+    def close(self):
+        for f in self._files:
+            f.close()
+        self._files = []
+        self._orders_writer = self._items_writer = None
+
+    def write(self, order: Order):
+        if self._orders_writer is not None:
+            self._orders_writer.writerow(_order_row(order))
+        if self._items_writer is not None:
+            self.items += len(order.cart)
+            self._items_writer.writerows(_item_rows(order))
+        self.orders += 1
+
+
+class _ArrowTable:
+    """
+    Column lists of the rows not yet flushed to the writer as a record batch
+    """
+
+    def __init__(self, pa, schema, writer, parquet: bool):
+        self.pa = pa
+        self.schema = schema
+        self.writer = writer
+        self.parquet = parquet
+        self.columns: typing.List[list] = [[] for _ in schema]
+
+    def __len__(self):
+        return len(self.columns[0])
+
+    def append(self, row: tuple):
+        for values, value in zip(self.columns, row):
+            values.append(value)
+
+    def flush(self):
+        if not len(self):
+            return
+        batch = self.pa.RecordBatch.from_arrays([self.pa.array(values, type=field.type)
+                                                 for values, field in zip(self.columns, self.schema)],
+                                                schema=self.schema)
+        if self.parquet:
+            self.writer.write_table(self.pa.Table.from_batches([batch]))
+        else:
+            self.writer.write_batch(batch)
+        self.columns = [[] for _ in self.schema]
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+class ArrowExporter(Exporter):
+    """
+    Writes the tables as Parquet or Arrow IPC files in record batches of ``batch_size`` rows. Requires pyarrow,
+    installed with the parquet extra
+    """
+
+    def __init__(self, orders_path: typing.Optional[str], items_path: typing.Optional[str] = None,
+                 file_format: str = "parquet", batch_size: int = BATCH_SIZE, compression: str = "snappy"):
+        """
+
+        Parameters
+        ----------
+        orders_path: str
+        The file of the orders table
+        items_path: str
+        The file of the items table
+        file_format: str
+        "parquet" or "arrow"
+        batch_size: int
+        How many rows are buffered before they are written as a record batch
+        compression: str
+        Parquet compression codec, ignored for arrow files
+        """
+        super(ArrowExporter, self).__init__(orders_path, items_path)
+        if file_format not in ("parquet", "arrow"):
+            raise ValueError(f"Unknown file format {file_format}")
+        self.file_format = file_format
+        self.batch_size = max(1, batch_size)
+        self.compression = compression
+        self._orders_table: typing.Optional[_ArrowTable] = None
+        self._items_table: typing.Optional[_ArrowTable] = None
+
+    @staticmethod
+    def _import_pyarrow():
+        try:
+            import pyarrow
+            import pyarrow.ipc
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("pyarrow not found, install email_scrapper[parquet] to export Arrow or Parquet files")
+        return pyarrow
+
+    @classmethod
+    def order_schema(cls):
+        pa = cls._import_pyarrow()
+        return pa.schema([("order_id", pa.string()), ("store", pa.string()), ("purchased", pa.timestamp("us")),
+                          ("tracking", pa.string()), ("shipped", pa.bool_()), ("discount", pa.float64())])
+
+    @classmethod
+    def item_schema(cls):
+        pa = cls._import_pyarrow()
+        return pa.schema([("order_id", pa.string()), ("store", pa.string()), ("name", pa.string()),
+                          ("unit_price", pa.float64()), ("quantity", pa.int64()), ("item_page", pa.string())])
+
+    def _open_table(self, path: str, schema) -> _ArrowTable:
+        pa = self._import_pyarrow()
+        if self.file_format == "parquet":
+            writer = pa.parquet.ParquetWriter(path, schema, compression=self.compression)
+        else:
+            writer = pa.ipc.new_file(path, schema)
+        return _ArrowTable(pa, schema, writer, self.file_format == "parquet")
+
+    def open(self):
+        if self.orders_path is not None:
+            self._orders_table = self._open_table(self.orders_path, self.order_schema())
+        if self.items_path is not None:
+            self._items_table = self._open_table(self.items_path, self.item_schema())
+
+    def write(self, order: Order):
+        if self._orders_table is not None:
+            self._orders_table.append(_order_row(order))
+            if len(self._orders_table) >= self.batch_size:
+                self._orders_table.flush()
+        if self._items_table is not None:
+            for row in _item_rows(order):
+                self._items_table.append(row)
+                self.items += 1
+                if len(self._items_table) >= self.batch_size:
+                    self._items_table.flush()
+        self.orders += 1
+
+    def close(self):
+        for table in (self._orders_table, self._items_table):
+            if table is not None:
+                table.close()
+        self._orders_table = self._items_table = None
+
+
+def export_orders(orders: typing.Iterable[Order], orders_path: typing.Optional[str],
+                  items_path: typing.Optional[str] = None, **exporter_kwargs) -> Exporter:
+    """
+    Write the orders and their items with the exporter matching the paths' extension: .csv, .parquet, or
+    .arrow/.feather
+
+    Returns
+    -------
+    The closed exporter, its orders and items attributes are the number of rows written
+    """
+    extension = (orders_path or items_path or "").rsplit(".", 1)[-1].lower()
+    if extension == "csv":
+        exporter = CsvExporter(orders_path, items_path, **exporter_kwargs)
+    elif extension == "parquet":
+        exporter = ArrowExporter(orders_path, items_path, file_format="parquet", **exporter_kwargs)
+    elif extension in ("arrow", "feather"):
+        exporter = ArrowExporter(orders_path, items_path, file_format="arrow", **exporter_kwargs)
+    else:
+        raise ValueError(f"Unknown export format {extension}")
+    with exporter:
+        exporter.write_many(orders)
+    return exporter
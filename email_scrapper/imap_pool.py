@@ -0,0 +1,382 @@
+import asyncio
+import imaplib
+import logging
+import ssl
+import threading
+import time
+import typing
+from contextlib import contextmanager
+
+from email_scrapper.aioimap import AsyncIMAP4, IMAP4Error
+from email_scrapper.email_settings import Email
+
+logger = logging.getLogger(__name__)
+
+# Errors after which a session can't be used anymore
+_dropped_errors = (imaplib.IMAP4.abort, OSError)
+
+
+class ImapSession:
+    """
+    A logged in connection of an :class:`ImapPool` and the folder it has selected. Only the thread that
+    borrowed it from the pool may use it
+    """
+
+    def __init__(self, imap: imaplib.IMAP4):
+        self.imap = imap
+        self.folder: typing.Optional[str] = None
+        self.uid_validity = "0"
+        self.last_used = time.monotonic()
+
+    def select(self, folder: str, force: bool = False) -> typing.Tuple[str, typing.Optional[int]]:
+        """
+        Select the folder, unless it is selected already
+
+        :param folder: The folder to select
+        :param force: Select the folder even when it is selected already, e.g. to learn its current UIDNEXT
+
+        Returns
+        -------
+        The folder's UIDVALIDITY, and its UIDNEXT when the folder was selected, None when the select was skipped
+        """
+        if folder == self.folder and not force:
+            return self.uid_validity, None
+        self.folder = None
+        result, data = self.imap.select(folder)
+        if result != "OK":
+            raise imaplib.IMAP4.error(f"SELECT of {folder} failed: {data}")
+        result, uid_validity = self.imap.response('UIDVALIDITY')
+        result, uid_next = self.imap.response('UIDNEXT')
+        self.folder = folder
+        self.uid_validity = uid_validity[0].decode() if uid_validity and uid_validity[0] else "0"
+        return self.uid_validity, int(uid_next[0]) if uid_next and uid_next[0] else None
+
+    def noop(self) -> bool:
+        """
+        Returns
+        -------
+        Whether the server still answers
+        """
+        try:
+            result, data = self.imap.noop()
+        except _dropped_errors:
+            return False
+        return result == "OK"
+
+    def close(self):
+        try:
+            self.imap.logout()
+        except (imaplib.IMAP4.error, OSError) as e:
+            logger.log(logging.DEBUG, e)
+
+
+class ImapPool:
+    """
+    Logged in IMAP sessions of one account, reused by every reader and thread borrowing them. Sessions idle for
+    more than ``keepalive`` seconds are checked with a NOOP before they are lent again
+    """
+
+    _shared: typing.Dict[tuple, "ImapPool"] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, username: str, password: str, settings: Email = Email.GMAIL, use_ssl: bool = True,
+                 max_sessions: int = None, keepalive: float = 60.0):
+        """
+
+        :param username: The IMAP username to log in with
+        :param password: The IMAP password to log in with
+        :param settings: The IMAP host and port. Defaults to GMAIL
+        :param use_ssl: Connect without TLS when False, only meant for local servers
+        :param max_sessions: How many sessions may be open at once, borrowers wait for one to be returned once
+            they all are. None for no limit
+        :param keepalive: Seconds a session may be idle before it is checked with a NOOP
+        """
+        self.username = username
+        self._password = password
+        self.settings = settings
+        self.use_ssl = use_ssl
+        self.max_sessions = max_sessions
+        self.keepalive = keepalive
+        self._idle: typing.List[ImapSession] = []
+        self._open = 0
+        self._condition = threading.Condition()
+        self.connects = 0
+
+    @classmethod
+    def shared(cls, username: str, password: str, settings: Email = Email.GMAIL, use_ssl: bool = True,
+               **pool_kwargs) -> "ImapPool":
+        """
+        The pool of the account, created on first use and then returned to every caller asking for the same
+        account, so separate readers share its sessions. pool_kwargs only apply when the pool is created
+        """
+        key = (settings.value, use_ssl, username)
+        with cls._shared_lock:
+            pool = cls._shared.get(key)
+            if pool is None or pool._password != password:
+                pool = cls._shared[key] = cls(username, password, settings, use_ssl, **pool_kwargs)
+            return pool
+
+    def _connect(self) -> ImapSession:
+        if self.use_ssl:
+            imap = imaplib.IMAP4_SSL(*self.settings.value)
+        else:
+            imap = imaplib.IMAP4(*self.settings.value)
+        try:
+            imap.login(self.username, self._password)
+        except BaseException:
+            imap.shutdown()
+            raise
+        self.connects += 1
+        return ImapSession(imap)
+
+    def acquire(self) -> ImapSession:
+        """
+        Borrow an idle session, connecting a new one when none is idle. Give it back with :meth:`release`
+        """
+        while True:
+            with self._condition:
+                while not self._idle and self.max_sessions is not None and self._open >= self.max_sessions:
+                    self._condition.wait()
+                session = self._idle.pop() if self._idle else None
+                if session is None:
+                    self._open += 1
+            if session is None:
+                try:
+                    return self._connect()
+                except BaseException:
+                    self._discarded()
+                    raise
+            if time.monotonic() - session.last_used < self.keepalive or session.noop():
+                return session
+            logger.log(logging.INFO, f"IMAP session to {self.settings.value[0]} was dropped, reconnecting")
+            session.close()
+            self._discarded()
+
+    def release(self, session: ImapSession, discard: bool = False):
+        """
+        Return a borrowed session. A discarded session is logged out and no longer counts towards max_sessions
+        """
+        if discard:
+            session.close()
+            self._discarded()
+            return
+        session.last_used = time.monotonic()
+        with self._condition:
+            self._idle.append(session)
+            self._condition.notify()
+
+    def _discarded(self):
+        with self._condition:
+            self._open -= 1
+            self._condition.notify()
+
+    @contextmanager
+    def session(self) -> typing.Iterator[ImapSession]:
+        """
+        Borrow a session for the block. The session is discarded when the block fails with a lost connection or
+        any error other than a failed IMAP command, as the session may be left halfway through a response
+        """
+        session = self.acquire()
+        discard = True
+        try:
+            yield session
+            discard = False
+        except GeneratorExit:
+            discard = False
+            raise
+        except _dropped_errors:
+            raise
+        except imaplib.IMAP4.error:
+            discard = False
+            raise
+        finally:
+            self.release(session, discard)
+
+    def keep_alive(self):
+        """
+        NOOP every session idle for more than keepalive seconds, dropping the ones the server closed. Call it
+        periodically to keep the idle sessions from timing out between runs
+        """
+        with self._condition:
+            sessions, self._idle = self._idle, []
+        for session in sessions:
+            if time.monotonic() - session.last_used < self.keepalive or session.noop():
+                self.release(session)
+            else:
+                self.release(session, discard=True)
+
+    def close(self):
+        """
+        Log out of every idle session. The pool can still be used, new sessions are opened when needed
+        """
+        with self._condition:
+            sessions, self._idle = self._idle, []
+        for session in sessions:
+            self.release(session, discard=True)
+
+    def __len__(self):
+        """
+        How many sessions are open, idle or borrowed
+        """
+        with self._condition:
+            return self._open
+
+
+class AsyncImapSession:
+    """
+    A logged in connection of an :class:`AsyncImapPool` and the folder it has selected. Only the task that
+    borrowed it from the pool may use it
+    """
+
+    def __init__(self, imap: AsyncIMAP4):
+        self.imap = imap
+        self.folder: typing.Optional[str] = None
+        self.uid_validity = "0"
+        self.last_used = time.monotonic()
+
+    async def select(self, folder: str, force: bool = False) -> typing.Tuple[str, typing.Optional[int]]:
+        """
+        Same as :meth:`ImapSession.select`
+        """
+        if folder == self.folder and not force:
+            return self.uid_validity, None
+        self.folder = None
+        result, data = await self.imap.select(folder)
+        if result != "OK":
+            raise IMAP4Error(f"SELECT of {folder} failed: {data}")
+        result, uid_validity = self.imap.response('UIDVALIDITY')
+        result, uid_next = self.imap.response('UIDNEXT')
+        self.folder = folder
+        self.uid_validity = uid_validity[0].decode() if uid_validity and uid_validity[0] else "0"
+        return self.uid_validity, int(uid_next[0]) if uid_next and uid_next[0] else None
+
+    async def noop(self) -> bool:
+        try:
+            result, data = await self.imap.noop()
+        except (IMAP4Error, OSError, EOFError):
+            return False
+        return result == "OK"
+
+    async def close(self):
+        if self.imap.closed:
+            return
+        try:
+            await self.imap.logout()
+        except (IMAP4Error, OSError, EOFError) as e:
+            logger.log(logging.DEBUG, e)
+
+
+class AsyncImapPool:
+    """
+    :class:`ImapPool` of :class:`AsyncIMAP4` sessions. The sessions belong to the event loop they were opened on,
+    so readers only share a pool while they run on the same loop
+    """
+
+    def __init__(self, username: str, password: str, settings: Email = Email.GMAIL, use_ssl: bool = True,
+                 ssl_context: ssl.SSLContext = None, max_sessions: int = None, keepalive: float = 60.0):
+        """
+
+        :param username: The IMAP username to log in with
+        :param password: The IMAP password to log in with
+        :param settings: The IMAP host and port. Defaults to GMAIL
+        :param use_ssl: Connect without TLS when False, only meant for local servers
+        :param ssl_context: The SSL context of the sessions. Defaults to the system's default context
+        :param max_sessions: How many sessions may be open at once, borrowers wait for one to be returned once
+            they all are. None for no limit
+        :param keepalive: Seconds a session may be idle before it is checked with a NOOP
+        """
+        self.username = username
+        self._password = password
+        self.settings = settings
+        self.use_ssl = use_ssl
+        self.ssl_context = ssl_context
+        self.max_sessions = max_sessions
+        self.keepalive = keepalive
+        self._idle: typing.List[AsyncImapSession] = []
+        self._open = 0
+        # Created on the loop of the first acquire
+        self._condition: typing.Optional[asyncio.Condition] = None
+        self.connects = 0
+
+    async def _connect(self) -> AsyncImapSession:
+        imap = AsyncIMAP4(*self.settings.value, ssl_context=self.ssl_context, use_ssl=self.use_ssl)
+        try:
+            await imap.connect()
+            result, data = await imap.login(self.username, self._password)
+            if result != "OK":
+                raise IMAP4Error(f"LOGIN failed: {data}")
+        except BaseException:
+            imap.close()
+            raise
+        self.connects += 1
+        return AsyncImapSession(imap)
+
+    async def acquire(self) -> AsyncImapSession:
+        """
+        Borrow an idle session, connecting a new one when none is idle. Give it back with :meth:`release`
+        """
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        while True:
+            async with self._condition:
+                while not self._idle and self.max_sessions is not None and self._open >= self.max_sessions:
+                    await self._condition.wait()
+                session = self._idle.pop() if self._idle else None
+                if session is None:
+                    self._open += 1
+            if session is None:
+                try:
+                    return await self._connect()
+                except BaseException:
+                    await self._discarded()
+                    raise
+            if time.monotonic() - session.last_used < self.keepalive or await session.noop():
+                return session
+            logger.log(logging.INFO, f"IMAP session to {self.settings.value[0]} was dropped, reconnecting")
+            await session.close()
+            await self._discarded()
+
+    async def release(self, session: AsyncImapSession, discard: bool = False):
+        """
+        Return a borrowed session. A discarded session, or one whose connection was closed because a command
+        failed halfway, is logged out and no longer counts towards max_sessions
+        """
+        if discard or session.imap.closed:
+            await session.close()
+            await self._discarded()
+            return
+        session.last_used = time.monotonic()
+        async with self._condition:
+            self._idle.append(session)
+            self._condition.notify()
+
+    async def _discarded(self):
+        async with self._condition:
+            self._open -= 1
+            self._condition.notify()
+
+    async def keep_alive(self):
+        """
+        Same as :meth:`ImapPool.keep_alive`
+        """
+        sessions, self._idle = self._idle, []
+        for session in sessions:
+            fresh = time.monotonic() - session.last_used < self.keepalive or await session.noop()
+            await self.release(session, discard=not fresh)
+
+    async def close(self):
+        """
+        Log out of every idle session. The pool can still be used, new sessions are opened when needed
+        """
+        sessions, self._idle = self._idle, []
+        for session in sessions:
+            await self.release(session, discard=True)
+        if not self._open:
+            # Nothing waits on it anymore, the next acquire may run on another loop
+            self._condition = None
+
+    def __len__(self):
+        """
+        How many sessions are open, idle or borrowed
+        """
+        return self._open
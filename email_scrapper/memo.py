@@ -0,0 +1,166 @@
+import collections
+import datetime
+import hashlib
+import logging
+import pickle
+import sqlite3
+import threading
+import typing
+from email.message import Message
+from email.utils import parsedate_to_datetime
+
+from email_scrapper.models import Order, Stores
+from email_scrapper.stores import bestbuy, markup
+
+logger = logging.getLogger(__name__)
+
+# Headers the store parsers read besides the body, the Date is set by apply_email_fields instead
+DIGEST_HEADERS = ("Subject",)
+
+# Stores whose parsers take the order date from the Date header
+DATE_HEADER_STORES = (Stores.AMAZONCA, Stores.EBGAMES, Stores.LEGOCA)
+
+
+def content_digest(store: Stores, parser_version: int, message: Message) -> str:
+    """
+    Hash of what the store's parser reads: the pdf attachments for Best Buy, the html part and the
+    DIGEST_HEADERS for every other store
+    """
+    digest = hashlib.sha256(f"{store.name}:{parser_version}".encode())
+    if store == Stores.BESTBUYCA:
+        for part in message.walk():
+            if part.get_content_maintype() == "multipart" or part.get("Content-Disposition") is None or \
+                    not bestbuy.is_pdf(part):
+                continue
+            digest.update(b"\0" + str(part.get_filename()).encode("utf-8", "replace") + b"\0")
+            digest.update(part.get_payload(decode=True) or b"")
+        return digest.hexdigest()
+    for header in DIGEST_HEADERS:
+        digest.update(b"\0" + str(message.get(header, "")).encode("utf-8", "replace"))
+    part = markup.get_html_part(message)
+    if part is not None:
+        digest.update(b"\0" + str(part.get_content_charset()).encode() + b"\0")
+        digest.update(part.get_payload(decode=True) or b"")
+    return digest.hexdigest()
+
+
+def apply_email_fields(store: Stores, message: Message, order: typing.Optional[Order]) -> bool:
+    """
+    Set the order date of a memo hit from the email's Date header
+
+    Returns
+    -------
+    False when the Date header can't be read
+    """
+    if order is None or store not in DATE_HEADER_STORES:
+        return True
+    try:
+        order.purchased = parsedate_to_datetime(message.get("Date"))
+    except (TypeError, ValueError, IndexError):
+        return False
+    return True
+
+
+class ContentMemo:
+    """
+    Parse results by content digest, in an in memory LRU and optionally a SQLite file shared across runs
+    """
+
+    _missing = object()
+
+    def __init__(self, max_entries: int = 1024, path: str = None, max_age: datetime.timedelta = None,
+                 max_disk_entries: int = None):
+        """
+
+        :param max_entries: How many results the in memory LRU keeps
+        :param path: The sqlite database file of the disk tier. None keeps results in memory only
+        :param max_age: Disk entries older than this are evicted. Defaults to 90 days
+        :param max_disk_entries: Once the disk tier holds more entries than this the oldest ones are evicted
+        """
+        self.max_entries = max(1, max_entries)
+        self.path = path
+        self.max_age = max_age or datetime.timedelta(days=90)
+        self.max_disk_entries = max_disk_entries
+        self._lock = threading.Lock()
+        self._entries: "collections.OrderedDict[str, typing.Optional[bytes]]" = collections.OrderedDict()
+        self._db = None
+        if path is not None:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS content (digest TEXT PRIMARY KEY, created REAL NOT NULL, "
+                             "result BLOB)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS content_created ON content (created)")
+            self._db.commit()
+
+    def __enter__(self) -> "ContentMemo":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _remember(self, digest: str, result: typing.Optional[bytes]):
+        self._entries[digest] = result
+        self._entries.move_to_end(digest)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, digest: str) -> typing.Tuple[bool, typing.Optional[Order]]:
+        """
+        Returns
+        -------
+        Whether the digest was hit and its result. A result of None means the email was not an order
+        """
+        with self._lock:
+            result = self._entries.get(digest, self._missing)
+            if result is not self._missing:
+                self._entries.move_to_end(digest)
+            elif self._db is not None:
+                row = self._db.execute("SELECT result FROM content WHERE digest = ?", (digest,)).fetchone()
+                if row is None:
+                    return False, None
+                result = row[0]
+                self._remember(digest, result)
+            else:
+                return False, None
+        try:
+            return True, pickle.loads(result) if result is not None else None
+        except Exception as e:
+            logger.log(logging.ERROR, f"Dropping unreadable memo entry {digest}: {e}")
+            return False, None
+
+    def put(self, digest: str, order: typing.Optional[Order]):
+        result = pickle.dumps(order) if order is not None else None
+        with self._lock:
+            self._remember(digest, result)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO content VALUES (?, ?, ?)", (digest, _now(), result))
+                self._db.commit()
+
+    def evict(self):
+        """
+        Remove disk entries older than max_age, then the oldest ones above max_disk_entries
+        """
+        if self._db is None:
+            return
+        with self._lock:
+            self._db.execute("DELETE FROM content WHERE created < ?", (_now() - self.max_age.total_seconds(),))
+            if self.max_disk_entries is not None:
+                self._db.execute("DELETE FROM content WHERE rowid IN (SELECT rowid FROM content "
+                                 "ORDER BY created DESC LIMIT -1 OFFSET ?)", (self.max_disk_entries,))
+            self._db.commit()
+
+    def __len__(self):
+        with self._lock:
+            if self._db is not None:
+                return self._db.execute("SELECT COUNT(*) FROM content").fetchone()[0]
+            return len(self._entries)
+
+    def close(self):
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+def _now() -> float:
+    return datetime.datetime.now().timestamp()
@@ -0,0 +1,285 @@
+import cProfile
+import heapq
+import os
+import threading
+import time
+import typing
+from enum import Enum
+
+from email_scrapper.models import Order, Stores
+
+
+class Stage(Enum):
+    SEARCH = "search"
+    PREFILTER = "prefilter"
+    FETCH = "fetch"
+    DECODE = "decode"
+    PARSE = "parse"
+    MERGE = "merge"
+
+
+# Parse results besides the exception type names of failed parses
+PARSED = "parsed"
+EMPTY = "empty"
+
+
+class _NullTimer:
+    seconds = 0.0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+_null_timer = _NullTimer()
+
+
+class Metrics:
+    """
+    Where readers report the time spent in every stage. Discards everything, see :class:`RecordingMetrics`.
+    A store of None is work done for several stores at once
+    """
+    enabled = False
+
+    def timer(self, store: typing.Optional[Stores], stage: Stage) -> typing.ContextManager:
+        """
+        Time the block as one call of the stage. The timer's seconds attribute holds its duration afterwards
+        """
+        return _null_timer
+
+    def add_bytes(self, store: typing.Optional[Stores], stage: Stage, size: int):
+        pass
+
+    def add_parse_result(self, store: Stores, key: typing.Optional[str], seconds: float,
+                         order: typing.Optional[Order] = None, error: BaseException = None):
+        """
+        Count a parsed email: PARSED, EMPTY when it wasn't an order, or the name of the exception it failed with
+        """
+        pass
+
+
+class _Timer:
+    __slots__ = ("metrics", "store", "stage", "start", "seconds")
+
+    def __init__(self, metrics: "RecordingMetrics", store: typing.Optional[Stores], stage: Stage):
+        self.metrics = metrics
+        self.store = store
+        self.stage = stage
+        self.seconds = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.seconds = time.perf_counter() - self.start
+        self.metrics.add_time(self.store, self.stage, self.seconds)
+
+
+class StageStats:
+    __slots__ = ("calls", "seconds", "max_seconds", "bytes")
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.bytes = 0
+
+    def __repr__(self):
+        return f"<StageStats {self.calls} calls - {self.seconds:.3f}s - {self.bytes} bytes>"
+
+
+def _label(store: typing.Optional[Stores]) -> str:
+    return store.name if store is not None else "ALL"
+
+
+class RecordingMetrics(Metrics):
+    """
+    Keeps per store and stage timings, byte counts, parse results by outcome and a sample of the slowest emails
+    to parse. Safe to share between threads and readers
+    """
+    enabled = True
+
+    def __init__(self, slowest: int = 10):
+        """
+
+        :param slowest: How many of the slowest emails to parse are kept
+        """
+        self.slowest = slowest
+        self.stages: typing.Dict[typing.Tuple[str, Stage], StageStats] = {}
+        self.parse_results: typing.Dict[typing.Tuple[str, str], int] = {}
+        self._slowest: typing.List[typing.Tuple[float, str, str]] = []
+        self._lock = threading.Lock()
+
+    def _get_stats(self, store: typing.Optional[Stores], stage: Stage) -> StageStats:
+        key = (_label(store), stage)
+        stats = self.stages.get(key)
+        if stats is None:
+            stats = self.stages[key] = StageStats()
+        return stats
+
+    def timer(self, store: typing.Optional[Stores], stage: Stage) -> typing.ContextManager:
+        return _Timer(self, store, stage)
+
+    def add_time(self, store: typing.Optional[Stores], stage: Stage, seconds: float):
+        with self._lock:
+            stats = self._get_stats(store, stage)
+            stats.calls += 1
+            stats.seconds += seconds
+            stats.max_seconds = max(stats.max_seconds, seconds)
+
+    def add_bytes(self, store: typing.Optional[Stores], stage: Stage, size: int):
+        with self._lock:
+            self._get_stats(store, stage).bytes += size
+
+    def add_parse_result(self, store: Stores, key: typing.Optional[str], seconds: float,
+                         order: typing.Optional[Order] = None, error: BaseException = None):
+        if error is not None:
+            result = type(error).__name__
+        else:
+            result = PARSED if order else EMPTY
+        with self._lock:
+            self.parse_results[(_label(store), result)] = self.parse_results.get((_label(store), result), 0) + 1
+            if self.slowest <= 0:
+                return
+            sample = (seconds, _label(store), str(key))
+            if len(self._slowest) < self.slowest:
+                heapq.heappush(self._slowest, sample)
+            elif sample > self._slowest[0]:
+                heapq.heapreplace(self._slowest, sample)
+
+    def slowest_emails(self) -> typing.List[typing.Tuple[float, str, str]]:
+        """
+        Returns
+        -------
+        (seconds, store, key) of the slowest emails to parse, slowest first
+        """
+        with self._lock:
+            return sorted(self._slowest, reverse=True)
+
+    def snapshot(self) -> dict:
+        """
+        Returns
+        -------
+        Everything recorded so far as plain json serializable data
+        """
+        with self._lock:
+            return {
+                "stages": [{"store": store, "stage": stage.value, "calls": stats.calls, "seconds": stats.seconds,
+                            "max_seconds": stats.max_seconds, "bytes": stats.bytes}
+                           for (store, stage), stats in self.stages.items()],
+                "parse_results": [{"store": store, "result": result, "count": count}
+                                  for (store, result), count in self.parse_results.items()],
+                "slowest": [{"seconds": seconds, "store": store, "key": key}
+                            for seconds, store, key in sorted(self._slowest, reverse=True)]
+            }
+
+    def reset(self):
+        with self._lock:
+            self.stages.clear()
+            self.parse_results.clear()
+            self._slowest = []
+
+    def to_prometheus(self, prefix: str = "email_scrapper") -> str:
+        """
+        Returns
+        -------
+        The counters in the Prometheus text exposition format
+        """
+        with self._lock:
+            stages = sorted((store, stage.value, {"calls": stats.calls, "seconds": stats.seconds,
+                                                  "max_seconds": stats.max_seconds, "bytes": stats.bytes})
+                            for (store, stage), stats in self.stages.items())
+            parse_results = sorted(self.parse_results.items())
+        metrics = [
+            ("stage_calls_total", "counter", "Calls of every pipeline stage", "calls"),
+            ("stage_seconds_total", "counter", "Seconds spent in every pipeline stage", "seconds"),
+            ("stage_max_seconds", "gauge", "Longest single call of every pipeline stage", "max_seconds"),
+            ("stage_bytes_total", "counter", "Bytes downloaded by every pipeline stage", "bytes")
+        ]
+        lines = []
+        for name, kind, description, attribute in metrics:
+            lines.append(f"# HELP {prefix}_{name} {description}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            for store, stage, stats in stages:
+                lines.append(f'{prefix}_{name}{{store="{store}",stage="{stage}"}} {stats[attribute]}')
+        lines.append(f"# HELP {prefix}_parse_results_total Parsed emails by result or exception type")
+        lines.append(f"# TYPE {prefix}_parse_results_total counter")
+        for (store, result), count in parse_results:
+            lines.append(f'{prefix}_parse_results_total{{store="{store}",result="{result}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str, prefix: str = "email_scrapper"):
+        """
+        Write the counters to a file atomically, e.g. for node_exporter's textfile collector
+        """
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.to_prometheus(prefix))
+        os.replace(tmp_path, path)
+
+
+class _ProfilingTimer(_Timer):
+    __slots__ = ("profile",)
+
+    def __enter__(self):
+        self.profile = self.metrics._acquire_profile(self.stage)
+        if self.profile is not None:
+            try:
+                self.profile.enable()
+            except ValueError:  # Another profiler is already running
+                self.metrics._release_profile()
+                self.profile = None
+        return super(_ProfilingTimer, self).__enter__()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        super(_ProfilingTimer, self).__exit__(exc_type, exc_val, exc_tb)
+        if self.profile is not None:
+            self.profile.disable()
+            self.metrics._release_profile()
+
+
+class ProfilingMetrics(RecordingMetrics):
+    """
+    RecordingMetrics that also profiles every stage with cProfile, one call at a time
+    """
+
+    def __init__(self, slowest: int = 10):
+        super(ProfilingMetrics, self).__init__(slowest)
+        self.profiles: typing.Dict[Stage, cProfile.Profile] = {}
+        self._profiling = threading.Lock()
+
+    def _acquire_profile(self, stage: Stage) -> typing.Optional[cProfile.Profile]:
+        if not self._profiling.acquire(blocking=False):
+            return None
+        with self._lock:
+            profile = self.profiles.get(stage)
+            if profile is None:
+                profile = self.profiles[stage] = cProfile.Profile()
+        return profile
+
+    def _release_profile(self):
+        self._profiling.release()
+
+    def timer(self, store: typing.Optional[Stores], stage: Stage) -> typing.ContextManager:
+        return _ProfilingTimer(self, store, stage)
+
+    def dump_profiles(self, directory: str) -> typing.List[str]:
+        """
+        Write every stage's profile to ``<stage>.prof`` in the directory, to be read with pstats or snakeviz
+
+        Returns
+        -------
+        The paths written
+        """
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        with self._lock:
+            profiles = list(self.profiles.items())
+        for stage, profile in profiles:
+            path = os.path.join(directory, f"{stage.value}.prof")
+            profile.dump_stats(path)
+            paths.append(path)
+        return paths
@@ -1,8 +1,13 @@
 import datetime
+import re
 import typing
 from difflib import SequenceMatcher
 from enum import Enum, auto
 
+MERGE_RATIO = 0.90
+
+_non_word = re.compile(r"\W+")
+
 
 class Stores(Enum):
     AMAZONCA = auto()
@@ -22,7 +27,14 @@ class StoreEmail(Enum):
     WALMART = "noreply@walmart.ca"
 
 
+class OrderEvent(Enum):
+    NEW = auto()
+    UPDATED = auto()
+
+
 class Order:
+    __slots__ = ("id", "purchased", "store", "tracking", "shipped", "discount", "cart")
+    FIELDS = __slots__
 
     def __init__(self, order_number: str, purchased: datetime.datetime, store: Stores,
                  cart: typing.List["Item"] = None,
@@ -42,43 +54,106 @@ class Order:
         return len(self.cart)
 
     def __lt__(self, other):
-        return self.purchased < other.date
+        return self.purchased < other.purchased
 
     def __gt__(self, other):
-        return self.purchased > other.date
+        return self.purchased > other.purchased
 
     def __hash__(self):
-        return int(self.id.replace("-", ""))
+        return hash((self.id, self.store))
 
     def __eq__(self, other):
-        same_order = self.id = other.id
-        same_cart = self.cart == other.cart
-        return all([same_order, same_cart])
+        if not isinstance(other, Order):
+            return NotImplemented
+        return self.id == other.id and self.store == other.store and self.cart == other.cart
 
     def __getitem__(self, item):
-        return self.__dict__[item]
+        try:
+            return getattr(self, item)
+        except (AttributeError, TypeError):
+            raise KeyError(item)
 
     def __iadd__(self, other: "Order"):
-        for item1, item2 in zip(self.cart, other.cart):
-            ratio = SequenceMatcher(None, item1.name, item2.name).ratio()
-            if ratio > 0.90:
-                item1.quantity += item2.quantity
+        """
+        Merge another email of the same order into this one. Items are matched by name, first exactly, then
+        fuzzily, and a matched item's quantity is added to this order's item. Items without a match are appended.
+        """
+        by_name: typing.Dict[str, typing.List["Item"]] = {}
+        for item in self.cart:
+            by_name.setdefault(_normalize_name(item.name), []).append(item)
+        matched = set()
+        unmatched = []
+        for item in other.cart:
+            candidates = by_name.get(_normalize_name(item.name))
+            match = next((candidate for candidate in candidates if id(candidate) not in matched), None) \
+                if candidates else None
+            if match is None:
+                unmatched.append(item)
+            else:
+                matched.add(id(match))
+                match.quantity += item.quantity
+        for item in unmatched:
+            match = _closest_item(item, [candidate for candidate in self.cart if id(candidate) not in matched])
+            if match is None:
+                self.cart.append(item)
+            else:
+                matched.add(id(match))
+                match.quantity += item.quantity
+        return self
 
     def __iter__(self):
-        iters = dict((x, y) for x, y in Order.__dict__.items() if not x.startswith("_"))
-        iters.update(self.__dict__)
-        for x, y in iters.items():
-            if isinstance(y, list):
-                yield x, [dict(item) for item in y]
-            elif isinstance(y, Stores):
-                yield x, y.value
-            elif isinstance(y, datetime.datetime):
-                yield x, y.strftime("%Y-%m-%d")
-            else:
-                yield x, y
+        return iter(self.to_dict().items())
+
+    def to_tuple(self) -> tuple:
+        """
+        The raw field values in FIELDS order, the cart is left as Item objects
+        """
+        return self.id, self.purchased, self.store, self.tracking, self.shipped, self.discount, self.cart
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "purchased": _format_date(self.purchased),
+            "store": self.store.value if isinstance(self.store, Stores) else self.store,
+            "tracking": self.tracking,
+            "shipped": self.shipped,
+            "discount": self.discount,
+            "cart": [item.to_dict() for item in self.cart]
+        }
+
+
+def _format_date(value):
+    if isinstance(value, datetime.datetime):
+        return value.strftime("%Y-%m-%d")
+    return value
+
+
+def _normalize_name(name: str) -> str:
+    return " ".join(_non_word.sub(" ", str(name or "").lower()).split())
+
+
+def _closest_item(item: "Item", candidates: typing.List["Item"]) -> typing.Optional["Item"]:
+    """
+    The candidate whose name is most similar to the item's, provided the similarity ratio is above MERGE_RATIO.
+    The cheap upper bounds of the ratio are checked first so most candidates never get a full comparison.
+    """
+    matcher = SequenceMatcher(None)
+    matcher.set_seq2(str(item.name or ""))
+    best, best_ratio = None, MERGE_RATIO
+    for candidate in candidates:
+        matcher.set_seq1(str(candidate.name or ""))
+        if matcher.real_quick_ratio() <= best_ratio or matcher.quick_ratio() <= best_ratio:
+            continue
+        ratio = matcher.ratio()
+        if ratio > best_ratio:
+            best, best_ratio = candidate, ratio
+    return best
 
 
 class Item:
+    __slots__ = ("name", "order", "unit_price", "quantity", "item_page")
+    FIELDS = __slots__
+
     def __init__(self, name, unit_price: float, quantity: int, order_id: str, item_page: str = None):
         self.name = name
         self.order = order_id
@@ -90,16 +165,24 @@ class Item:
         return f"<{self.name}> - <{self.order}> - <{self.quantity}> - <{self.unit_price}>"
 
     def __iter__(self):
-        iters = dict((x, y) for x, y in Item.__dict__.items() if not x.startswith("_"))
-        iters.update(self.__dict__)
-        for x, y in iters.items():
-            if isinstance(y, datetime.datetime):
-                yield x, y.strftime("%Y-%m-%d")
-            else:
-                yield x, y
+        return iter(self.to_dict().items())
+
+    def to_tuple(self) -> tuple:
+        return self.name, self.order, self.unit_price, self.quantity, self.item_page
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "order": self.order,
+            "unit_price": self.unit_price,
+            "quantity": self.quantity,
+            "item_page": self.item_page
+        }
 
     def __eq__(self, other):
+        if not isinstance(other, Item):
+            return NotImplemented
         return self.order == other.order and self.name == other.name
 
     def __hash__(self):
-        return hash(self.name)
+        return hash((self.order, self.name))
@@ -0,0 +1,227 @@
+import collections
+import imaplib
+import logging
+import random
+import socket
+import time
+import typing
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from email_scrapper.email_settings import Email
+from email_scrapper.models import Order
+from email_scrapper.readers import BaseReader, SmtpReader
+
+logger = logging.getLogger(__name__)
+
+# Gmail allows 15 IMAP connections at once per account, not per server
+GMAIL_IMAP_CONNECTION_LIMIT = 15
+
+DEFAULT_HOST_LIMITS = {
+    Email.GMAIL.value[0]: GMAIL_IMAP_CONNECTION_LIMIT
+}
+
+
+def is_transient_error(error: BaseException) -> bool:
+    """
+    Whether scraping the account again later could succeed: dropped connections, timeouts, and Gmail API rate
+    limits or server errors. Login failures and parser bugs are not retried
+    """
+    if isinstance(error, (imaplib.IMAP4.abort, ConnectionError, socket.timeout, socket.gaierror)):
+        return True
+    status = getattr(getattr(error, "resp", None), "status", None)
+    try:
+        return status is not None and (int(status) == 429 or int(status) >= 500)
+    except (TypeError, ValueError):
+        return False
+
+
+class Account:
+
+    def __init__(self, name: str, reader_factory: typing.Callable[[], BaseReader], host: str = None,
+                 connections: int = 1, username: str = None):
+        """
+
+        Parameters
+        ----------
+        name: str
+        Tags the account's results
+        reader_factory: callable
+        Builds the account's reader. A new reader is built for every attempt
+        host: str
+        The server the reader connects to
+        connections: int
+        How many connections the reader opens at once, usually its workers
+        username: str
+        The login on the host. Accounts with the same host and username share its connection limit. Defaults
+        to name
+        """
+        self.name = name
+        self.reader_factory = reader_factory
+        self.host = host
+        self.connections = max(1, connections)
+        self.username = username or name
+
+    @property
+    def limit_key(self) -> typing.Tuple[typing.Optional[str], str]:
+        return self.host, self.username
+
+    def __repr__(self):
+        return f"<Account {self.name} - {self.host}>"
+
+    @classmethod
+    def smtp(cls, username: str, password: str, settings: Email = Email.GMAIL, name: str = None,
+             **reader_kwargs) -> "Account":
+        """
+        An account read by :class:`SmtpReader`, reader_kwargs are passed to it
+        """
+        return cls(name or username,
+                   lambda: SmtpReader(username, password, settings=settings, **reader_kwargs),
+                   host=settings.value[0], connections=reader_kwargs.get("workers", 1), username=username)
+
+
+class AccountResult:
+    __slots__ = ("account", "orders", "error", "attempts")
+
+    def __init__(self, account: Account, orders: typing.List[Order], error: BaseException = None,
+                 attempts: int = 1):
+        self.account = account
+        self.orders = orders
+        self.error = error
+        self.attempts = attempts
+
+    def __repr__(self):
+        return f"<AccountResult {self.account.name} - {len(self.orders)} orders - {self.error!r}>"
+
+
+class _Job:
+    __slots__ = ("index", "account", "attempts", "not_before")
+
+    def __init__(self, index: int, account: Account):
+        self.index = index
+        self.account = account
+        self.attempts = 0
+        self.not_before = 0.0
+
+
+class Orchestrator:
+    """
+    Scrapes many accounts on a pool of threads. An account is only started while its login has free connections
+    under ``host_limits``, and retried with an exponential backoff when it fails with a transient error
+    """
+
+    def __init__(self, accounts: typing.List[Account], workers: int = 4,
+                 host_limits: typing.Dict[str, int] = None, default_host_limit: int = None,
+                 retries: int = 3, backoff: float = 1.0, max_backoff: float = 60.0):
+        """
+
+        Parameters
+        ----------
+        accounts: list
+        The accounts to scrape
+        workers: int
+        How many accounts are scraped at once
+        host_limits: dict
+        Maximum number of connections open at once per login of a host, e.g. Gmail's 15 are per account.
+        Defaults to DEFAULT_HOST_LIMITS
+        default_host_limit: int
+        Limit of the hosts missing from host_limits, None for no limit
+        retries: int
+        How many more times an account failing with a transient error is tried
+        backoff: float
+        Seconds to wait before the first retry, doubled on every following one up to max_backoff
+        """
+        self.accounts = list(accounts)
+        self.workers = max(1, workers)
+        self.host_limits = DEFAULT_HOST_LIMITS if host_limits is None else host_limits
+        self.default_host_limit = default_host_limit
+        self.retries = max(0, retries)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    def _get_host_limit(self, host: str) -> typing.Optional[int]:
+        return self.host_limits.get(host, self.default_host_limit)
+
+    def _get_connections(self, account: Account) -> int:
+        limit = self._get_host_limit(account.host)
+        # An account needing more than its login allows runs alone on it
+        return account.connections if limit is None else min(account.connections, limit)
+
+    def _has_capacity(self, account: Account, in_use: typing.Counter[tuple]) -> bool:
+        limit = self._get_host_limit(account.host)
+        return limit is None or in_use[account.limit_key] + self._get_connections(account) <= limit
+
+    def _get_delay(self, attempts: int) -> float:
+        delay = min(self.max_backoff, self.backoff * 2 ** (attempts - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    @staticmethod
+    def _scrape(account: Account) -> typing.List[Order]:
+        return account.reader_factory().run()
+
+    def iter_results(self) -> typing.Iterator[AccountResult]:
+        """
+        Yields
+        -------
+        The result of every account as soon as it is done, in completion order
+        """
+        for index, result in self._iter_results():
+            yield result
+
+    def _iter_results(self) -> typing.Iterator[typing.Tuple[int, AccountResult]]:
+        waiting = collections.deque(_Job(index, account) for index, account in enumerate(self.accounts))
+        running: typing.Dict[Future, _Job] = {}
+        in_use: typing.Counter[tuple] = collections.Counter()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while waiting or running:
+                now = time.monotonic()
+                for job in list(waiting):
+                    if len(running) >= self.workers:
+                        break
+                    if job.not_before > now or not self._has_capacity(job.account, in_use):
+                        continue
+                    waiting.remove(job)
+                    job.attempts += 1
+                    in_use[job.account.limit_key] += self._get_connections(job.account)
+                    running[executor.submit(self._scrape, job.account)] = job
+                delays = [job.not_before - now for job in waiting if job.not_before > now]
+                timeout = max(0.0, min(delays)) if delays else None
+                if not running:
+                    time.sleep(timeout or 0)
+                    continue
+                done, _ = wait(list(running), timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job = running.pop(future)
+                    in_use[job.account.limit_key] -= self._get_connections(job.account)
+                    try:
+                        orders = future.result()
+                    except Exception as e:
+                        if is_transient_error(e) and job.attempts <= self.retries:
+                            delay = self._get_delay(job.attempts)
+                            logger.log(logging.WARNING, f"{job.account} failed with {e!r}, retrying in {delay:.1f}s")
+                            job.not_before = time.monotonic() + delay
+                            waiting.append(job)
+                            continue
+                        logger.log(logging.ERROR, f"{job.account} failed: {e!r}")
+                        yield job.index, AccountResult(job.account, [], e, job.attempts)
+                    else:
+                        yield job.index, AccountResult(job.account, orders or [], None, job.attempts)
+
+    def run(self) -> typing.List[AccountResult]:
+        """
+        Scrape every account
+
+        Returns
+        -------
+        One AccountResult per account, in the same order as the accounts
+        """
+        results = dict(self._iter_results())
+        return [results[index] for index in range(len(self.accounts))]
+
+
+def merge_results(results: typing.Iterable[AccountResult]) -> typing.List[typing.Tuple[str, Order]]:
+    """
+    Returns
+    -------
+    (account name, order) of every order of the results
+    """
+    return [(result.account.name, order) for result in results for order in result.orders]
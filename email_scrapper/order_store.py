@@ -0,0 +1,275 @@
+import datetime
+import logging
+import sqlite3
+import threading
+import typing
+
+from email_scrapper.models import Item, Order, OrderEvent, Stores
+
+logger = logging.getLogger(__name__)
+
+_utc = datetime.timezone.utc
+
+
+def _to_timestamp(value: typing.Optional[datetime.datetime]) -> typing.Tuple[typing.Optional[float],
+                                                                           typing.Optional[int]]:
+    """
+    (seconds since the epoch, utc offset in seconds) of a date. Naive dates are taken as UTC and have no offset
+    """
+    if not isinstance(value, datetime.datetime):
+        return None, None
+    if value.tzinfo is None:
+        return value.replace(tzinfo=_utc).timestamp(), None
+    return value.timestamp(), int(value.utcoffset().total_seconds())
+
+
+def _from_timestamp(timestamp: typing.Optional[float], offset: typing.Optional[int]) -> \
+        typing.Optional[datetime.datetime]:
+    if timestamp is None:
+        return None
+    if offset is None:
+        return datetime.datetime.fromtimestamp(timestamp, _utc).replace(tzinfo=None)
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone(datetime.timedelta(seconds=offset)))
+
+
+def _normalize_item_name(name) -> str:
+    return " ".join(str(name or "").lower().split())
+
+
+class ItemTotal:
+    __slots__ = ("name", "store", "quantity", "spent", "orders")
+
+    def __init__(self, name: str, store: Stores, quantity: int, spent: float, orders: int):
+        self.name = name
+        self.store = store
+        self.quantity = quantity
+        self.spent = spent
+        self.orders = orders
+
+    def __repr__(self):
+        return f"<{self.name}> - <{self.store}> - <{self.quantity}> - <{self.spent}>"
+
+
+class OrderStore:
+    """
+    SQLite database of scraped orders by account, store and order id. Use :meth:`upsert` for the orders of
+    incremental runs and :meth:`replace` for full rescans. Orders without an id are skipped
+    """
+
+    def __init__(self, path: str = "email_scrapper_orders.sqlite3"):
+        """
+
+        :param path: The sqlite database file. ":memory:" keeps the orders for the life of the object only
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS orders (
+                account TEXT NOT NULL, store TEXT NOT NULL, order_id TEXT NOT NULL, purchased REAL,
+                utc_offset INTEGER, tracking TEXT, shipped INTEGER, discount REAL, updated REAL NOT NULL,
+                PRIMARY KEY (account, store, order_id));
+            CREATE INDEX IF NOT EXISTS orders_order_id ON orders (order_id);
+            CREATE INDEX IF NOT EXISTS orders_store_purchased ON orders (store, purchased);
+            CREATE INDEX IF NOT EXISTS orders_purchased ON orders (purchased);
+            CREATE TABLE IF NOT EXISTS items (
+                account TEXT NOT NULL, store TEXT NOT NULL, order_id TEXT NOT NULL, position INTEGER NOT NULL,
+                name TEXT, name_key TEXT NOT NULL, unit_price REAL, quantity INTEGER, item_page TEXT,
+                PRIMARY KEY (account, store, order_id, position));
+            CREATE INDEX IF NOT EXISTS items_name_key ON items (name_key);
+        """)
+        self._db.commit()
+
+    def __enter__(self) -> "OrderStore":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _query_orders(self, where: str, params: list) -> typing.List[Order]:
+        """
+        The orders matching a where clause of _where with the orders. prefix, with every cart loaded in one query
+        """
+        carts: typing.Dict[tuple, typing.List[Item]] = {}
+        for account, store, order_id, name, unit_price, quantity, item_page in self._db.execute(
+                "SELECT items.account, items.store, items.order_id, items.name, items.unit_price, items.quantity, "
+                "items.item_page FROM items JOIN orders ON items.account = orders.account AND "
+                f"items.store = orders.store AND items.order_id = orders.order_id{where} ORDER BY items.position",
+                params):
+            carts.setdefault((account, store, order_id), []).append(
+                Item(name, unit_price, quantity, order_id, item_page))
+        rows = self._db.execute("SELECT account, order_id, store, purchased, utc_offset, tracking, shipped, "
+                                f"discount FROM orders{where} ORDER BY purchased, store, order_id", params)
+        return [Order(order_id, _from_timestamp(purchased, utc_offset), Stores[store],
+                      carts.get((account, store, order_id)), tracking=tracking,
+                      shipped=bool(shipped) if shipped is not None else None, discount=discount or 0.0)
+                for account, order_id, store, purchased, utc_offset, tracking, shipped, discount in rows]
+
+    def _write(self, account: str, order: Order):
+        purchased, utc_offset = _to_timestamp(order.purchased)
+        self._db.execute("INSERT OR REPLACE INTO orders VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                         (account, order.store.name, order.id, purchased, utc_offset, order.tracking,
+                          order.shipped, order.discount, _now()))
+        self._db.execute("DELETE FROM items WHERE account = ? AND store = ? AND order_id = ?",
+                         (account, order.store.name, order.id))
+        self._db.executemany("INSERT INTO items VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                             [(account, order.store.name, order.id, position, item.name,
+                               _normalize_item_name(item.name), item.unit_price, item.quantity, item.item_page)
+                              for position, item in enumerate(order.cart)])
+
+    @staticmethod
+    def _has_id(order: Order) -> bool:
+        if order.id is None:
+            logger.log(logging.WARNING, f"Skipping {order.store} order without an id")
+            return False
+        return True
+
+    def upsert(self, order: Order, account: str = None) -> typing.Optional[OrderEvent]:
+        """
+        Save the order, merging it into the stored order with the same id
+
+        Returns
+        -------
+        NEW when the order wasn't stored yet, otherwise UPDATED. None when it has no id and was skipped
+        """
+        return self.upsert_many([order], account)[0]
+
+    def upsert_many(self, orders: typing.Iterable[Order], account: str = None) -> \
+            typing.List[typing.Optional[OrderEvent]]:
+        """
+        Same as upsert in a single transaction
+        """
+        account = account or ""
+        events = []
+        with self._lock, self._db:
+            for order in orders:
+                if not self._has_id(order):
+                    events.append(None)
+                    continue
+                stored = self._query_orders(*self._where(order.store, account, order_id=order.id,
+                                                         prefix="orders."))
+                if not stored:
+                    self._write(account, order)
+                    events.append(OrderEvent.NEW)
+                    continue
+                stored[0] += order
+                self._write(account, stored[0])
+                events.append(OrderEvent.UPDATED)
+        return events
+
+    def replace(self, orders: typing.Iterable[Order], account: str = None) -> int:
+        """
+        Save the orders as they are, overwriting the stored orders with the same id
+
+        Returns
+        -------
+        How many orders were saved, orders without an id are skipped
+        """
+        account = account or ""
+        count = 0
+        with self._lock, self._db:
+            for order in orders:
+                if not self._has_id(order):
+                    continue
+                self._write(account, order)
+                count += 1
+        return count
+
+    def get(self, order_id: str, store: Stores = None, account: str = None) -> typing.Optional[Order]:
+        """
+        The stored order with the id, from any store unless one is given
+        """
+        orders = self.orders(store=store, account=account, order_id=order_id)
+        return orders[0] if orders else None
+
+    @staticmethod
+    def _where(store: Stores = None, account: str = None, date_from: datetime.datetime = None,
+               date_to: datetime.datetime = None, order_id: str = None, prefix: str = "") -> \
+            typing.Tuple[str, list]:
+        query = " WHERE 1 = 1"
+        params = []
+        if account is not None:
+            query += f" AND {prefix}account = ?"
+            params.append(account)
+        if store is not None:
+            query += f" AND {prefix}store = ?"
+            params.append(store.name)
+        if order_id is not None:
+            query += f" AND {prefix}order_id = ?"
+            params.append(order_id)
+        if date_from is not None:
+            query += f" AND {prefix}purchased >= ?"
+            params.append(_to_timestamp(date_from)[0])
+        if date_to is not None:
+            query += f" AND {prefix}purchased < ?"
+            params.append(_to_timestamp(date_to)[0])
+        return query, params
+
+    def orders(self, store: Stores = None, date_from: datetime.datetime = None, date_to: datetime.datetime = None,
+               account: str = None, order_id: str = None) -> typing.List[Order]:
+        """
+        Stored orders purchased from date_from up to, not including, date_to, oldest first. Naive dates are
+        compared as UTC
+        """
+        where, params = self._where(store, account, date_from, date_to, order_id, prefix="orders.")
+        with self._lock:
+            return self._query_orders(where, params)
+
+    def items_named(self, name: str, store: Stores = None, account: str = None) -> typing.List[Item]:
+        """
+        Every stored item with the name, ignoring case and whitespace
+        """
+        where, params = self._where(store, account)
+        with self._lock:
+            rows = self._db.execute(f"SELECT name, unit_price, quantity, order_id, item_page FROM items{where} "
+                                    "AND name_key = ?", params + [_normalize_item_name(name)]).fetchall()
+        return [Item(*row) for row in rows]
+
+    def item_totals(self, store: Stores = None, date_from: datetime.datetime = None,
+                    date_to: datetime.datetime = None, account: str = None) -> typing.List[ItemTotal]:
+        """
+        Quantity bought and money spent per item name and store, most spent first
+        """
+        where, params = self._where(store, account, date_from, date_to, prefix="orders.")
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT MIN(items.name), items.store, SUM(items.quantity), SUM(items.unit_price * items.quantity), "
+                "COUNT(DISTINCT items.order_id) FROM items JOIN orders ON items.account = orders.account AND "
+                f"items.store = orders.store AND items.order_id = orders.order_id{where} "
+                "GROUP BY items.name_key, items.store ORDER BY 4 DESC", params).fetchall()
+        return [ItemTotal(name, Stores[store], quantity or 0, round(spent or 0.0, 2), orders)
+                for name, store, quantity, spent, orders in rows]
+
+    def store_totals(self, date_from: datetime.datetime = None, date_to: datetime.datetime = None,
+                     account: str = None) -> typing.Dict[Stores, typing.Tuple[int, float]]:
+        """
+        Returns
+        -------
+        Number of orders and money spent after discounts per store
+        """
+        where, params = self._where(None, account, date_from, date_to, prefix="orders.")
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT orders.store, COUNT(*), SUM(COALESCE((SELECT SUM(items.unit_price * items.quantity) "
+                "FROM items WHERE items.account = orders.account AND items.store = orders.store AND "
+                f"items.order_id = orders.order_id), 0) - COALESCE(orders.discount, 0)) FROM orders{where} "
+                "GROUP BY orders.store", params).fetchall()
+        return {Stores[store]: (count, round(spent or 0.0, 2)) for store, count, spent in rows}
+
+    def delete(self, order_id: str, store: Stores, account: str = None):
+        with self._lock, self._db:
+            for table in ("orders", "items"):
+                self._db.execute(f"DELETE FROM {table} WHERE account = ? AND store = ? AND order_id = ?",
+                                 (account or "", store.name, order_id))
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM orders").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def _now() -> float:
+    return datetime.datetime.now().timestamp()
@@ -0,0 +1,62 @@
+import collections
+import email
+import os
+import typing
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from email_scrapper.models import Order
+
+
+def parse_raw_email(processor: typing.Callable, raw_email: bytes) -> typing.Optional[Order]:
+    """
+    Worker side of :class:`ParserPool`. Runs in a child process, so processor must be picklable
+    """
+    return processor(email.message_from_bytes(raw_email))
+
+
+class ParserPool:
+    """
+    Runs store parsers in worker processes while the reader keeps downloading, with at most ``max_pending``
+    emails in flight
+    """
+
+    def __init__(self, processes: int = None, max_pending: int = None):
+        self.processes = processes or os.cpu_count() or 1
+        self.max_pending = max_pending or self.processes * 4
+        self._executor: typing.Optional[ProcessPoolExecutor] = None
+
+    def __enter__(self) -> "ParserPool":
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
+    def start(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.processes)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def submit(self, processor: typing.Callable, raw_email: bytes) -> "Future[typing.Optional[Order]]":
+        self.start()
+        return self._executor.submit(parse_raw_email, processor, raw_email)
+
+    def imap(self, processor: typing.Callable, raw_emails: typing.Iterable[typing.Tuple[str, bytes]]) -> \
+            typing.Iterator[typing.Tuple[str, typing.Callable[[], typing.Optional[Order]]]]:
+        """
+        Submit every (key, raw email) to the pool, yielding in input order the key and a callable returning
+        the parsed order. Calling it re-raises whatever the parser raised.
+        """
+        pending = collections.deque()
+        for key, raw_email in raw_emails:
+            pending.append((key, self.submit(processor, raw_email)))
+            if len(pending) >= self.max_pending:
+                key, future = pending.popleft()
+                yield key, future.result
+        while pending:
+            key, future = pending.popleft()
+            yield key, future.result
@@ -1,3 +1,7 @@
 from .base_reader import BaseReader
 from .gmail_reader import GmailReader
 from .smtp_reader import SmtpReader
+from .async_base_reader import AsyncBaseReader
+from .executor_gmail_reader import ExecutorGmailReader
+from .async_smtp_reader import AsyncSmtpReader
+from .local_archive_reader import LocalArchiveReader
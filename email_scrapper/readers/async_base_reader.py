@@ -0,0 +1,321 @@
+import asyncio
+import collections
+import functools
+import logging
+import typing
+from concurrent.futures import ThreadPoolExecutor
+from email.message import Message
+
+from email_scrapper import utils
+from email_scrapper.metrics import Stage
+from email_scrapper.models import Stores, Order, OrderEvent
+from email_scrapper.readers.base_reader import ReaderCore
+
+logger = logging.getLogger(__name__)
+
+
+async def _memo_hit(order: typing.Optional[Order]) -> typing.Optional[Order]:
+    return order
+
+
+class AsyncBaseReader(ReaderCore):
+    """
+    asyncio counterpart of :class:`BaseReader`, subclasses implement coroutine versions of its hooks. Emails are
+    decoded and parsed in a pool of ``workers`` threads, or in the process pool
+    """
+    _parse_executor: typing.Optional[ThreadPoolExecutor] = None
+
+    async def search_store_emails(self, store: Stores, subject: str = None) -> typing.List[str]:
+        raise NotImplementedError
+
+    def fetch_store_emails(self, store: Stores, keys: typing.List[str]) -> \
+            typing.AsyncIterator[typing.Tuple[str, bytes]]:
+        raise NotImplementedError
+
+    async def search_combined_emails(self, stores: typing.List[Stores]) -> typing.List[str]:
+        raise NotImplementedError
+
+    def fetch_store_headers(self, store: Stores, keys: typing.List[str]) -> \
+            typing.AsyncIterator[typing.Tuple[str, Message]]:
+        raise NotImplementedError
+
+    async def read_store_emails(self, store: Stores, subject: str = None) -> typing.AsyncIterator[Message]:
+        async for raw_email in self.read_raw_store_emails(store, subject):
+            yield utils.message_from_bytes(raw_email)
+
+    async def read_raw_store_emails(self, store: Stores, subject: str = None) -> typing.AsyncIterator[bytes]:
+        async for key, raw_email in self.fetch_store_emails(store, await self.search_store_emails(store, subject)):
+            yield raw_email
+
+    async def _finish(self):
+        raise NotImplementedError
+
+    async def _login(self):
+        raise NotImplementedError
+
+    async def run(self) -> typing.List[Order]:
+        """
+        Scrape every store, up to ``workers`` of them at once. The returned orders are in the same order as
+        :meth:`BaseReader.run`
+        """
+        await self._login()
+        return_data = []
+        stores = [store for store in Stores]
+        semaphore = asyncio.Semaphore(self.workers)
+
+        async def get_store(store: Stores) -> typing.Optional[typing.List[Order]]:
+            async with semaphore:
+                return await self._get_store(store)
+
+        self._start_pipeline()
+        try:
+            if self.combined_search:
+                await self._route_combined_emails([store for store in stores if store in self._store_mapping])
+            results = await asyncio.gather(*(get_store(store) for store in stores))
+        finally:
+            await self._stop_pipeline()
+        for store_data in results:
+            if store_data:
+                return_data.extend(store_data)
+        return return_data
+
+    async def iter_orders(self, updates: bool = True) -> typing.AsyncIterator[typing.Tuple[OrderEvent, Order]]:
+        """
+        Same as :meth:`BaseReader.iter_orders`, used with ``async for event, order in reader.iter_orders()``
+        """
+        stores = [store for store in Stores if store in self._store_processors]
+        await self._login()
+        self._start_pipeline()
+        try:
+            if self.combined_search:
+                await self._route_combined_emails(stores)
+            if self.workers > 1:
+                async for event in self._iter_concurrent_store_events(stores, updates):
+                    yield event
+            else:
+                for store in stores:
+                    async for event in self._iter_store_events(store, updates):
+                        yield event
+                    self._commit_checkpoint(store)
+        finally:
+            await self._stop_pipeline()
+
+    async def _get_store(self, store: Stores) -> typing.Optional[typing.List[Order]]:
+        func = self._store_mapping.get(store)
+        if func:
+            return await func()
+        else:
+            return None
+
+    def _start_pipeline(self):
+        super(AsyncBaseReader, self)._start_pipeline()
+        self._parse_executor = ThreadPoolExecutor(max_workers=self.workers)
+
+    async def _stop_pipeline(self):
+        self._release_pipeline()
+        if self._parse_executor is not None:
+            self._parse_executor.shutdown(wait=False)
+            self._parse_executor = None
+        await self._finish()
+
+    async def _iter_store_events(self, store: Stores, updates: bool = True) -> \
+            typing.AsyncIterator[typing.Tuple[OrderEvent, Order]]:
+        events = self._iter_store_orders(store, *self._store_processors[store])
+        if updates:
+            async for event in events:
+                yield event
+            return
+        orders: typing.Dict[str, Order] = {}
+        async for event, order in events:
+            orders[order.id] = order
+        for order in orders.values():
+            yield OrderEvent.NEW, order
+
+    async def _iter_concurrent_store_events(self, stores: typing.List[Stores], updates: bool = True) -> \
+            typing.AsyncIterator[typing.Tuple[OrderEvent, Order]]:
+        """
+        Scrape up to ``workers`` stores at once in tasks and yield their events as they arrive. The queue is
+        bounded so the tasks wait for a slow consumer, and they are cancelled once the consumer stops. A store's
+        checkpoint is saved once the consumer has taken all of its events
+        """
+        events = asyncio.Queue(maxsize=self.workers * 16)
+        semaphore = asyncio.Semaphore(self.workers)
+        done = object()
+
+        async def scrape(store: Stores):
+            error = None
+            try:
+                async with semaphore:
+                    async for event in self._iter_store_events(store, updates):
+                        await events.put(event)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                error = e
+            await events.put((done, (store, error)))
+
+        tasks = [asyncio.ensure_future(scrape(store)) for store in stores]
+        try:
+            remaining = len(stores)
+            while remaining:
+                event, order = await events.get()
+                if event is done:
+                    remaining -= 1
+                    store, error = order
+                    if error is not None:
+                        raise error
+                    self._commit_checkpoint(store)
+                    continue
+                yield event, order
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def get_amazon_ca(self) -> typing.List[Order]:
+        return await self._email_processor(Stores.AMAZONCA, *self._store_processors[Stores.AMAZONCA])
+
+    async def get_best_buy(self) -> typing.List[Order]:
+        return await self._email_processor(Stores.BESTBUYCA, *self._store_processors[Stores.BESTBUYCA])
+
+    async def get_ebgames(self) -> typing.List[Order]:
+        return await self._email_processor(Stores.EBGAMES, *self._store_processors[Stores.EBGAMES])
+
+    async def get_lego(self) -> typing.List[Order]:
+        return await self._email_processor(Stores.LEGOCA, *self._store_processors[Stores.LEGOCA])
+
+    async def get_walmart(self) -> typing.List[Order]:
+        return await self._email_processor(Stores.WALMART, *self._store_processors[Stores.WALMART])
+
+    async def _email_processor(self, store: Stores, processor: typing.Callable[[Message], Order],
+                               subject: str = None) -> typing.List[Order]:
+        orders: typing.Dict[str, Order] = {}
+        async for event, order in self._iter_store_orders(store, processor, subject):
+            orders[order.id] = order
+        self._commit_checkpoint(store)
+        self.stores[store] = list(orders.values())
+        return self.stores[store]
+
+    async def _iter_store_orders(self, store: Stores, processor: typing.Callable[[Message], Order],
+                                 subject: str = None) -> typing.AsyncIterator[typing.Tuple[OrderEvent, Order]]:
+        """
+        Same as :meth:`BaseReader._iter_store_orders`
+        """
+        logger.log(logging.INFO, f"Processing {store}")
+        # Left over by a run that failed, only the checkpoint of this run's search may be saved
+        self._discard_checkpoint(store)
+        orders: typing.Dict[str, Order] = {}
+        routed_emails = self._routed_emails.pop(store, None)
+        if routed_emails is not None:
+            keys = [key for key, headers in routed_emails if self._wants_email(store, headers, subject)]
+        else:
+            with self.metrics.timer(store, Stage.SEARCH):
+                keys = await self.search_store_emails(store, subject)
+        cached_orders, keys = self._get_cached_orders(store, keys)
+        for order in cached_orders:
+            yield self._merge_order(store, orders, order), orders[order.id]
+        if self.prefilter and routed_emails is None:
+            with self.metrics.timer(store, Stage.PREFILTER):
+                keys = await self._prefilter(store, keys, subject)
+        raw_emails = self.fetch_store_emails(store, keys)
+        if self.metrics.enabled:
+            raw_emails = self._measure_fetch(store, raw_emails)
+        if self.archive is not None:
+            raw_emails = self._archive_emails(store, raw_emails)
+        async for key, parse in self._iter_parsers(store, processor, raw_emails):
+            timer = self.metrics.timer(store, Stage.PARSE)
+            try:
+                with timer:
+                    new_order = await parse()
+            except Exception as e:
+                self._parse_failed(store, key, timer.seconds, e)
+                continue
+            new_order = self._parsed(store, key, timer.seconds, new_order)
+            if new_order is not None:
+                yield self._merge_order(store, orders, new_order), orders[new_order.id]
+
+    async def _measure_fetch(self, store: typing.Optional[Stores],
+                             raw_emails: typing.AsyncIterator[typing.Tuple[str, bytes]]) -> \
+            typing.AsyncIterator[typing.Tuple[str, bytes]]:
+        iterator = raw_emails.__aiter__()
+        try:
+            while True:
+                with self.metrics.timer(store, Stage.FETCH):
+                    try:
+                        key, raw_email = await iterator.__anext__()
+                    except StopAsyncIteration:
+                        return
+                self.metrics.add_bytes(store, Stage.FETCH, len(raw_email))
+                yield key, raw_email
+        finally:
+            close = getattr(iterator, "aclose", None)
+            if close is not None:
+                await close()
+
+    async def _archive_emails(self, store: Stores, raw_emails: typing.AsyncIterator[typing.Tuple[str, bytes]]) -> \
+            typing.AsyncIterator[typing.Tuple[str, bytes]]:
+        iterator = raw_emails.__aiter__()
+        try:
+            async for key, raw_email in iterator:
+                self._archive_email(store, key, raw_email)
+                yield key, raw_email
+        finally:
+            close = getattr(iterator, "aclose", None)
+            if close is not None:
+                await close()
+
+    async def _prefilter(self, store: Stores, keys: typing.List[str], subject: str = None) -> typing.List[str]:
+        if not self._needs_headers(store, subject):
+            return keys
+        wanted = [key async for key, headers in self.fetch_store_headers(store, keys)
+                  if self._wants_email(store, headers, subject)]
+        logger.log(logging.DEBUG, f"Prefilter kept {len(wanted)} of {len(keys)} {store} emails")
+        return wanted
+
+    async def _route_combined_emails(self, stores: typing.List[Stores]):
+        for folder_stores in self._group_stores_by_folder(stores):
+            addresses = self._get_store_addresses(folder_stores)
+            if not addresses:
+                continue
+            with self.metrics.timer(None, Stage.SEARCH):
+                keys = await self.search_combined_emails([store for store in addresses.values()])
+            with self.metrics.timer(None, Stage.PREFILTER):
+                async for key, headers in self.fetch_store_headers(folder_stores[0], keys):
+                    self._route_email(addresses, key, headers)
+
+    async def _iter_parsers(self, store: Stores, processor: typing.Callable[[Message], Order],
+                            raw_emails: typing.AsyncIterator[typing.Tuple[str, bytes]]) -> \
+            typing.AsyncIterator[typing.Tuple[str, typing.Callable[[], typing.Awaitable[Order]]]]:
+        """
+        Same as :meth:`BaseReader._iter_parsers` but the callables return awaitables. Without a parser pool the
+        emails are decoded and parsed in the reader's thread pool
+        """
+        loop = asyncio.get_event_loop()
+        if self._parser_pool is None:
+            async for key, raw_email in raw_emails:
+                message = await loop.run_in_executor(self._parse_executor, self._decode, store, raw_email)
+                parse = self._get_parser(store, processor, message)
+                yield key, functools.partial(loop.run_in_executor, self._parse_executor, parse)
+            return
+        pending = collections.deque()
+        async for key, raw_email in raw_emails:
+            if self.memo is None:
+                future = self._parser_pool.submit(processor, raw_email)
+                pending.append((key, functools.partial(asyncio.wrap_future, future)))
+            else:
+                message = await loop.run_in_executor(self._parse_executor, self._decode, store, raw_email)
+                hit, order, digest = self._lookup_memo(store, message)
+                if hit:
+                    yield key, functools.partial(_memo_hit, order)
+                    continue
+                future = self._parser_pool.submit(processor, raw_email)
+                pending.append((key, functools.partial(self._await_and_memoize, future, digest)))
+            if len(pending) >= self._parser_pool.max_pending:
+                yield pending.popleft()
+        while pending:
+            yield pending.popleft()
+
+    async def _await_and_memoize(self, future, digest: str) -> typing.Optional[Order]:
+        order = await asyncio.wrap_future(future)
+        self.memo.put(digest, order or None)
+        return order
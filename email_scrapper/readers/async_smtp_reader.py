@@ -0,0 +1,209 @@
+import datetime
+import email
+import logging
+import ssl
+import typing
+
+from email_scrapper import utils
+from email_scrapper.aioimap import AsyncIMAP4, IMAP4Error
+from email_scrapper.imap_pool import AsyncImapPool, AsyncImapSession
+from email_scrapper.archive import MessageArchive
+from email_scrapper.cache import MessageCache
+from email_scrapper.memo import ContentMemo
+from email_scrapper.metrics import Metrics
+from email_scrapper.email_settings import Email
+from email_scrapper.models import Stores
+from email_scrapper.state import StateStore
+from email_scrapper.readers.async_base_reader import AsyncBaseReader
+from email_scrapper.readers.base_reader import body_part_filters
+from email_scrapper.readers.smtp_reader import ImapFolderMixin, build_fetched_email, get_partial_fetch_items, \
+    group_uids_by_parts, iter_fetch_responses, iter_fetched
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncSmtpReader(ImapFolderMixin, AsyncBaseReader):
+
+    def __init__(self, username: str, password: str, settings: Email = Email.GMAIL, email_address: str = None,
+                 locations: typing.Dict[Stores, str] = None,
+                 date_from: datetime.datetime = None, email_mapping=None, fetch_batch_size: int = 100,
+                 pipeline_depth: int = 4, workers: int = 1, processes: int = 0,
+                 cache: MessageCache = None, state_store: StateStore = None, prefilter: bool = False,
+                 combined_search: bool = False, ssl_context: ssl.SSLContext = None, use_ssl: bool = True,
+                 memo: ContentMemo = None, metrics: Metrics = None, archive: MessageArchive = None,
+                 pool: AsyncImapPool = None, partial_fetch: bool = False):
+        """
+
+        :param username: The IMAP username to log in with
+        :param password:  The IMAP password to log in with
+        :param settings:  The IMAP settings. Defaults to GMAIL
+        :param email_address: The email address that will be looked for using the TO header. Defaults to username if
+            not specified
+        :param locations: Optional labels to look under
+        :param date_from: How far back to search emails from. Default to 7 days.
+        :param email_mapping: dict of Stores - store email to query from
+        :param fetch_batch_size: How many UIDs are requested per UID FETCH command
+        :param pipeline_depth: How many UID FETCH commands are sent before waiting on the first one's response
+        :param workers: How many stores are scraped at once. Each worker borrows its own IMAP session
+        :param processes: How many processes parse emails while they are downloaded. 0 parses on the event loop
+        :param cache: Parse results of emails already seen, these are neither downloaded nor parsed again
+        :param state_store: Enables incremental sync, shares its checkpoints with :class:`SmtpReader`
+        :param prefilter: Download the Subject/Date/From/Message-ID headers first and only download the full email
+            when they match what the store's parser looks for
+        :param combined_search: Search every folder once with an OR FROM query for all of the stores in it and
+            route the emails to the stores by their From header
+        :param ssl_context: The SSL context of the connections. Defaults to the system's default context
+        :param use_ssl: Connect without TLS when False, only meant for local servers
+        :param memo: Parse results by content, emails byte identical to one parsed before are not parsed again
+        :param metrics: Where the time spent in every stage of the pipeline is reported
+        :param archive: Every downloaded email is added there, to be parsed again with :class:`LocalArchiveReader`
+        :param pool: Logged in sessions shared with other readers of the same account running on the same event
+            loop. Defaults to a pool of this reader only whose sessions are logged out at the end of every run
+        :param partial_fetch: Same as :class:`SmtpReader`. These fetches are not pipelined
+        """
+        super(AsyncSmtpReader, self).__init__(date_from=date_from, user_email=email_address or username,
+                                              email_mapping=email_mapping, workers=workers, processes=processes,
+                                              cache=cache, state_store=state_store, prefilter=prefilter,
+                                              combined_search=combined_search, memo=memo, metrics=metrics,
+                                              archive=archive)
+        self.username = username
+        self._password = password
+        self.settings = settings
+        self.email_locations = locations or {}
+        self.fetch_batch_size = max(1, fetch_batch_size)
+        self.pipeline_depth = max(1, pipeline_depth)
+        self.ssl_context = ssl_context
+        self.use_ssl = use_ssl
+        self.partial_fetch = partial_fetch
+        self._owns_pool = pool is None
+        self.pool = pool if pool is not None else AsyncImapPool(username, password, settings, use_ssl, ssl_context)
+
+    async def _select(self, session: AsyncImapSession, store: Stores) -> str:
+        """
+        Select the folder the store's emails are in, unless the session has it selected already
+
+        Returns
+        -------
+        The folder's UIDVALIDITY
+        """
+        uid_validity, uid_next = await session.select(self._get_location(store))
+        return uid_validity
+
+    async def search_store_emails(self, store: Stores, subject: str = None) -> typing.List[str]:
+        """
+        Returns
+        -------
+        Keys in the form folder:UIDVALIDITY:UID, the same as :class:`SmtpReader`
+        """
+        location = self._get_location(store)
+        session = await self.pool.acquire()
+        try:
+            # Selected again even when the session has the folder selected, UIDNEXT is only sent by SELECT
+            uid_validity, uid_next = await session.select(location, force=True)
+            last_uid = self._get_last_uid(store, location, uid_validity)
+            result, data = await session.imap.uid('search', None,
+                                                  self._get_search_query(store, subject, after_uid=last_uid))
+        finally:
+            await self.pool.release(session)
+        if result != "OK":
+            raise IMAP4Error(f"UID SEARCH of {store} failed: {data}")
+        return self._get_search_keys(store, location, uid_validity, uid_next, last_uid, data)
+
+    async def search_combined_emails(self, stores: typing.List[Stores]) -> typing.List[str]:
+        location = self._get_location(stores[0])
+        session = await self.pool.acquire()
+        try:
+            uid_validity = await self._select(session, stores[0])
+            result, data = await session.imap.uid('search', None, self._get_combined_search_query(stores))
+        finally:
+            await self.pool.release(session)
+        if result != "OK":
+            raise IMAP4Error(f"UID SEARCH of {stores} failed: {data}")
+        return [f"{location}:{uid_validity}:{uid.decode()}" for uid in data[0].split()]
+
+    async def _fetch_keys(self, store: Stores, keys: typing.List[str], message_parts: str) -> \
+            typing.AsyncIterator[typing.Tuple[str, bytes]]:
+        """
+        UID FETCH the keys in batches of ``fetch_batch_size``, pipelining up to ``pipeline_depth`` batches
+        """
+        if not keys:
+            return
+        uid_keys = {key.rsplit(":", 1)[1]: key for key in keys}
+        commands = (("FETCH", utils.compress_uids(batch), message_parts)
+                    for batch in utils.chunked(list(uid_keys), self.fetch_batch_size))
+        session = await self.pool.acquire()
+        try:
+            await self._select(session, store)
+            responses = session.imap.pipeline(commands, self.pipeline_depth)
+            try:
+                async for result, data in responses:
+                    if result != "OK":
+                        # Raised so the store's checkpoint doesn't move past the emails of the batch
+                        logger.log(logging.ERROR, f"Failed to fetch {store} emails: {data}")
+                        raise IMAP4Error(f"UID FETCH failed: {data}")
+                    for uid, literal in iter_fetched(data):
+                        yield uid_keys.get(uid.decode() if uid else None), literal
+            finally:
+                # Closes the connection when responses are still pending
+                await responses.aclose()
+        finally:
+            await self.pool.release(session)
+
+    async def _uid_fetch(self, mail: AsyncIMAP4, uids: typing.List[bytes], message_parts: str) -> list:
+        result, data = await mail.uid("fetch", utils.compress_uids(uids), message_parts)
+        if result != "OK":
+            logger.log(logging.ERROR, f"Failed to fetch {uids}: {data}")
+            raise IMAP4Error(f"UID FETCH failed: {data}")
+        return data
+
+    async def _fetch_partial_uids(self, mail: AsyncIMAP4, store: Stores, uids: typing.List[bytes]) -> \
+            typing.List[typing.Tuple[bytes, bytes]]:
+        """
+        Same as :meth:`SmtpReader._fetch_partial_uids`
+
+        Returns
+        -------
+        (uid, email rebuilt from the fetched parts) in the order of uids
+        """
+        responses = iter_fetch_responses(await self._uid_fetch(mail, uids, "(BODYSTRUCTURE)"))
+        emails: typing.Dict[bytes, bytes] = {}
+        for parts, part_uids in group_uids_by_parts(store, responses).items():
+            if parts is None:
+                emails.update(iter_fetched(await self._uid_fetch(mail, part_uids, "(RFC822)")))
+                continue
+            data = await self._uid_fetch(mail, part_uids, get_partial_fetch_items(parts))
+            for uid, response, literals in iter_fetch_responses(data):
+                emails[uid] = build_fetched_email(parts, literals)
+        return [(uid, emails[uid]) for uid in uids if uid in emails]
+
+    async def fetch_store_headers(self, store: Stores, keys: typing.List[str]) -> \
+            typing.AsyncIterator[typing.Tuple[str, email.message.Message]]:
+        message_parts = f"(BODY.PEEK[HEADER.FIELDS ({' '.join(self.PREFILTER_HEADERS).upper()})])"
+        async for key, raw_headers in self._fetch_keys(store, keys, message_parts):
+            yield key, email.message_from_bytes(raw_headers)
+
+    async def fetch_store_emails(self, store: Stores, keys: typing.List[str]) -> \
+            typing.AsyncIterator[typing.Tuple[str, bytes]]:
+        if not self.partial_fetch or store not in body_part_filters:
+            async for key, raw_email in self._fetch_keys(store, keys, "(RFC822)"):
+                yield key, raw_email
+            return
+        if not keys:
+            return
+        uid_keys = {key.rsplit(":", 1)[1]: key for key in keys}
+        session = await self.pool.acquire()
+        try:
+            await self._select(session, store)
+            for batch in utils.chunked([uid.encode() for uid in uid_keys], self.fetch_batch_size):
+                for uid, raw_email in await self._fetch_partial_uids(session.imap, store, batch):
+                    yield uid_keys.get(uid.decode()), raw_email
+        finally:
+            await self.pool.release(session)
+
+    async def _finish(self):
+        if self._owns_pool:
+            await self.pool.close()
+
+    async def _login(self):
+        # Connects the first session unless the pool has an idle one, so a bad login fails before any store
+        await self.pool.release(await self.pool.acquire())
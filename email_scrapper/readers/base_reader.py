@@ -1,19 +1,63 @@
+import collections
 import datetime
+import functools
 import logging
+import queue
+import threading
 import typing
+from concurrent.futures import ThreadPoolExecutor
+from email.message import Message
+from email.utils import parseaddr
 
-from email_scrapper import utils
-from email_scrapper.models import Stores, Order
-from email_scrapper.stores import lego, ebgames, walmart, amazon
+from email_scrapper import bodystructure, utils
+from email_scrapper.archive import MessageArchive
+from email_scrapper.cache import MessageCache
+from email_scrapper.memo import ContentMemo, apply_email_fields, content_digest
+from email_scrapper.metrics import Metrics, Stage
+from email_scrapper.models import Stores, Order, OrderEvent
+from email_scrapper.pipeline import ParserPool
+from email_scrapper.state import StateStore
+from email_scrapper.stores import lego, ebgames, walmart, amazon, bestbuy
 from email_scrapper.stores.bestbuy import BestBuyReader
 
 logger = logging.getLogger(__name__)
 
+# Predicates on the PREFILTER_HEADERS of a store's emails, a store only has one when its parser rejects every email
+# the predicate does. Lego's parser also takes emails with "Order Confirmation" only in the body
+header_filters: typing.Dict[Stores, typing.Callable[[Message], bool]] = {}
 
-class BaseReader:
+# The body parts every store's parser reads, the others are left out when fetching partial emails
+body_part_filters: \
+    typing.Dict[Stores, typing.Callable[[bodystructure.BodyPart], typing.List[bodystructure.BodyPart]]] = {
+    Stores.AMAZONCA: bodystructure.html_parts,
+    Stores.BESTBUYCA: bodystructure.pdf_parts,
+    Stores.EBGAMES: bodystructure.html_parts,
+    Stores.LEGOCA: bodystructure.html_parts,
+    Stores.WALMART: bodystructure.html_parts
+}
+
+parser_versions = {
+    Stores.AMAZONCA: amazon.PARSER_VERSION,
+    Stores.BESTBUYCA: bestbuy.PARSER_VERSION,
+    Stores.EBGAMES: ebgames.PARSER_VERSION,
+    Stores.LEGOCA: lego.PARSER_VERSION,
+    Stores.WALMART: walmart.PARSER_VERSION
+}
+
+
+class ReaderCore:
+    """
+    What :class:`BaseReader` and :class:`AsyncBaseReader` share: the configuration, the search queries, the
+    checkpoints, and what is done with every email between downloading it and merging its order. The two only
+    differ in how they wait on searching, downloading and parsing
+    """
+    PREFILTER_HEADERS = ("Subject", "Date", "From", "Message-ID")
 
     def __init__(self, user_email: str = None, date_from: datetime.datetime = None,
-                 email_mapping: typing.Dict[Stores, str] = None):
+                 email_mapping: typing.Dict[Stores, str] = None, workers: int = 1, processes: int = 0,
+                 cache: MessageCache = None, state_store: StateStore = None, prefilter: bool = False,
+                 combined_search: bool = False, memo: ContentMemo = None, metrics: Metrics = None,
+                 archive: MessageArchive = None):
         self.stores: typing.Dict[Stores, typing.List[Order]] = {}
         self.email = user_email
         if date_from:
@@ -27,13 +71,257 @@ class BaseReader:
             Stores.LEGOCA: self.get_lego,
             Stores.WALMART: self.get_walmart
         }
-        self._orders: typing.Dict[str, Order] = {}
+        self._store_processors: \
+            typing.Dict[Stores, typing.Tuple[typing.Callable[[Message], Order], typing.Optional[str]]] = {
+            Stores.AMAZONCA: (amazon.get_data, None),
+            Stores.BESTBUYCA: (BestBuyReader().save_attachment, "ship"),
+            Stores.EBGAMES: (ebgames.parse_ebgames_email, None),
+            Stores.LEGOCA: (lego.parse_lego_email, None),
+            Stores.WALMART: (walmart.parse_walmart_email, "shipped")
+        }
         self._email_mapping = email_mapping or {}
+        self.workers = max(1, workers)
+        self.processes = processes
+        self._parser_pool: typing.Optional[ParserPool] = None
+        self.cache = cache
+        self.memo = memo
+        self.metrics = metrics or Metrics()
+        self.archive = archive
+        self.state_store = state_store
+        self._pending_checkpoints: typing.Dict[Stores, dict] = {}
+        self.prefilter = prefilter
+        self.combined_search = combined_search
+        self._routed_emails: typing.Dict[Stores, typing.List[typing.Tuple[str, Message]]] = {}
 
     def _get_search_date_range(self):
         return self.search_date_range.strftime(
             "%d-%b-%Y")
 
+    def _get_user_email(self) -> str:
+        return self.email
+
+    def _get_search_query(self, store: Stores, subject: str = None, after_uid: int = None):
+        email_address = self._get_store_email(store)
+        if subject:
+            subject = f"SUBJECT {subject}"
+        search_query_list = [
+            f"FROM '{email_address}'",
+            subject,
+            f"UID {after_uid + 1}:*" if after_uid is not None else f"SINCE {self._get_search_date_range()}",
+            f"TO {self._get_user_email()}"
+        ]
+        search_query = f"({' '.join(q for q in search_query_list if q)})"
+        return search_query
+
+    def _get_combined_search_query(self, stores: typing.List[Stores]):
+        senders = [f"FROM '{self._get_store_email(store)}'" for store in stores]
+        search_query_list = [
+            "OR " * (len(senders) - 1) + " ".join(senders),
+            f"SINCE {self._get_search_date_range()}",
+            f"TO {self._get_user_email()}"
+        ]
+        return f"({' '.join(search_query_list)})"
+
+    def _get_store_email(self, store: Stores) -> str:
+        """
+
+        Parameters
+        ----------
+        store :class:Stores
+
+        Returns
+        -------
+        the email of the store that the reader will filter by
+
+        """
+        if self._email_mapping:
+            email = self._email_mapping.get(store)
+            if email:
+                return email
+        else:
+            return utils.get_store_email(store).value
+
+    def _group_stores_by_folder(self, stores: typing.List[Stores]) -> typing.List[typing.List[Stores]]:
+        return [stores]
+
+    @staticmethod
+    def _save_order(orders: typing.Dict[str, Order], order: Order) -> OrderEvent:
+        if order.id in orders:
+            _order = orders.get(order.id)
+            _order += order
+            return OrderEvent.UPDATED
+        orders[order.id] = order
+        return OrderEvent.NEW
+
+    def _merge_order(self, store: Stores, orders: typing.Dict[str, Order], order: Order) -> OrderEvent:
+        with self.metrics.timer(store, Stage.MERGE):
+            return self._save_order(orders, order)
+
+    def _start_pipeline(self):
+        if self.processes:
+            self._parser_pool = ParserPool(self.processes)
+        if self.cache is not None:
+            self.cache.evict()
+        if self.memo is not None:
+            self.memo.evict()
+
+    def _release_pipeline(self):
+        if self._parser_pool is not None:
+            self._parser_pool.shutdown()
+            self._parser_pool = None
+        self._routed_emails.clear()
+
+    def _get_checkpoint_key(self, store: Stores) -> str:
+        return f"{self.__class__.__name__}:{self._get_user_email()}:{store.name}"
+
+    def _get_checkpoint(self, store: Stores) -> typing.Optional[dict]:
+        if self.state_store is None:
+            return None
+        return self.state_store.get(self._get_checkpoint_key(store))
+
+    def _set_pending_checkpoint(self, store: Stores, checkpoint: dict):
+        """
+        Remember where the current search of a store ended. It is only saved once all of the store's emails
+        have been processed
+        """
+        if self.state_store is not None:
+            self._pending_checkpoints[store] = checkpoint
+
+    def _commit_checkpoint(self, store: Stores):
+        checkpoint = self._pending_checkpoints.pop(store, None)
+        if checkpoint is not None and self.state_store is not None:
+            self.state_store.set(self._get_checkpoint_key(store), checkpoint)
+
+    def _discard_checkpoint(self, store: Stores):
+        self._pending_checkpoints.pop(store, None)
+
+    def _get_cached_orders(self, store: Stores, keys: typing.List[str]) -> \
+            typing.Tuple[typing.List[Order], typing.List[str]]:
+        """
+        Returns
+        -------
+        The cached orders of the keys, and the keys whose emails still have to be parsed
+        """
+        if self.cache is None:
+            return [], keys
+        cached = self.cache.get_many(self.email, store, keys, parser_versions.get(store, 0))
+        return [order for order in cached.values() if order], [key for key in keys if key not in cached]
+
+    def _needs_headers(self, store: Stores, subject: str = None) -> bool:
+        """
+        Whether prefiltering the store's emails has anything to check in their headers
+        """
+        return store in header_filters or bool(subject)
+
+    def _wants_email(self, store: Stores, headers: Message, subject: str = None) -> bool:
+        """
+        Whether the email's subject contains subject and, when prefiltering, it passes the store's header filter
+        """
+        if subject and subject.lower() not in utils.get_header(headers, "Subject").lower():
+            return False
+        store_filter = header_filters.get(store)
+        if self.prefilter and store_filter is not None and not store_filter(headers):
+            return False
+        return True
+
+    def _get_store_addresses(self, stores: typing.List[Stores]) -> typing.Dict[str, Stores]:
+        """
+        Start routing the emails of the stores of a folder
+
+        Returns
+        -------
+        The stores by their lowercased email address
+        """
+        addresses = {}
+        for store in stores:
+            self._routed_emails[store] = []
+            store_email = self._get_store_email(store)
+            if store_email:
+                addresses[store_email.lower()] = store
+        return addresses
+
+    def _route_email(self, addresses: typing.Dict[str, Stores], key: str, headers: Message):
+        sender = parseaddr(utils.get_header(headers, "From"))[1].lower()
+        store = addresses.get(sender)
+        if store is not None:
+            self._routed_emails[store].append((key, headers))
+
+    def _archive_email(self, store: Stores, key: typing.Optional[str], raw_email: bytes):
+        if key is None:
+            return
+        try:
+            self.archive.put(self.email, store, key, raw_email)
+        except Exception as e:
+            logger.log(logging.ERROR, f"Could not archive {store} email {key}: {e}")
+
+    def _decode(self, store: Stores, raw_email: bytes) -> Message:
+        with self.metrics.timer(store, Stage.DECODE):
+            return utils.message_from_bytes(raw_email)
+
+    def _get_parser(self, store: Stores, processor: typing.Callable[[Message], Order], message: Message) -> \
+            typing.Callable[[], typing.Optional[Order]]:
+        """
+        Returns
+        -------
+        A callable parsing the message, or returning the memo's result for its content
+        """
+        parse = functools.partial(processor, message)
+        if self.memo is not None:
+            parse = self._memoize(store, message, parse)
+        return parse
+
+    def _lookup_memo(self, store: Stores, message: Message) -> typing.Tuple[bool, typing.Optional[Order], str]:
+        """
+        Returns
+        -------
+        Whether the memo has a result for the message's content, that result and the content's digest
+        """
+        digest = content_digest(store, parser_versions.get(store, 0), message)
+        hit, order = self.memo.get(digest)
+        if hit and not apply_email_fields(store, message, order):
+            return False, None, digest
+        return hit, order, digest
+
+    def _memoize(self, store: Stores, message: Message, parse: typing.Callable) -> typing.Callable:
+        """
+        Returns
+        -------
+        A callable returning the memo's result for the message's content, or parse wrapped to save its result
+        """
+        hit, order, digest = self._lookup_memo(store, message)
+        if hit:
+            return functools.partial(_memo_hit, order)
+        return functools.partial(self._parse_and_memoize, parse, digest)
+
+    def _parse_and_memoize(self, parse: typing.Callable[[], Order], digest: str) -> typing.Optional[Order]:
+        order = parse()
+        self.memo.put(digest, order or None)
+        return order
+
+    def _parse_failed(self, store: Stores, key: typing.Optional[str], seconds: float, error: Exception):
+        # The parsers raise TypeError on the store's emails that aren't orders, e.g. its promotions
+        logger.log(logging.DEBUG if isinstance(error, TypeError) else logging.ERROR, error)
+        self.metrics.add_parse_result(store, key, seconds, error=error)
+
+    def _parsed(self, store: Stores, key: typing.Optional[str], seconds: float, order: typing.Optional[Order]) -> \
+            typing.Optional[Order]:
+        """
+        Count and cache the result of parsing an email
+
+        Returns
+        -------
+        The order, None when the email was not an order or its order has no items
+        """
+        self.metrics.add_parse_result(store, key, seconds, order)
+        if not order:  # None, or an order without any items
+            order = None
+        if self.cache is not None and key is not None:
+            self.cache.put(self.email, store, key, parser_versions.get(store, 0), order)
+        return order
+
+
+class BaseReader(ReaderCore):
+
     def _get_store(self, store: Stores) -> typing.Optional[typing.List[Order]]:
         func = self._store_mapping.get(store)
         if func:
@@ -41,15 +329,56 @@ class BaseReader:
         else:
             return None
 
-    def read_store_emails(self, store: Stores, subject: str = None) -> typing.Iterable[str]:
-        raise NotImplemented
+    def search_store_emails(self, store: Stores, subject: str = None) -> typing.List[str]:
+        """
+        Returns
+        -------
+        The keys of the store's emails. A key must identify the same email across runs
+        """
+        raise NotImplementedError
 
-    def _save_order(self, order: Order):
-        if order.id in self._orders:
-            _order = self._orders.get(order.id)
-            _order += order
-        else:
-            self._orders[order.id] = order
+    def fetch_store_emails(self, store: Stores, keys: typing.List[str]) -> \
+            typing.Iterator[typing.Tuple[str, bytes]]:
+        """
+        Download the given emails
+
+        Yields
+        -------
+        (key, raw RFC822 bytes)
+        """
+        raise NotImplementedError
+
+    def search_combined_emails(self, stores: typing.List[Stores]) -> typing.List[str]:
+        """
+        One search matching the emails of every given store. The stores are always in the same folder
+
+        Returns
+        -------
+        The keys of the matching emails
+        """
+        raise NotImplementedError
+
+    def fetch_store_headers(self, store: Stores, keys: typing.List[str]) -> \
+            typing.Iterator[typing.Tuple[str, Message]]:
+        """
+        Download only the PREFILTER_HEADERS of the given emails
+
+        Yields
+        -------
+        (key, Message holding just those headers)
+        """
+        raise NotImplementedError
+
+    def read_store_emails(self, store: Stores, subject: str = None) -> typing.Iterable[Message]:
+        for raw_email in self.read_raw_store_emails(store, subject):
+            yield utils.message_from_bytes(raw_email)
+
+    def read_raw_store_emails(self, store: Stores, subject: str = None) -> typing.Iterable[bytes]:
+        """
+        Same as read_store_emails but yields the undecoded RFC822 bytes
+        """
+        for key, raw_email in self.fetch_store_emails(store, self.search_store_emails(store, subject)):
+            yield raw_email
 
     def _finish(self):
         raise NotImplemented
@@ -58,80 +387,293 @@ class BaseReader:
         raise NotImplementedError
 
     def run(self) -> typing.List[Order]:
+        """
+        Scrape every store. When the reader was created with more than one worker the stores are
+        scraped in parallel threads, the returned orders are in the same order as a sequential run.
+        When processes is set the store parsers run in a process pool while emails are being downloaded.
+        With combined_search every folder is searched once for all stores instead of once per store, this
+        ignores the incremental sync checkpoints.
+        """
         self._login()
         return_data = []
         stores = [store for store in Stores]
-        for store in stores:
-            store_data = self._get_store_email(store)
+        self._start_pipeline()
+        try:
+            if self.combined_search:
+                self._route_combined_emails([store for store in stores if store in self._store_mapping])
+            if self.workers > 1:
+                with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                    results = list(executor.map(self._get_store, stores))
+            else:
+                results = [self._get_store(store) for store in stores]
+        finally:
+            self._stop_pipeline()
+        for store_data in results:
             if store_data:
                 return_data.extend(store_data)
-        self._finish()
         return return_data
 
-    def _get_user_email(self) -> str:
-        return self.email
+    def iter_orders(self, updates: bool = True) -> typing.Iterator[typing.Tuple[OrderEvent, Order]]:
+        """
+        Scrape every store like run, but yield the orders as soon as their emails are parsed instead of
+        returning them once every store is done. The orders are not kept in the stores attribute.
+
+        Parameters
+        ----------
+        updates : When an email adds to an order that was already yielded, the merged order is yielded again
+            as an UPDATED event. When False the orders are held back until their store is finished and every
+            order is yielded once as NEW
+
+        Yields
+        -------
+        (OrderEvent, Order). With more than one worker the events of different stores are interleaved. A store's
+        incremental sync checkpoint is saved once all of its events have been taken, so a consumer stopping early
+        gets the orders it missed again on the next run
+        """
+        stores = [store for store in Stores if store in self._store_processors]
+        self._login()
+        self._start_pipeline()
+        try:
+            if self.combined_search:
+                self._route_combined_emails(stores)
+            if self.workers > 1:
+                yield from self._iter_threaded_store_events(stores, updates)
+            else:
+                for store in stores:
+                    yield from self._iter_store_events(store, updates)
+                    # Only reached once the consumer asked for the event after the store's last one
+                    self._commit_checkpoint(store)
+        finally:
+            self._stop_pipeline()
+
+    def _stop_pipeline(self):
+        self._release_pipeline()
+        self._finish()
+
+    def _iter_store_events(self, store: Stores, updates: bool = True) -> \
+            typing.Iterator[typing.Tuple[OrderEvent, Order]]:
+        events = self._iter_store_orders(store, *self._store_processors[store])
+        if updates:
+            yield from events
+            return
+        orders: typing.Dict[str, Order] = {}
+        for event, order in events:
+            orders[order.id] = order
+        for order in orders.values():
+            yield OrderEvent.NEW, order
+
+    def _iter_threaded_store_events(self, stores: typing.List[Stores], updates: bool = True) -> \
+            typing.Iterator[typing.Tuple[OrderEvent, Order]]:
+        """
+        Scrape the stores in worker threads and yield their events as they arrive. The queue is bounded so the
+        workers wait for a slow consumer, and they stop once the consumer closes the generator. A store's
+        checkpoint is saved once the consumer has taken all of its events
+        """
+        events = queue.Queue(maxsize=self.workers * 16)
+        stopped = threading.Event()
+        done = object()
+
+        def put(item) -> bool:
+            while not stopped.is_set():
+                try:
+                    events.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def scrape(store: Stores):
+            error = None
+            try:
+                if stopped.is_set():
+                    return
+                for event in self._iter_store_events(store, updates):
+                    if not put(event):
+                        return
+            except Exception as e:
+                error = e
+            finally:
+                put((done, (store, error)))
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for store in stores:
+                executor.submit(scrape, store)
+            try:
+                remaining = len(stores)
+                while remaining:
+                    event, order = events.get()
+                    if event is done:
+                        remaining -= 1
+                        store, error = order
+                        if error is not None:
+                            raise error
+                        self._commit_checkpoint(store)
+                        continue
+                    yield event, order
+            finally:
+                stopped.set()
 
     def get_amazon_ca(self) -> typing.List[Order]:
-        return self._email_processor(Stores.AMAZONCA, amazon.get_data)
+        return self._email_processor(Stores.AMAZONCA, *self._store_processors[Stores.AMAZONCA])
 
     def get_best_buy(self) -> typing.List[Order]:
-        return self._email_processor(Stores.BESTBUYCA, BestBuyReader().save_attachment, "ship")
+        return self._email_processor(Stores.BESTBUYCA, *self._store_processors[Stores.BESTBUYCA])
 
     def get_ebgames(self) -> typing.List[Order]:
-        return self._email_processor(Stores.EBGAMES, ebgames.parse_ebgames_email)
+        return self._email_processor(Stores.EBGAMES, *self._store_processors[Stores.EBGAMES])
 
     def get_lego(self) -> typing.List[Order]:
-        return self._email_processor(Stores.LEGOCA, lego.parse_lego_email)
+        return self._email_processor(Stores.LEGOCA, *self._store_processors[Stores.LEGOCA])
 
     def get_walmart(self) -> typing.List[Order]:
-        return self._email_processor(Stores.WALMART, walmart.parse_walmart_email, "shipped")
+        return self._email_processor(Stores.WALMART, *self._store_processors[Stores.WALMART])
 
-    def _get_search_query(self, store: Stores, subject: str = None):
-        email_address = self._get_store_email(store)
-        if subject:
-            subject = f"SUBJECT {subject}"
-        search_query_list = [
-            f"FROM '{email_address}'",
-            subject,
-            f"SINCE {self._get_search_date_range()}",
-            f"TO {self._get_user_email()}"
-        ]
-        search_query = f"({' '.join(q for q in search_query_list if q)})"
-        return search_query
+    def _email_processor(self, store: Stores, processor: typing.Callable[[Message], Order], subject: str = None) \
+            -> typing.List[Order]:
+        orders: typing.Dict[str, Order] = {}
+        for event, order in self._iter_store_orders(store, processor, subject):
+            orders[order.id] = order
+        self._commit_checkpoint(store)
+        self.stores[store] = list(orders.values())
+        return self.stores[store]
 
-    def _get_store_email(self, store: Stores) -> str:
+    def _iter_store_orders(self, store: Stores, processor: typing.Callable[[Message], Order],
+                           subject: str = None) -> typing.Iterator[typing.Tuple[OrderEvent, Order]]:
+        """
+        Yields every order of the store as soon as its email is parsed. An email for an order that was already
+        yielded is merged into it and the merged order is yielded again as UPDATED. The caller saves the store's
+        checkpoint with _commit_checkpoint once it has consumed every event, so it is not saved when searching,
+        fetching or the consumer fails
         """
+        logger.log(logging.INFO, f"Processing {store}")
+        # Left over by a run that failed, only the checkpoint of this run's search may be saved
+        self._discard_checkpoint(store)
+        orders: typing.Dict[str, Order] = {}
+        routed_emails = self._routed_emails.pop(store, None)
+        if routed_emails is not None:
+            keys = [key for key, headers in routed_emails if self._wants_email(store, headers, subject)]
+        else:
+            with self.metrics.timer(store, Stage.SEARCH):
+                keys = self.search_store_emails(store, subject)
+        cached_orders, keys = self._get_cached_orders(store, keys)
+        for order in cached_orders:
+            yield self._merge_order(store, orders, order), orders[order.id]
+        if self.prefilter and routed_emails is None:
+            with self.metrics.timer(store, Stage.PREFILTER):
+                keys = self._prefilter(store, keys, subject)
+        raw_emails = self.fetch_store_emails(store, keys)
+        if self.metrics.enabled:
+            raw_emails = self._measure_fetch(store, raw_emails)
+        if self.archive is not None:
+            raw_emails = self._archive_emails(store, raw_emails)
+        for key, parse in self._iter_parsers(store, processor, raw_emails):
+            timer = self.metrics.timer(store, Stage.PARSE)
+            try:
+                with timer:
+                    new_order = parse()
+            except Exception as e:
+                self._parse_failed(store, key, timer.seconds, e)
+                continue
+            new_order = self._parsed(store, key, timer.seconds, new_order)
+            if new_order is not None:
+                yield self._merge_order(store, orders, new_order), orders[new_order.id]
 
-        Parameters
-        ----------
-        store :class:Stores
+    def _measure_fetch(self, store: typing.Optional[Stores], raw_emails: typing.Iterable[typing.Tuple[str, bytes]]) \
+            -> typing.Iterator[typing.Tuple[str, bytes]]:
+        """
+        Time every email taken from raw_emails as a call of the fetch stage and count its bytes
+        """
+        iterator = iter(raw_emails)
+        try:
+            while True:
+                with self.metrics.timer(store, Stage.FETCH):
+                    try:
+                        key, raw_email = next(iterator)
+                    except StopIteration:
+                        return
+                self.metrics.add_bytes(store, Stage.FETCH, len(raw_email))
+                yield key, raw_email
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+
+    def _archive_emails(self, store: Stores, raw_emails: typing.Iterable[typing.Tuple[str, bytes]]) -> \
+            typing.Iterator[typing.Tuple[str, bytes]]:
+        """
+        Add every email taken from raw_emails to the archive before it is parsed
+        """
+        iterator = iter(raw_emails)
+        try:
+            for key, raw_email in iterator:
+                self._archive_email(store, key, raw_email)
+                yield key, raw_email
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
 
+    def _prefilter(self, store: Stores, keys: typing.List[str], subject: str = None) -> typing.List[str]:
+        """
         Returns
         -------
-        the email of the store that the reader will filter by
-
+        The keys of the emails whose headers match the subject and the store's header filter
         """
-        if self._email_mapping:
-            email = self._email_mapping.get(store)
-            if email:
-                return email
-        else:
-            return utils.get_store_email(store).value
+        if not self._needs_headers(store, subject):
+            return keys
+        wanted = [key for key, headers in self.fetch_store_headers(store, keys)
+                  if self._wants_email(store, headers, subject)]
+        logger.log(logging.DEBUG, f"Prefilter kept {len(wanted)} of {len(keys)} {store} emails")
+        return wanted
 
-    def _email_processor(self, store: Stores, processor: typing.Callable[[str], Order], subject: str = None) -> \
-            typing.List[Order]:
-        logger.log(logging.INFO, f"Processing {store}")
-        self._orders.clear()
-        for msg_body in self.read_store_emails(store, subject):
-            try:
-                new_order = processor(msg_body)
-                if len(new_order) > 0:
-                    self._save_order(new_order)
-            except TypeError:
-                continue
-            except Exception as e:
-                logger.log(logging.ERROR, e)
+    def _route_combined_emails(self, stores: typing.List[Stores]):
+        """
+        Search every folder once for all of its stores and hand each email to the store it is from
+        """
+        for folder_stores in self._group_stores_by_folder(stores):
+            addresses = self._get_store_addresses(folder_stores)
+            if not addresses:
                 continue
-        else:
-            self.stores[store] = list(self._orders.values())
-        return self.stores[store]
+            with self.metrics.timer(None, Stage.SEARCH):
+                keys = self.search_combined_emails([store for store in addresses.values()])
+            with self.metrics.timer(None, Stage.PREFILTER):
+                for key, headers in self.fetch_store_headers(folder_stores[0], keys):
+                    self._route_email(addresses, key, headers)
+
+    def _iter_parsers(self, store: Stores, processor: typing.Callable[[Message], Order],
+                      raw_emails: typing.Iterable[typing.Tuple[str, bytes]]) -> \
+            typing.Iterator[typing.Tuple[str, typing.Callable[[], Order]]]:
+        """
+        Yields the key and a callable returning the parsed order of every email, either parsing inline or
+        waiting on the parser pool. With a memo, emails with the same content as one parsed before are not
+        parsed again
+        """
+        if self._parser_pool is None:
+            for key, raw_email in raw_emails:
+                yield key, self._get_parser(store, processor, self._decode(store, raw_email))
+            return
+        if self.memo is None:
+            yield from self._parser_pool.imap(processor, raw_emails)
+            return
+        hits = collections.deque()
+        digests = collections.deque()
+
+        def misses():
+            for key, raw_email in raw_emails:
+                hit, order, digest = self._lookup_memo(store, self._decode(store, raw_email))
+                if hit:
+                    hits.append((key, functools.partial(_memo_hit, order)))
+                else:
+                    digests.append(digest)
+                    yield key, raw_email
+
+        for key, parse in self._parser_pool.imap(processor, misses()):
+            while hits:
+                yield hits.popleft()
+            yield key, functools.partial(self._parse_and_memoize, parse, digests.popleft())
+        while hits:
+            yield hits.popleft()
+
+
+def _memo_hit(order: typing.Optional[Order]) -> typing.Optional[Order]:
+    return order
@@ -0,0 +1,107 @@
+import asyncio
+import collections
+import datetime
+import functools
+import typing
+from concurrent.futures import ThreadPoolExecutor
+from email.message import Message
+
+from email_scrapper import utils
+from email_scrapper.archive import MessageArchive
+from email_scrapper.cache import MessageCache
+from email_scrapper.memo import ContentMemo
+from email_scrapper.metrics import Metrics
+from email_scrapper.models import Stores
+from email_scrapper.state import StateStore
+from email_scrapper.readers.async_base_reader import AsyncBaseReader
+from email_scrapper.readers.gmail_reader import GmailReader
+
+
+def _drain(fetch: typing.Callable[[Stores, typing.List[str]], typing.Iterator], store: Stores,
+           keys: typing.List[str]) -> list:
+    return list(fetch(store, keys))
+
+
+class ExecutorGmailReader(AsyncBaseReader):
+    """
+    :class:`GmailReader` with an asyncio interface. It is not a native async client: the Google API client only
+    has a blocking http transport, so every request holds a thread of a small pool while the event loop waits
+    """
+
+    authenticate_with_browser = classmethod(GmailReader.authenticate_with_browser.__func__)
+
+    def __init__(self, service, user_id: str = "me", user_email: str = None, email_mapping: dict = None,
+                 date_from: datetime.datetime = None, batch_size: int = GmailReader.DEFAULT_BATCH_SIZE,
+                 page_size: int = GmailReader.MAX_PAGE_SIZE, workers: int = 1,
+                 service_factory: typing.Callable = None, processes: int = 0, cache: MessageCache = None,
+                 state_store: StateStore = None, prefilter: bool = False, combined_search: bool = False,
+                 memo: ContentMemo = None, metrics: Metrics = None, archive: MessageArchive = None,
+                 partial_fetch: bool = False):
+        """
+
+        Parameters
+        ----------
+        Same as :class:`GmailReader`. Without a service_factory the service is not shared between threads, so
+        only one request is made at a time
+        """
+        super(ExecutorGmailReader, self).__init__(date_from=date_from, user_email=user_email,
+                                                  email_mapping=email_mapping, workers=workers, processes=processes,
+                                                  cache=cache, state_store=state_store, prefilter=prefilter,
+                                                  combined_search=combined_search, memo=memo,
+                                                  metrics=metrics, archive=archive)
+        self._reader = GmailReader(service, user_id=user_id, user_email=user_email, email_mapping=email_mapping,
+                                   date_from=date_from, batch_size=batch_size, page_size=page_size,
+                                   service_factory=service_factory, state_store=state_store,
+                                   prefilter=prefilter, combined_search=combined_search,
+                                   partial_fetch=partial_fetch)
+        # The searches run on the GmailReader, the checkpoints are committed once the stores are processed here
+        self._reader._pending_checkpoints = self._pending_checkpoints
+        self._threads = self.workers if service_factory is not None else 1
+        self._executor: typing.Optional[ThreadPoolExecutor] = None
+
+    def _get_checkpoint_key(self, store: Stores) -> str:
+        return self._reader._get_checkpoint_key(store)
+
+    async def _call(self, func: typing.Callable, *args):
+        return await asyncio.get_event_loop().run_in_executor(self._executor, functools.partial(func, *args))
+
+    async def _iter_batches(self, fetch: typing.Callable[[Stores, typing.List[str]], typing.Iterator],
+                            store: Stores, keys: typing.List[str]) -> typing.AsyncIterator[tuple]:
+        """
+        Run fetch on ``batch_size`` keys at a time, keeping a batch per thread in flight
+        """
+        loop = asyncio.get_event_loop()
+        pending = collections.deque()
+        for batch in utils.chunked(keys, self._reader.batch_size):
+            pending.append(loop.run_in_executor(self._executor, _drain, fetch, store, batch))
+            if len(pending) > self._threads:
+                for entry in await pending.popleft():
+                    yield entry
+        while pending:
+            for entry in await pending.popleft():
+                yield entry
+
+    async def search_store_emails(self, store: Stores, subject: str = None) -> typing.List[str]:
+        return await self._call(self._reader.search_store_emails, store, subject)
+
+    async def search_combined_emails(self, stores: typing.List[Stores]) -> typing.List[str]:
+        return await self._call(self._reader.search_combined_emails, stores)
+
+    async def fetch_store_headers(self, store: Stores, keys: typing.List[str]) -> \
+            typing.AsyncIterator[typing.Tuple[str, Message]]:
+        async for key, headers in self._iter_batches(self._reader.fetch_store_headers, store, keys):
+            yield key, headers
+
+    async def fetch_store_emails(self, store: Stores, keys: typing.List[str]) -> \
+            typing.AsyncIterator[typing.Tuple[str, bytes]]:
+        async for key, raw_email in self._iter_batches(self._reader.fetch_store_emails, store, keys):
+            yield key, raw_email
+
+    async def _login(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self._threads)
+
+    async def _finish(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
@@ -3,13 +3,21 @@ import datetime
 import email
 import logging
 import os
+import threading
+import time
 import typing
 from email.message import Message
 
 from googleapiclient import errors
 
+from email_scrapper import bodystructure, utils
+from email_scrapper.archive import MessageArchive
+from email_scrapper.cache import MessageCache
+from email_scrapper.memo import ContentMemo
+from email_scrapper.metrics import Metrics
 from email_scrapper.models import Stores
-from email_scrapper.readers.base_reader import BaseReader
+from email_scrapper.state import StateStore
+from email_scrapper.readers.base_reader import BaseReader, body_part_filters
 
 logger = logging.getLogger(__name__)
 
@@ -17,8 +25,23 @@ logger = logging.getLogger(__name__)
 class GmailReader(BaseReader):
     SCOPES = ['https://www.googleapis.com/auth/gmail.readonly']
 
+    MAX_BATCH_SIZE = 100
+    # Gmail rate limits batches of 100 messages().get calls, 50 keeps most batches under the per user quota
+    DEFAULT_BATCH_SIZE = 50
+    MAX_PAGE_SIZE = 500
+    # Requests failing with a rate limit or server error are retried up to MAX_RETRIES times, waiting
+    # RETRY_DELAY seconds before the first retry and twice as long before every following one
+    MAX_RETRIES = 5
+    RETRY_DELAY = 1.0
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+
     def __init__(self, service, user_id: str = "me", user_email: str = None, email_mapping: dict = None,
-                 date_from: datetime.datetime = None):
+                 date_from: datetime.datetime = None, batch_size: int = DEFAULT_BATCH_SIZE,
+                 page_size: int = MAX_PAGE_SIZE, workers: int = 1, service_factory: typing.Callable = None,
+                 processes: int = 0, cache: MessageCache = None,
+                 state_store: StateStore = None, prefilter: bool = False, combined_search: bool = False,
+                 memo: ContentMemo = None, metrics: Metrics = None, archive: MessageArchive = None,
+                 partial_fetch: bool = False):
         """
 
         Parameters
@@ -27,13 +50,70 @@ class GmailReader(BaseReader):
         The Gmail API service
         email_mapping: dict
         Mapping of class:Stores: to str representing the email to search from
+        batch_size: int
+        How many messages are requested per Gmail batch HTTP request. Capped at 100, 1 disables batching. Messages
+        whose request failed with a rate limit or server error are requested again with exponential backoff
+        page_size: int
+        maxResults passed to messages().list. Capped at 500
+        workers: int
+        How many stores are scraped at once. Needs a service_factory, without one the stores are scraped one at a
+        time
+        service_factory: callable
+        Builds a new Gmail API service. The underlying http client is not thread safe, so every worker thread gets
+        its own service
+        processes: int
+        How many processes parse emails while they are downloaded. 0 parses inline
+        cache: MessageCache
+        Parse results of emails already seen, these are neither downloaded nor parsed again
+        state_store: StateStore
+        Enables incremental sync. The mailbox historyId is saved there and later runs only look at messages
+        added since, falling back to the date range when Gmail no longer has that history
+        prefilter: bool
+        Download the messages metadata first and only download the full email when the headers match what the
+        store's parser looks for
+        combined_search: bool
+        Search once with a {from:a from:b} query for all stores and route the emails to the stores by their From
+        header
+        memo: ContentMemo
+        Parse results by content, emails byte identical to one parsed before are not parsed again
+        metrics: Metrics
+        Where the time spent in every stage of the pipeline is reported
+        archive: MessageArchive
+        Every downloaded email is added there, to be parsed again with :class:`LocalArchiveReader`
+        partial_fetch: bool
+        Get the messages in the full format instead of raw, and only download the parts the store's parser reads,
+        fetching attachments with attachments().get. The parsers, cache and archive get an email rebuilt from the
+        original headers and those parts
         """
-        super(GmailReader, self).__init__(date_from=date_from, user_email=user_email, email_mapping=email_mapping)
-        self.service = service
+        super(GmailReader, self).__init__(date_from=date_from, user_email=user_email, email_mapping=email_mapping,
+                                          workers=workers, processes=processes, cache=cache,
+                                          state_store=state_store, prefilter=prefilter,
+                                          combined_search=combined_search, memo=memo, metrics=metrics,
+                                          archive=archive)
+        if self.workers > 1 and service_factory is None:
+            logger.log(logging.WARNING, "The Gmail service can't be shared between threads, scraping one store at a "
+                                        "time. Pass a service_factory to use more workers")
+            self.workers = 1
+        self._service = service
+        self._service_factory = service_factory
+        self._local = threading.local()
         self.user_id = user_id
+        self.batch_size = max(1, min(batch_size, self.MAX_BATCH_SIZE))
+        self.page_size = max(1, min(page_size, self.MAX_PAGE_SIZE))
+        self.partial_fetch = partial_fetch
+
+    @property
+    def service(self):
+        if self._service_factory is None or threading.current_thread() is threading.main_thread():
+            return self._service
+        service = getattr(self._local, "service", None)
+        if service is None:
+            service = self._local.service = self._service_factory()
+        return service
 
     @classmethod
-    def authenticate_with_browser(cls, credentials_json: dict = None, date_from: datetime.datetime = None):
+    def authenticate_with_browser(cls, credentials_json: dict = None, date_from: datetime.datetime = None,
+                                  workers: int = 1):
         """
         Login to gmail through the browser.
         Requires a credentials.json file or a credentials_json dict passed
@@ -64,35 +144,280 @@ class GmailReader(BaseReader):
                 pickle.dump(creds, token)
             service = build('gmail', 'v1', credentials=creds)
             response = service.users().getProfile(userId="me").execute()
-            return cls(service, user_id="me", user_email=response.get("emailAddress"), date_from=date_from)
+            return cls(service, user_id="me", user_email=response.get("emailAddress"), date_from=date_from,
+                       workers=workers, service_factory=lambda: build('gmail', 'v1', credentials=creds))
         except (ImportError, ModuleNotFoundError):
             raise BaseException("Google Auth library not found")
 
+    def _login(self):
+        pass
+
+    def _finish(self):
+        pass
+
     def _get_search_date_range(self):
         return self.search_date_range.strftime("%Y-%m-%d")
 
     def _get_email_details(self, message) -> Message:
         response = self.service.users().messages().get(userId=self.user_id, id=message['id'], format="raw").execute()
-        msg_str = base64.urlsafe_b64decode(response['raw'].encode('ASCII'))
-        mime_msg = email.message_from_bytes(msg_str)
-        return mime_msg
+        return email.message_from_bytes(self._decode_raw(response))
+
+    @staticmethod
+    def _decode_raw(response: dict) -> bytes:
+        return base64.urlsafe_b64decode(response['raw'].encode('ASCII'))
+
+    def _should_retry(self, error: Exception) -> bool:
+        if not isinstance(error, errors.HttpError):
+            return False
+        if error.resp.status == 403:  # Gmail also reports exceeded rate limits as 403
+            return b"ratelimitexceeded" in (error.content or b"").lower()
+        return error.resp.status in self.RETRY_STATUSES
+
+    def _backoff(self, attempt: int):
+        time.sleep(self.RETRY_DELAY * 2 ** attempt)
+
+    def _execute(self, request):
+        """
+        Execute a single API request, retrying it with exponential backoff while it is rate limited
+        """
+        for attempt in range(self.MAX_RETRIES + 1):
+            try:
+                return request.execute()
+            except errors.HttpError as error:
+                if attempt == self.MAX_RETRIES or not self._should_retry(error):
+                    raise
+                logger.log(logging.WARNING, f"Gmail request failed with {error.resp.status}, retrying")
+            self._backoff(attempt)
+
+    def _execute_batch(self, message_ids: typing.List[str], **kwargs) -> typing.Dict[str, dict]:
+        """
+        messages().get the message ids in one batch HTTP request. The messages whose request was rate limited or
+        failed with a server error are requested again in a new batch with exponential backoff
+
+        Returns
+        -------
+        The responses by message id. Messages deleted since they were listed are left out
+
+        Raises
+        ------
+        HttpError
+            When a request failed with any other error, or still failed after MAX_RETRIES retries
+        """
+        responses = {}
+        failures = {}
+
+        def callback(request_id, response, exception):
+            if exception is not None:
+                failures[request_id] = exception
+            else:
+                responses[request_id] = response
+
+        pending = list(message_ids)
+        for attempt in range(self.MAX_RETRIES + 1):
+            failures.clear()
+            batch = self.service.new_batch_http_request(callback=callback)
+            for message_id in pending:
+                batch.add(self.service.users().messages().get(userId=self.user_id, id=message_id, **kwargs),
+                          request_id=message_id)
+            try:
+                batch.execute()
+            except errors.HttpError as error:  # The whole batch was refused
+                failures.update((message_id, error) for message_id in pending)
+            pending = []
+            for message_id, error in failures.items():
+                if self._should_retry(error):
+                    pending.append(message_id)
+                elif isinstance(error, errors.HttpError) and error.resp.status == 404:
+                    logger.log(logging.WARNING, f"Message {message_id} was deleted before it was fetched")
+                else:
+                    raise error
+            if not pending:
+                return responses
+            if attempt == self.MAX_RETRIES:
+                raise failures[pending[0]]
+            logger.log(logging.WARNING, f"{len(pending)} of {len(message_ids)} Gmail requests failed, retrying")
+            self._backoff(attempt)
+
+    def _get_messages(self, message_ids: typing.List[str], **kwargs) -> \
+            typing.Generator[typing.Tuple[str, dict], None, None]:
+        """
+        messages().get every message id, grouping up to ``batch_size`` of them in a single batch HTTP request
+
+        Yields
+        -------
+        (message id, response) in the order of message_ids as each batch finishes
+        """
+        if self.batch_size == 1:
+            for message_id in message_ids:
+                try:
+                    response = self._execute(self.service.users().messages().get(userId=self.user_id, id=message_id,
+                                                                                 **kwargs))
+                except errors.HttpError as error:
+                    if error.resp.status != 404:
+                        raise
+                    logger.log(logging.WARNING, f"Message {message_id} was deleted before it was fetched")
+                    continue
+                yield message_id, response
+            return
+        for batch_ids in utils.chunked(message_ids, self.batch_size):
+            responses = self._execute_batch(batch_ids, **kwargs)
+            for message_id in batch_ids:
+                if message_id in responses:
+                    yield message_id, responses[message_id]
+
+    def _get_raw_emails(self, message_ids: typing.List[str]) -> typing.Generator[typing.Tuple[str, bytes], None, None]:
+        for message_id, response in self._get_messages(message_ids, format="raw"):
+            yield message_id, self._decode_raw(response)
 
-    def _get_search_query(self, store: Stores, subject: str = None):
-        return f"from:{self._get_store_email(store)} after:{self._get_search_date_range()}"
+    def _get_part(self, message_id: str, part: dict) -> typing.Tuple[bytes, bytes]:
+        """
+        Returns
+        -------
+        (MIME header, base64 body) of a part of a full format message, downloading its attachment if needed
+        """
+        body = part.get('body', {})
+        data = body.get('data')
+        if data is None and body.get('attachmentId'):
+            data = self._execute(self.service.users().messages().attachments().get(
+                userId=self.user_id, messageId=message_id, id=body['attachmentId']))['data']
+        # Gmail gives the decoded body, so it is encoded as base64 again
+        headers = [f"{header['name']}: {header['value']}\r\n" for header in part.get('headers', [])
+                   if header['name'].lower().startswith("content-") and
+                   header['name'].lower() != "content-transfer-encoding"]
+        headers.append("Content-Transfer-Encoding: base64\r\n\r\n")
+        payload = base64.urlsafe_b64decode((data or "").encode('ASCII'))
+        return "".join(headers).encode("utf-8"), base64.encodebytes(payload).replace(b"\n", b"\r\n")
+
+    def _get_partial_emails(self, store: Stores, message_ids: typing.List[str]) -> \
+            typing.Generator[typing.Tuple[str, bytes], None, None]:
+        """
+        Get every message in the full format and rebuild it from its headers and the parts the store's parser
+        reads. Single part messages are rebuilt from their body, which the full format includes. Messages with
+        attached emails are downloaded raw afterwards
+        """
+        select_parts = body_part_filters[store]
+        raw_ids = []
+        for message_id, response in self._get_messages(message_ids, format="full"):
+            payload = response.get('payload', {})
+            root = bodystructure.from_gmail_payload(payload)
+            if any(part.content_type == "message/rfc822" for part in root.walk()):
+                raw_ids.append(message_id)
+                continue
+            payload_parts = {}
+            pending = [payload]
+            while pending:
+                part = pending.pop()
+                payload_parts[part.get('partId', "")] = part
+                pending.extend(part.get('parts', []))
+            header = "".join(f"{header['name']}: {header['value']}\r\n" for header in payload.get('headers', []))
+            parts = [self._get_part(message_id, payload_parts[part.section]) for part in select_parts(root)]
+            yield message_id, bodystructure.build_partial_email(header.encode("utf-8"), parts)
+        yield from self._get_raw_emails(raw_ids)
+
+    def _list_message_ids(self, query: str) -> typing.Generator[str, None, None]:
+        response = self._execute(self.service.users().messages().list(userId=self.user_id, q=query,
+                                                                      maxResults=self.page_size))
+        for message in response.get('messages', []):
+            yield message['id']
+        while 'nextPageToken' in response:
+            page_token = response['nextPageToken']
+            response = self._execute(self.service.users().messages().list(userId=self.user_id, q=query,
+                                                                          maxResults=self.page_size,
+                                                                          pageToken=page_token))
+            for message in response.get('messages', []):
+                yield message['id']
+
+    def _list_history_message_ids(self, start_history_id: str) -> typing.Set[str]:
+        """
+        Returns
+        -------
+        The ids of every message added since start_history_id
+        """
+        message_ids = set()
+        page_token = None
+        while True:
+            response = self._execute(self.service.users().history().list(
+                userId=self.user_id, startHistoryId=start_history_id, historyTypes="messageAdded",
+                maxResults=self.page_size, pageToken=page_token))
+            for record in response.get('history', []):
+                for added in record.get('messagesAdded', []):
+                    message_ids.add(added['message']['id'])
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                return message_ids
+
+    def _get_search_query(self, store: Stores, subject: str = None, after: int = None):
+        return f"from:{self._get_store_email(store)} after:{after or self._get_search_date_range()}"
+
+    def _get_combined_search_query(self, stores: typing.List[Stores]):
+        senders = " ".join(f"from:{self._get_store_email(store)}" for store in stores)
+        return f"{{{senders}}} after:{self._get_search_date_range()}"
+
+    def search_combined_emails(self, stores: typing.List[Stores]) -> typing.List[str]:
+        try:
+            return list(self._list_message_ids(self._get_combined_search_query(stores)))
+        except errors.HttpError as error:
+            logger.log(logging.ERROR, f"Failed to search the emails of {stores}: {error}")
+            raise
+
+    def search_store_emails(self, store: Stores, subject: str = None) -> typing.List[str]:
+        try:
+            message_ids = self._search_store_emails(store, subject)
+        except errors.HttpError as error:
+            logger.log(logging.ERROR, f"Failed to search {store} emails: {error}")
+            raise
+        return message_ids
+
+    def _search_store_emails(self, store: Stores, subject: str = None) -> typing.List[str]:
+        checkpoint = self._get_checkpoint(store)
+        new_checkpoint = None
+        if self.state_store is not None:
+            # Taken before listing, so messages added while the store is processed are found by the next run
+            started = int(time.time())
+            history_id = self._execute(self.service.users().getProfile(userId=self.user_id))['historyId']
+            new_checkpoint = {"history_id": history_id, "timestamp": started}
+        message_ids = None
+        if checkpoint:
+            try:
+                new_ids = self._list_history_message_ids(checkpoint["history_id"])
+            except errors.HttpError as error:
+                if error.resp.status != 404:
+                    raise
+                logger.log(logging.INFO, f"History {checkpoint['history_id']} expired, rescanning {store} by date")
+            else:
+                message_ids = []
+                if new_ids:
+                    # Only list the last day or so, the history decides which of those messages are new
+                    query = self._get_search_query(store, subject, after=checkpoint["timestamp"] - 86400)
+                    message_ids = [message_id for message_id in self._list_message_ids(query)
+                                   if message_id in new_ids]
+        if message_ids is None:
+            message_ids = list(self._list_message_ids(self._get_search_query(store, subject)))
+        if new_checkpoint is not None:
+            # Only saved once every listed email has been fetched and parsed
+            self._set_pending_checkpoint(store, new_checkpoint)
+        return message_ids
+
+    def fetch_store_headers(self, store: Stores, keys: typing.List[str]) -> \
+            typing.Iterator[typing.Tuple[str, Message]]:
+        try:
+            for message_id, response in self._get_messages(keys, format="metadata",
+                                                           metadataHeaders=list(self.PREFILTER_HEADERS)):
+                headers = Message()
+                for header in response.get('payload', {}).get('headers', []):
+                    headers[header['name']] = header['value']
+                yield message_id, headers
+        except errors.HttpError as error:
+            logger.log(logging.ERROR, f"Failed to fetch the headers of {store} emails: {error}")
+            raise
 
-    def read_store_emails(self, store: Stores, subject: str = None) -> typing.Generator[str, None, None]:
-        query = self._get_search_query(store, subject)
+    def fetch_store_emails(self, store: Stores, keys: typing.List[str]) -> \
+            typing.Iterator[typing.Tuple[str, bytes]]:
         try:
-            response = self.service.users().messages().list(userId=self.user_id,
-                                                            q=query).execute()
-            if 'messages' in response:
-                for message in response['messages']:
-                    yield self._get_email_details(message)
-            while 'nextPageToken' in response:
-                page_token = response['nextPageToken']
-                response = self.service.users().messages().list(userId=self.user_id, q=query,
-                                                                pageToken=page_token).execute()
-                for message in response['messages']:
-                    yield self._get_email_details(message)
+            if self.partial_fetch and store in body_part_filters:
+                yield from self._get_partial_emails(store, keys)
+            else:
+                yield from self._get_raw_emails(keys)
         except errors.HttpError as error:
-            print('An error occurred: %s' % error)
+            logger.log(logging.ERROR, f"Failed to fetch {store} emails: {error}")
+            raise
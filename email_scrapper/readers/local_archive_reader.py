@@ -0,0 +1,62 @@
+import datetime
+import email.parser
+import typing
+from email.message import Message
+
+from email_scrapper.archive import MessageArchive
+from email_scrapper.cache import MessageCache
+from email_scrapper.memo import ContentMemo
+from email_scrapper.metrics import Metrics
+from email_scrapper.models import Stores
+from email_scrapper.readers.base_reader import BaseReader
+
+
+class LocalArchiveReader(BaseReader):
+    """
+    Replays the emails of a :class:`MessageArchive` through the store parsers without a mailbox, e.g. to parse
+    everything again after a parser change. The emails are read as slices of the memory mapped archive instead of
+    bytes copies, but decoding an email into a Message still copies it into a str.
+    """
+
+    def __init__(self, archive: MessageArchive, user_email: str = None, date_from: datetime.datetime = None,
+                 workers: int = 1, processes: int = 0, cache: MessageCache = None, prefilter: bool = False,
+                 memo: ContentMemo = None, metrics: Metrics = None):
+        """
+
+        :param archive: The archive to read
+        :param user_email: Only replay the emails archived by the reader of this email address. Defaults to every
+            account
+        :param date_from: Only replay emails sent since. Defaults to every archived email
+        :param workers: How many stores are replayed at once
+        :param processes: How many processes parse the emails. 0 parses inline
+        :param cache: Parse results of emails already seen, these are not parsed again
+        :param prefilter: Skip the emails whose headers don't match what the store's parser looks for
+        :param memo: Parse results by content, emails byte identical to one parsed before are not parsed again
+        :param metrics: Where the time spent in every stage of the pipeline is reported
+        """
+        super(LocalArchiveReader, self).__init__(user_email=user_email, date_from=date_from, workers=workers,
+                                                 processes=processes, cache=cache, prefilter=prefilter, memo=memo,
+                                                 metrics=metrics)
+        self.message_archive = archive
+        self.date_from = date_from
+        self._header_parser = email.parser.HeaderParser()
+
+    def _login(self):
+        pass
+
+    def _finish(self):
+        pass
+
+    def search_store_emails(self, store: Stores, subject: str = None) -> typing.List[str]:
+        return self.message_archive.keys(store, self.email, self.date_from, subject)
+
+    def fetch_store_emails(self, store: Stores, keys: typing.List[str]) -> \
+            typing.Iterator[typing.Tuple[str, typing.Union[bytes, memoryview]]]:
+        for key, raw_email in self.message_archive.iter_messages(store, keys, self.email):
+            # Memoryviews can't be pickled for the parser processes
+            yield key, bytes(raw_email) if self._parser_pool is not None else raw_email
+
+    def fetch_store_headers(self, store: Stores, keys: typing.List[str]) -> \
+            typing.Iterator[typing.Tuple[str, Message]]:
+        for key, raw_email in self.message_archive.iter_messages(store, keys, self.email):
+            yield key, self._header_parser.parsestr(str(raw_email, "ascii", "surrogateescape"), headersonly=True)
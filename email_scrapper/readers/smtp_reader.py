@@ -2,20 +2,180 @@ import datetime
 import email
 import imaplib
 import logging
+import re
 import typing
+from contextlib import contextmanager
 
+from email_scrapper import bodystructure, utils
+from email_scrapper.archive import MessageArchive
+from email_scrapper.cache import MessageCache
+from email_scrapper.imap_pool import ImapPool, ImapSession
+from email_scrapper.memo import ContentMemo
+from email_scrapper.metrics import Metrics
 from email_scrapper.email_settings import Email
 from email_scrapper.models import Stores
-from email_scrapper.readers.base_reader import BaseReader
+from email_scrapper.state import StateStore
+from email_scrapper.readers.base_reader import BaseReader, body_part_filters
 
 logger = logging.getLogger(__name__)
 
+uid_pattern = re.compile(rb"UID (\d+)")
 
-class SmtpReader(BaseReader):
+fetch_start_pattern = re.compile(rb"\d+ \(")
+
+section_pattern = re.compile(rb"(BODY\[[^\]]*\])(?:<\d+>)? \{\d+\}$")
+
+
+def iter_fetched(data: list) -> typing.Iterator[typing.Tuple[typing.Optional[bytes], bytes]]:
+    """
+    Yields
+    -------
+    (uid, literal) of every email of a UID FETCH response with one literal per email, e.g. its RFC822
+    """
+    for part in data:
+        if not isinstance(part, tuple):
+            continue
+        uid = uid_pattern.search(part[0])
+        yield uid.group(1) if uid else None, part[1]
+
+
+def iter_fetch_responses(data: list) -> \
+        typing.Iterator[typing.Tuple[typing.Optional[bytes], bytes, typing.Dict[bytes, bytes]]]:
+    """
+    Split a UID FETCH response into the responses of its emails
+
+    Yields
+    -------
+    (uid, the response with its literals inlined, the literals by section e.g. b"BODY[1.MIME]") per email
+    """
+    response = None
+    for part in data:
+        line = part[0] if isinstance(part, tuple) else part
+        if not isinstance(line, bytes):
+            continue
+        if fetch_start_pattern.match(line):
+            if response is not None:
+                yield response
+            response = [None, b"", {}]
+        if response is None:
+            continue
+        uid = uid_pattern.search(line)
+        if uid and response[0] is None:
+            response[0] = uid.group(1)
+        if isinstance(part, tuple):
+            response[1] += line + b"\r\n" + part[1]
+            section = section_pattern.search(line)
+            if section:
+                response[2][section.group(1)] = part[1]
+        else:
+            response[1] += line
+    if response is not None:
+        yield response
+
+
+def group_uids_by_parts(store: Stores, responses: typing.Iterable[tuple]) -> \
+        typing.Dict[typing.Optional[typing.Tuple[str, ...]], typing.List[bytes]]:
+    """
+    Group the UIDs of BODYSTRUCTURE responses by the sections the store's parser reads
+
+    Returns
+    -------
+    The UIDs by their sections, the UIDs of emails that can't be split under None
+    """
+    select_parts = body_part_filters[store]
+    sections: typing.Dict[typing.Optional[typing.Tuple[str, ...]], typing.List[bytes]] = {}
+    for uid, response, literals in responses:
+        if uid is None:
+            continue
+        root = bodystructure.parse_bodystructure(response)
+        if bodystructure.can_fetch_parts(root):
+            sections.setdefault(tuple(part.section for part in select_parts(root)), []).append(uid)
+        else:
+            sections.setdefault(None, []).append(uid)
+    return sections
+
+
+def get_partial_fetch_items(parts: typing.Tuple[str, ...]) -> str:
+    items = ["BODY.PEEK[HEADER]"] + [f"BODY.PEEK[{section}.MIME] BODY.PEEK[{section}]" for section in parts]
+    return f"({' '.join(items)})"
+
+
+def build_fetched_email(parts: typing.Tuple[str, ...], literals: typing.Dict[bytes, bytes]) -> bytes:
+    """
+    Rebuild an email from the literals of the response to :func:`get_partial_fetch_items`
+    """
+    return bodystructure.build_partial_email(
+        literals.get(b"BODY[HEADER]", b""),
+        [(literals.get(f"BODY[{section}.MIME]".encode(), b""), literals.get(f"BODY[{section}]".encode(), b""))
+         for section in parts])
+
+
+class ImapFolderMixin:
+    """
+    What :class:`SmtpReader` and :class:`AsyncSmtpReader` share: where the stores' emails are, the checkpoints of
+    the folders and turning the UIDs a search found into keys
+    """
+    email_locations: typing.Dict[Stores, str]
+
+    def _get_location(self, store: Stores) -> str:
+        return self.email_locations.get(store) or 'inbox'
+
+    def _group_stores_by_folder(self, stores: typing.List[Stores]) -> typing.List[typing.List[Stores]]:
+        folders: typing.Dict[str, typing.List[Stores]] = {}
+        for store in stores:
+            folders.setdefault(self._get_location(store), []).append(store)
+        return list(folders.values())
+
+    def _get_checkpoint_key(self, store: Stores) -> str:
+        # Both readers see the same UIDs, so either can pick up where the other stopped
+        return f"{SmtpReader.__name__}:{self._get_user_email()}:{store.name}"
+
+    def _get_last_uid(self, store: Stores, location: str, uid_validity: str) -> typing.Optional[int]:
+        """
+        Returns
+        -------
+        The newest UID of the folder the last run saw, None when there is no checkpoint or the folder's
+        UIDVALIDITY changed since
+        """
+        checkpoint = self._get_checkpoint(store)
+        if checkpoint and checkpoint.get("location") == location and checkpoint.get("uid_validity") == uid_validity:
+            return checkpoint["last_uid"]
+        if checkpoint:
+            logger.log(logging.INFO, f"UIDVALIDITY of {location} changed, rescanning {store} by date")
+        return None
+
+    def _get_search_keys(self, store: Stores, location: str, uid_validity: str, uid_next: typing.Optional[int],
+                         last_uid: typing.Optional[int], data: list) -> typing.List[str]:
+        """
+        Turn the response of a UID SEARCH into keys and remember the folder's newest UID as the store's checkpoint
+
+        Returns
+        -------
+        Keys in the form folder:UIDVALIDITY:UID
+        """
+        uids = [int(uid) for uid in data[0].split()]
+        if last_uid is not None:
+            # "UID n:*" always matches the newest message, even when it is older than n
+            uids = [uid for uid in uids if uid > last_uid]
+        if uid_next:
+            self._set_pending_checkpoint(store, {"location": location, "uid_validity": uid_validity,
+                                                 "last_uid": uid_next - 1})
+        else:
+            # The newest UID the search found isn't the folder's, saving it would rescan or skip emails next run
+            logger.log(logging.WARNING, f"{location} has no UIDNEXT, the {store} checkpoint is not saved")
+        return [f"{location}:{uid_validity}:{uid}" for uid in uids]
+
+
+class SmtpReader(ImapFolderMixin, BaseReader):
 
     def __init__(self, username: str, password: str, settings: Email = Email.GMAIL, email_address: str = None,
                  locations: typing.Dict[Stores, str] = None,
-                 date_from: datetime.datetime = None, email_mapping=None):
+                 date_from: datetime.datetime = None, email_mapping=None, fetch_batch_size: int = 100,
+                 workers: int = 1, processes: int = 0,
+                 cache: MessageCache = None, state_store: StateStore = None, prefilter: bool = False,
+                 combined_search: bool = False, memo: ContentMemo = None, use_ssl: bool = True,
+                 metrics: Metrics = None, archive: MessageArchive = None, pool: ImapPool = None,
+                 partial_fetch: bool = False):
         """
 
         :param username: The SMTP username to log in with
@@ -26,28 +186,164 @@ class SmtpReader(BaseReader):
         :param locations: Optional labels to look under
         :param date_from: How far back to search emails from. Default to 7 days.
         :param email_mapping: dict of Stores - store email to query from
+        :param fetch_batch_size: How many UIDs are requested per UID FETCH command. 1 fetches one email per round-trip
+        :param workers: How many stores are scraped at once. Each worker borrows its own IMAP session
+        :param processes: How many processes parse emails while they are downloaded. 0 parses inline
+        :param cache: Parse results of emails already seen, these are neither downloaded nor parsed again
+        :param state_store: Enables incremental sync. The last seen UID of every folder is saved there and later
+            runs only search newer UIDs, falling back to the date range when the folder's UIDVALIDITY changes
+        :param prefilter: Download the Subject/Date/From/Message-ID headers first and only download the full email
+            when they match what the store's parser looks for
+        :param combined_search: Search every folder once with an OR FROM query for all of the stores in it and
+            route the emails to the stores by their From header
+        :param memo: Parse results by content, emails byte identical to one parsed before are not parsed again
+        :param use_ssl: Connect without TLS when False, only meant for local servers
+        :param metrics: Where the time spent in every stage of the pipeline is reported
+        :param archive: Every downloaded email is added there, to be parsed again with :class:`LocalArchiveReader`
+        :param pool: Logged in sessions shared with other readers of the same account, e.g. ``ImapPool.shared``.
+            Defaults to a pool of this reader only whose sessions are logged out at the end of every run
+        :param partial_fetch: Fetch the BODYSTRUCTURE of every email first and then only the parts its store's parser
+            reads, e.g. the html part but not the images. The parsers, cache and archive get an email rebuilt from
+            the original header and those parts
         """
         super(SmtpReader, self).__init__(date_from=date_from, user_email=email_address or username,
-                                         email_mapping=email_mapping)
+                                         email_mapping=email_mapping, workers=workers, processes=processes,
+                                         cache=cache, state_store=state_store, prefilter=prefilter,
+                                         combined_search=combined_search, memo=memo, metrics=metrics,
+                                         archive=archive)
         self.username = username
         self._password = password
-        self.mail = imaplib.IMAP4_SSL(*settings.value)
+        self.settings = settings
+        self.use_ssl = use_ssl
         self.email_locations = locations or {}
+        self.fetch_batch_size = max(1, fetch_batch_size)
+        self.partial_fetch = partial_fetch
+        self._owns_pool = pool is None
+        self.pool = pool if pool is not None else ImapPool(username, password, settings, use_ssl)
+
+    @contextmanager
+    def _connection(self) -> typing.Iterator[ImapSession]:
+        """
+        Borrow a logged in session of the pool, it is connected when none is idle
+        """
+        with self.pool.session() as session:
+            yield session
+
+    def _select(self, session: ImapSession, store: Stores) -> str:
+        """
+        Select the folder the store's emails are in, unless the session has it selected already
+
+        Returns
+        -------
+        The folder's UIDVALIDITY
+        """
+        uid_validity, uid_next = session.select(self._get_location(store))
+        return uid_validity
+
+    def _fetch_uids(self, mail: imaplib.IMAP4, uids: typing.List[bytes], message_parts: str = "(RFC822)") -> \
+            typing.Generator[typing.Tuple[bytes, bytes], None, None]:
+        """
+        Fetch the given UIDs in batches of ``fetch_batch_size``, e.g. ``UID FETCH 101:250,300 (RFC822)``
+
+        Yields
+        -------
+        (uid, raw message bytes) as each batch comes back
+        """
+        for batch in utils.chunked(uids, self.fetch_batch_size):
+            yield from iter_fetched(self._uid_fetch(mail, batch, message_parts))
+
+    def _uid_fetch(self, mail: imaplib.IMAP4, uids: typing.List[bytes], message_parts: str) -> list:
+        result, data = mail.uid("fetch", utils.compress_uids(uids), message_parts)
+        if result != "OK":
+            # Raised so the store's checkpoint doesn't move past the emails of the batch
+            logger.log(logging.ERROR, f"Failed to fetch {uids}: {data}")
+            raise imaplib.IMAP4.error(f"UID FETCH failed: {data}")
+        return data
+
+    def _fetch_partial_uids(self, mail: imaplib.IMAP4, store: Stores, uids: typing.List[bytes]) -> \
+            typing.Iterator[typing.Tuple[bytes, bytes]]:
+        """
+        Fetch the BODYSTRUCTURE of the UIDs, then the header and the parts the store's parser reads of every email.
+        Emails with the same part numbers are fetched together, emails that can't be split are fetched whole
+
+        Yields
+        -------
+        (uid, email rebuilt from the fetched parts) in the order of uids
+        """
+        sections = group_uids_by_parts(store, iter_fetch_responses(self._uid_fetch(mail, uids, "(BODYSTRUCTURE)")))
+        emails: typing.Dict[bytes, bytes] = {}
+        for parts, part_uids in sections.items():
+            if parts is None:
+                emails.update(self._fetch_uids(mail, part_uids))
+                continue
+            for uid, response, literals in iter_fetch_responses(
+                    self._uid_fetch(mail, part_uids, get_partial_fetch_items(parts))):
+                emails[uid] = build_fetched_email(parts, literals)
+        for uid in uids:
+            if uid in emails:
+                yield uid, emails[uid]
+
+    def search_store_emails(self, store: Stores, subject: str = None) -> typing.List[str]:
+        """
+        Returns
+        -------
+        Keys in the form folder:UIDVALIDITY:UID
+        """
+        location = self._get_location(store)
+        with self._connection() as session:
+            # Selected again even when the session has the folder selected, UIDNEXT is only sent by SELECT
+            uid_validity, uid_next = session.select(location, force=True)
+            last_uid = self._get_last_uid(store, location, uid_validity)
+            result, data = session.imap.uid('search', None,
+                                            self._get_search_query(store, subject, after_uid=last_uid))
+        if result != "OK":
+            raise imaplib.IMAP4.error(f"UID SEARCH of {store} failed: {data}")
+        return self._get_search_keys(store, location, uid_validity, uid_next, last_uid, data)
+
+    def search_combined_emails(self, stores: typing.List[Stores]) -> typing.List[str]:
+        location = self._get_location(stores[0])
+        with self._connection() as session:
+            uid_validity = self._select(session, stores[0])
+            result, data = session.imap.uid('search', None, self._get_combined_search_query(stores))
+        if result != "OK":
+            raise imaplib.IMAP4.error(f"UID SEARCH of {stores} failed: {data}")
+        return [f"{location}:{uid_validity}:{uid.decode()}" for uid in data[0].split()]
+
+    def _fetch_keys(self, store: Stores, keys: typing.List[str], message_parts: str) -> \
+            typing.Iterator[typing.Tuple[str, bytes]]:
+        if not keys:
+            return
+        uid_keys = {key.rsplit(":", 1)[1]: key for key in keys}
+        with self._connection() as session:
+            self._select(session, store)
+            for uid, data in self._fetch_uids(session.imap, list(uid_keys), message_parts):
+                yield uid_keys.get(uid.decode() if uid else None), data
+
+    def fetch_store_headers(self, store: Stores, keys: typing.List[str]) -> \
+            typing.Iterator[typing.Tuple[str, email.message.Message]]:
+        message_parts = f"(BODY.PEEK[HEADER.FIELDS ({' '.join(self.PREFILTER_HEADERS).upper()})])"
+        for key, raw_headers in self._fetch_keys(store, keys, message_parts):
+            yield key, email.message_from_bytes(raw_headers)
 
-    def read_store_emails(self, store: Stores, subject: str = None) -> typing.Iterable[str]:
-        location = self.email_locations.get(store)
-        if location:
-            self.mail.select(location)
-        search_query = self._get_search_query(store, subject)
-        result, amazon_data = self.mail.uid('search', None, search_query)
-        for num in amazon_data[0].split():
-            m, v = self.mail.uid("fetch", num, "(RFC822)")
-            msg_body = email.message_from_bytes(v[0][1])
-            yield msg_body
+    def fetch_store_emails(self, store: Stores, keys: typing.List[str]) -> \
+            typing.Iterator[typing.Tuple[str, bytes]]:
+        if not self.partial_fetch or store not in body_part_filters:
+            yield from self._fetch_keys(store, keys, "(RFC822)")
+            return
+        if not keys:
+            return
+        uid_keys = {key.rsplit(":", 1)[1]: key for key in keys}
+        with self._connection() as session:
+            self._select(session, store)
+            for batch in utils.chunked([uid.encode() for uid in uid_keys], self.fetch_batch_size):
+                for uid, data in self._fetch_partial_uids(session.imap, store, batch):
+                    yield uid_keys.get(uid.decode()), data
 
     def _finish(self):
-        self.mail.logout()
+        if self._owns_pool:
+            self.pool.close()
 
     def _login(self):
-        self.mail.login(self.username, self._password)
-        self.mail.select('inbox')
+        # Connects the first session unless the pool has an idle one, so a bad login fails before any store
+        with self._connection():
+            pass
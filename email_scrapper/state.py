@@ -0,0 +1,69 @@
+import json
+import os
+import threading
+import typing
+
+
+class StateStore:
+    """
+    Where readers keep their incremental sync checkpoints. Subclass to keep them somewhere else
+    """
+
+    def get(self, key: str) -> typing.Optional[dict]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: dict):
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+
+class MemoryStateStore(StateStore):
+
+    def __init__(self):
+        self._state: typing.Dict[str, dict] = {}
+
+    def get(self, key: str) -> typing.Optional[dict]:
+        return self._state.get(key)
+
+    def set(self, key: str, value: dict):
+        self._state[key] = value
+
+    def delete(self, key: str):
+        self._state.pop(key, None)
+
+
+class JsonStateStore(StateStore):
+    """
+    Keeps every checkpoint in a single json file, rewritten atomically on every change
+    """
+
+    def __init__(self, path: str = "email_scrapper_state.json"):
+        self.path = path
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path) as f:
+                self._state: typing.Dict[str, dict] = json.load(f)
+        else:
+            self._state = {}
+
+    def get(self, key: str) -> typing.Optional[dict]:
+        with self._lock:
+            return self._state.get(key)
+
+    def set(self, key: str, value: dict):
+        with self._lock:
+            self._state[key] = value
+            self._save()
+
+    def delete(self, key: str):
+        with self._lock:
+            if self._state.pop(key, None) is not None:
+                self._save()
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._state, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
@@ -1,109 +1,77 @@
-import datetime
 import html
 import logging
-import re
-
-from bs4 import BeautifulSoup
+from email.utils import parsedate_to_datetime
 
 from email_scrapper.models import Order, Item, Stores
+from email_scrapper.stores import markup, patterns
 
-global_remover = re.compile("(=(?<==)(.*?)(?=\\s))", flags=re.DOTALL)
+PARSER_VERSION = 3
 
 logger = logging.getLogger(__name__)
 
 
-def does_item_exist(items, item):
-    try:
-        item = item.group(0)
-    except:
-        item = item
+def _normalize_name(name: str) -> str:
+    return name.replace(" ", "")
+
 
-    for i in items:
-        if item.replace(" ", "") == i.replace(" ", ""):
-            return True
-    else:
-        return False
+def _get_quantity(*texts: str) -> int:
+    for text in texts:
+        item_quantity = patterns.QUANTITY.search(text)
+        if item_quantity:
+            return int(item_quantity.group(0))
+    return 1
 
 
 def get_data(email):
-    email = str(email)
-    soup = BeautifulSoup(email, "lxml")
-    order_number = re.search(r'(?<=Order\s#)(\d*-\d*-\d*)', email).group(1)
-    date = datetime.datetime.strptime(re.findall(r'(Date:.*)', email)[1][6:], "%a, %d %b %Y %H:%M:%S %z")
+    date = parsedate_to_datetime(email.get("Date"))
+    email = markup.get_html(email)
+    tree = markup.parse_html(email)
+    order_number = patterns.AMAZON_ORDER_NUMBER.search(email).group(1)
     items = []
-    order_discount = 0.00
+    seen_items = set()
     item_quanitites = []
-    prices = [p.text for p in soup.find_all("strong") if "CDN" in p.text]
+    prices = [p for p in markup.texts(tree.iter("strong")) if "CDN" in p]
     cart = []
-    discounts = set(re.findall("-CDN\$\s.*", email))
-    for discount in discounts:
-        try:
-            amount = float(discount[6:])
-        except:
-            amount = 0
-        order_discount += amount
+    order_discount = patterns.get_discount(email)
 
-    item_names = [td.text for td in [td.find("a") for td in soup.find_all("td") if re.search(r"(Sold)", td.text)
-                                     or re.search(r"(S=\nold)", td.text)] if len(td.text) > 5]
+    item_names = [link for link in markup.texts(td.find(".//a") for td in tree.iter("td")
+                                                if patterns.AMAZON_SOLD.search(td.text_content())) if len(link) > 5]
 
     for index, link in enumerate(item_names):
-        tmp = re.sub(global_remover, "", link)
-        tmp = re.sub("\n", "", tmp)
-        possible_items = re.sub(r"(\s{2,})", " ", tmp)
-        possible_items = re.sub(r"CDN\$ \d+\.\d+", "", possible_items)
+        tmp = link.replace("\n", "")
+        possible_items = patterns.WHITESPACE_RUN.sub(" ", tmp)
+        possible_items = patterns.CDN_PRICE.sub("", possible_items)
         possible_items = possible_items.split("  ")
-        if len(possible_items) > 1 and re.search(r"(\d+)(?=([Xx])?)", possible_items[0]):
+        if len(possible_items) > 1 and patterns.DIGITS.search(possible_items[0]):
             for it in possible_items:
-                try:
-                    item_name = re.search(r"(\dx)(?<=\dx)(.*)(?=Sold)", it)
-                    if item_name is not None:
-                        item_name = item_name.group(2)
-                    else:
-                        item_name = re.sub(r"\d+x", "", it)
-                except Exception as e:
-                    print(e)
-                if not does_item_exist(items, item_name):
-                    items.append(html.unescape(re.sub(r"\s{2,}", "", item_name)))
+                item_name = patterns.AMAZON_ITEM_NAME.search(it)
+                if item_name is not None:
+                    item_name = item_name.group(2)
                 else:
+                    item_name = patterns.AMAZON_ITEM_COUNT_PREFIX.sub("", it)
+                if _normalize_name(item_name) in seen_items:
                     continue
-                item_quantity = re.search(r"(\d+)(?=([Xx])(=)?)", it)
-                if item_quantity:
-                    try:
-                        item_quanitites.append(int(item_quantity.group(0)))
-                    except:
-                        item_quanitites.append(1)
-                else:
-                    item_quanitites.append(1)
+                item_name = html.unescape(patterns.WHITESPACE_RUN.sub("", item_name))
+                items.append(item_name)
+                seen_items.add(_normalize_name(item_name))
+                item_quanitites.append(_get_quantity(it))
         else:
-            item_name = re.sub("\n", "", tmp)
-            item_name = re.sub(r"(=a.*)", "", item_name)
-            item_name = html.unescape(item_name)
-            if not does_item_exist(items, item_name):
-                item_quantity = re.search(r"(\d+)(?=([Xx])(=)?)", tmp)
-                if item_quantity:
-                    try:
-                        item_quanitites.append(int(item_quantity.group(0)))
-                    except:
-                        item_quanitites.append(1)
-                else:
-                    item_quantity = re.search(r"(\d+)(?=([Xx])(=)?)", item_name)
-                    if item_quantity:
-                        item_quanitites.append(int(item_quantity.group(0)))
-                    else:
-                        item_quanitites.append(1)
-                item_name = re.sub(r'(\d+)(?=([Xx])(=)?)([Xx])', "", item_name)
-                item_name = re.sub(r"(<.*?>)", "", item_name)
-                item_name = re.sub(r"CDN\$ \d+\.\d+", "", item_name)
-                items.append(html.unescape(re.sub(r"\s{2,}", "", item_name)))
-            else:
+            item_name = html.unescape(tmp)
+            if _normalize_name(item_name) in seen_items:
                 continue
+            item_quanitites.append(_get_quantity(tmp, item_name))
+            item_name = patterns.QUANTITY_PREFIX.sub("", item_name)
+            item_name = patterns.TAG.sub("", item_name)
+            item_name = patterns.CDN_PRICE.sub("", item_name)
+            item_name = html.unescape(patterns.WHITESPACE_RUN.sub("", item_name))
+            items.append(item_name)
+            seen_items.add(_normalize_name(item_name))
     for item, price, quantity in zip(items, prices, item_quanitites):
-        item = re.sub(r"(Sold by Amazon\.com\.ca, [Ii]nc\. )", "", item)
-        item = re.sub(r"(Sold by Amazon\.com\.ca, [Ii]nc\.)", "", item)
-        item = re.sub(r"(<.*?>)", "", item)
+        item = patterns.AMAZON_SOLD_BY.sub("", item)
+        item = patterns.TAG.sub("", item)
         if quantity == 0:
             quantity = 10
-        formated_price = re.search(r'(\d+.\d+)', price) or re.search(r"(\d+.\d+.\d+)", price)
+        formated_price = patterns.PRICE.search(price)
         try:
             total_price = float(formated_price.group(0).replace(",", ""))
             try:
@@ -1,88 +1,150 @@
 import datetime
-import html
 import io
+import itertools
+import logging
 import re
+import typing
+from concurrent.futures import Executor
+from email.message import Message
 
 import pdfminer
 import pdfminer.high_level
 import pdfminer.layout
 import pdfminer.settings
-from bs4 import BeautifulSoup
-from pdfminer.image import ImageWriter
+from pdfminer.layout import LTChar, LTCurve, LTFigure, LTPage, LTText, LTTextBox, LTTextLine
 
 from email_scrapper.models import Order, Item, Stores
+from email_scrapper.stores import patterns
+
+logger = logging.getLogger(__name__)
 
 pdfminer.settings.STRICT = False
 
+PARSER_VERSION = 4
+
+LAPARAMS = pdfminer.layout.LAParams()
+
+# How many pages of a pdf are analysed at most, 0 for all of them
+MAX_PAGES = 0
+
+PDF_CONTENT_TYPES = ("application/pdf", "application/x-pdf")
+
+TABLE_LABELS = ("Order Number", "Order Date", "Qty", "Product Description", "Total")
+
+
+def is_pdf(part: Message) -> bool:
+    content_type = part.get_content_type()
+    if content_type in PDF_CONTENT_TYPES:
+        return True
+    return content_type == "application/octet-stream" and (part.get_filename() or "").lower().endswith(".pdf")
+
+
+class _SpanCollector:
+    """
+    Collects the text of the spans pdfminer's HTMLConverter writes for a page: one per run of characters in the
+    same font within a text box, and an empty one for the page border and every curve
+    """
+
+    def __init__(self):
+        self.spans: typing.List[typing.List[str]] = []
+        self._font = None
+        self._span = None
+        self._stack = []
+
+    def render(self, item):
+        if isinstance(item, LTPage):
+            self.spans.append([])
+            for child in item:
+                self.render(child)
+        elif isinstance(item, LTCurve):
+            self.spans.append([])
+        elif isinstance(item, (LTFigure, LTTextBox)):
+            self._stack.append((self._font, self._span))
+            self._font = self._span = None
+            for child in item:
+                self.render(child)
+            self._font, self._span = self._stack.pop()
+        elif isinstance(item, LTTextLine):
+            for child in item:
+                self.render(child)
+        elif isinstance(item, LTChar):
+            font = (item.fontname, item.size)
+            if font != self._font:
+                self._font = font
+                self._span = len(self.spans)
+                self.spans.append([])
+            self.spans[self._span].append(item.get_text())
+        elif isinstance(item, LTText) and self._span is not None:
+            self.spans[self._span].append(item.get_text())
+
+
+def extract_spans(pdf: bytes, max_pages: int = MAX_PAGES) -> typing.List[str]:
+    """
+    Return the text of the pdf's spans, stopping after the first page past the order table. At most max_pages
+    pages are analysed, 0 for all of them
+    """
+    collector = _SpanCollector()
+    found_table = False
+    pages = 0
+    for page in pdfminer.high_level.extract_pages(io.BytesIO(pdf), laparams=LAPARAMS, maxpages=max_pages):
+        pages += 1
+        start = len(collector.spans)
+        collector.render(page)
+        texts = ["".join(span) for span in collector.spans[start:]]
+        has_labels = any(label in text for text in texts for label in TABLE_LABELS)
+        if found_table and not has_labels and not any(patterns.BESTBUY_AMOUNT.fullmatch(text) for text in texts):
+            break
+        found_table = found_table or has_labels
+    else:
+        if max_pages and pages == max_pages:
+            logger.log(logging.WARNING, f"Only the first {max_pages} pages of a Best Buy invoice were analysed, "
+                                        f"its items may be cut off")
+    return ["".join(span) for span in collector.spans]
+
 
 class BestBuyReader:
 
-    def save_attachment(self, msg):
+    def __init__(self, executor: Executor = None, max_pages: int = MAX_PAGES):
+        """
+
+        Parameters
+        ----------
+        executor: Executor
+        Extracts the pdfs of an email in parallel, e.g. a ProcessPoolExecutor. None extracts them inline
+        max_pages: int
+        How many pages of a pdf are analysed at most, 0 for all of them
         """
-        Given a message, save its attachments to the specified
-        download folder (default is /tmp)
+        self.executor = executor
+        self.max_pages = max_pages
+
+    def __getstate__(self):
+        # The executor stays in this process, a copy sent to a worker extracts inline
+        state = self.__dict__.copy()
+        state["executor"] = None
+        return state
 
-        return: file path to attachment
+    def save_attachment(self, msg):
+        """
+        Given a message, parse the order out of its pdf attachments
         """
         files = {}
         for part in msg.walk():
             if part.get_content_maintype() == 'multipart':
                 continue
-            if part.get('Content-Disposition') is None:
-                continue
-            filename = part.get_filename()
-            try:
-                fp = io.BytesIO(part.get_payload(decode=True))
-                fp.seek(0)
-                files[filename] = fp
-            except Exception as e:
-                print(e)
+            if part.get('Content-Disposition') is None or not is_pdf(part):
                 continue
+            payload = part.get_payload(decode=True)
+            if payload:
+                files[part.get_filename()] = payload
         if len(files) == 0:
             return {}
-        converted_data = self.extract_text(files=files, output_type="html")
-        return self.parse_pdf(converted_data)
-
-    def extract_text(self, files=None,
-                     _py2_no_more_posargs=None,  # Bloody Python2 needs a shim
-                     no_laparams=False, all_texts=None, detect_vertical=None,  # LAParams
-                     word_margin=None, char_margin=None, line_margin=None, boxes_flow=None,  # LAParams
-                     output_type='text', codec='utf-8', strip_control=False,
-                     maxpages=0, page_numbers=None, password="", scale=1.0, rotation=0,
-                     layoutmode='normal', output_dir=None, debug=False,
-                     disable_caching=False, **other):
-        if _py2_no_more_posargs is not None:
-            raise ValueError("Too many positional arguments passed.")
-        if not files:
-            raise ValueError("Must provide files to work upon!")
-
-        # If any LAParams group arguments were passed, create an LAParams object and
-        # populate with given args. Otherwise, set it to None.
-        if not no_laparams:
-            laparams = pdfminer.layout.LAParams()
-            for param in ("all_texts", "detect_vertical", "word_margin", "char_margin", "line_margin", "boxes_flow"):
-                paramv = locals().get(param, None)
-                if paramv is not None:
-                    setattr(laparams, param, paramv)
+        if self.executor is not None:
+            pages = list(self.executor.map(extract_spans, files.values(), itertools.repeat(self.max_pages)))
         else:
-            laparams = None
+            pages = [extract_spans(pdf, self.max_pages) for pdf in files.values()]
+        return self.parse_pdf(pages)
 
-        imagewriter = None
-        if output_dir:
-            imagewriter = ImageWriter(output_dir)
-
-        out_files = []
-
-        for fname, fdata in files.items():
-            file = io.BytesIO()
-            pdfminer.high_level.extract_text_to_fp(fdata, file, **locals())
-            file.seek(0)
-            out_files.append(file)
-        return out_files
-
-    def bs4method(self, raw_data):
-        soup = BeautifulSoup(raw_data, "lxml")
-        all_spans = soup.find_all("span")
+    def parse_spans(self, spans: typing.List[str]) -> Order:
         quantities = []
         items = []
         prices = []
@@ -90,49 +152,41 @@ class BestBuyReader:
         cart = []
         item_name = None
         order_date = None
-        order_discount = 0.00
-        discounts = set(re.findall("-CDN\$\s.*", raw_data))
-        for discount in discounts:
-            try:
-                amount = float(discount[6:])
-            except:
-                amount = 0
-            order_discount += amount
+        order_discount = patterns.get_discount("".join(spans))
 
-        for index, data in enumerate(all_spans):
+        for index, text in enumerate(spans):
             if index == 0:
                 continue
             else:
-                if "Order Number" in all_spans[index - 1].text:
-                    order_number = re.search(r'(\d*)', data.text).group(0)
-                elif "Qty" in all_spans[index - 1].text:
-                    for qty in re.findall(r"\d+", data.text):
+                if "Order Number" in spans[index - 1]:
+                    order_number = re.search(r'(\d*)', text).group(0)
+                elif "Qty" in spans[index - 1]:
+                    for qty in re.findall(r"\d+", text):
                         quantities.append(int(qty))
-                elif "Product Description" in data.text or "Product Description" in all_spans[index - 1].text:
+                elif "Product Description" in text or "Product Description" in spans[index - 1]:
                     if item_name is not None:
                         continue
                     try:
-                        tmp_items = re.findall(r"(?s)\n(.*?)\n", data.text)
-                        text = data.text.split("\n")
+                        tmp_items = re.findall(r"(?s)\n(.*?)\n", text)
+                        lines = text.split("\n")
                         if not tmp_items:
                             raise Exception
                         if tmp_items:
                             item_name = tmp_items[0]
-                        if "Product Description" in text:
+                        if "Product Description" in lines:
                             item_name = tmp_items[0]
                             raise Exception
-                        items.extend(t for t in data.text.split("\n") if t)
+                        items.extend(t for t in text.split("\n") if t)
                     except:
-                        if data.text.strip("\n") in ["Product Description", "Payment Information", "Serial Number"]:
+                        if text.strip("\n") in ["Product Description", "Payment Information", "Serial Number"]:
                             continue
-                        item_name = html.unescape(
-                            item_name.strip("\n") if item_name is not None else data.text.strip("\n"))
+                        item_name = item_name.strip("\n") if item_name is not None else text.strip("\n")
                         items.append(item_name)
-                elif "Order Date" in data.text:
-                    order_date = datetime.datetime.strptime(data.text.strip("\n"),
+                elif "Order Date" in text:
+                    order_date = datetime.datetime.strptime(text.strip("\n"),
                                                             "Order Date: %d-%b-%Y %I:%M:%S %p (PST)")
-                elif "Total\n" == all_spans[index - 1].text:
-                    for total in re.findall(r"\d+.\d+", data.text):
+                elif "Total\n" == spans[index - 1]:
+                    for total in re.findall(r"\d+.\d+", text):
                         prices.append(float(total.replace(",", "")))
 
         for item, quantity, price in zip(items, quantities, prices):
@@ -142,19 +196,73 @@ class BestBuyReader:
                 unit_price = float(price)
             cart.append(Item(item, unit_price, quantity, order_number))
 
-        return Order(order_number, order_date, Stores.BESTBUYCA, cart,discount=order_discount)
+        return Order(order_number, order_date, Stores.BESTBUYCA, cart, discount=order_discount)
 
-    def parse_pdf(self, files: list):
+    def parse_pdf(self, files: typing.List[typing.List[str]]):
         items = []
         order_date = None
         order_number = None
-        for file in files:
-            raw_data = file.read().decode("utf-8")
-            data = self.bs4method(raw_data)
+        order_discount = 0.00
+        for spans in files:
+            data = self.parse_spans(spans)
             if order_date is None:
                 order_date = data.purchased
             if order_number is None:
                 order_number = data.id
+            order_discount += data.discount
             items.extend(data.cart)
 
-        return Order(order_number, order_date, Stores.BESTBUYCA, items)
+        return Order(order_number, order_date, Stores.BESTBUYCA, items, discount=order_discount)
+
+    def extract_text(self, files: typing.Dict[str, typing.BinaryIO] = None,
+                     _py2_no_more_posargs=None,  # Bloody Python2 needs a shim
+                     no_laparams=False, all_texts=None, detect_vertical=None,  # LAParams
+                     word_margin=None, char_margin=None, line_margin=None, boxes_flow=None,  # LAParams
+                     output_type='text', codec='utf-8', strip_control=False,
+                     maxpages=0, page_numbers=None, password="", scale=1.0, rotation=0,
+                     layoutmode='normal', output_dir=None, debug=False,
+                     disable_caching=False, **other) -> typing.List[io.BytesIO]:
+        """
+        Convert every pdf with pdfminer's extract_text_to_fp, e.g. to the HTML bs4method reads. save_attachment
+        walks pdfminer's layout objects instead and no longer uses it
+        """
+        if _py2_no_more_posargs is not None:
+            raise ValueError("Too many positional arguments passed.")
+        if not files:
+            raise ValueError("Must provide files to work upon!")
+
+        # If any LAParams group arguments were passed, create an LAParams object and
+        # populate with given args. Otherwise, set it to None.
+        if not no_laparams:
+            laparams = pdfminer.layout.LAParams()
+            for param, value in (("all_texts", all_texts), ("detect_vertical", detect_vertical),
+                                 ("word_margin", word_margin), ("char_margin", char_margin),
+                                 ("line_margin", line_margin), ("boxes_flow", boxes_flow)):
+                if value is not None:
+                    setattr(laparams, param, value)
+        else:
+            laparams = None
+
+        out_files = []
+        for fdata in files.values():
+            file = io.BytesIO()
+            pdfminer.high_level.extract_text_to_fp(fdata, file, output_type=output_type, codec=codec,
+                                                   laparams=laparams, maxpages=maxpages, page_numbers=page_numbers,
+                                                   password=password, scale=scale, rotation=rotation,
+                                                   layoutmode=layoutmode, output_dir=output_dir,
+                                                   strip_control=strip_control, debug=debug,
+                                                   disable_caching=disable_caching, **other)
+            file.seek(0)
+            out_files.append(file)
+        return out_files
+
+    def bs4method(self, raw_data: str) -> Order:
+        """
+        Parse the order out of the HTML of a pdf converted by extract_text
+        """
+        try:
+            from bs4 import BeautifulSoup
+        except ImportError:
+            raise ImportError("beautifulsoup4 not found, install email_scrapper[bs4] to parse the HTML of extract_text")
+        soup = BeautifulSoup(raw_data, "lxml")
+        return self.parse_spans([span.text for span in soup.find_all("span")])
@@ -2,15 +2,15 @@ import datetime
 import html
 import re
 
-from bs4 import BeautifulSoup
-
 from email_scrapper.models import Order, Item, Stores
+from email_scrapper.stores import markup, patterns
 
-global_remover = re.compile("(=(?<==)(.*?)(?=\\s))", flags=re.DOTALL)
+PARSER_VERSION = 3
 
 
 def parse_ebgames_email(email):
-    soup = BeautifulSoup(str(email), "lxml")
+    html_body = markup.get_html(email)
+    tree = markup.parse_html(html_body)
     email_date = email.get("date")
     try:
 
@@ -23,28 +23,21 @@ def parse_ebgames_email(email):
     quantities = []
     prices = []
     cart = []
-    all_td_tags = soup.find_all("td")
-    all_p_tags = soup.find_all("p")
-    order_discount = 0.00
-    discounts = set(re.findall("-CDN\$\s.*", str(email)))
-    for discount in discounts:
-        try:
-            amount = float(discount[6:])
-        except:
-            amount = 0
-        order_discount += amount
-    for row in all_p_tags[2:]:
-        if "Order number" in row.text:
-            first_search = re.search(r"(?s)=0A(.*?)\|", row.text) or re.search(r"(?<=\=0A)(.*?)(?=\=7C)", row.text)
+    all_td_tags = tree.iter("td")
+    all_p_tags = markup.texts(tree.iter("p"))
+    order_discount = patterns.get_discount(html_body)
+    for row in all_p_tags[1:]:
+        if "Order number" in row:
+            first_search = re.search(r"(?s)\n(.*?)\|", row)
             order_number = re.search(r"(\d{2,})", first_search.group(0))
             if order_number is not None:
                 order_number = order_number.group(0)
     for index, row in enumerate(all_td_tags):
-        text = html.unescape(row.text)
+        text = html.unescape(row.text_content())
         if index - 5 == 0:
             continue
         elif index - 5 == 1:
-            items.append(re.sub(global_remover, "", text))
+            items.append(text)
         elif index - 5 == 2:
             continue
         elif index - 5 == 3:
@@ -53,9 +46,7 @@ def parse_ebgames_email(email):
             except:
                 quantities.append(1)
         elif index - 5 == 4:
-            _ = re.sub("=2E", ".", text)
-            _ = re.sub(global_remover, "", _)
-            prices.append(float(re.sub("\\n", "", _)))
+            prices.append(float(re.sub("\\n", "", text)))
 
     for item, quantity, price in zip(items, quantities, prices):
         try:
@@ -2,16 +2,18 @@ import datetime
 import html
 import re
 
-from bs4 import BeautifulSoup
-
+from email_scrapper import utils
 from email_scrapper.models import Order, Item, Stores
+from email_scrapper.stores import markup, patterns
 
-global_remover = re.compile("(=(?<==)(.*?)(?=\\s))", flags=re.DOTALL)
+PARSER_VERSION = 3
 
 
 def parse_lego_email(email) -> Order:
-    soup = BeautifulSoup(str(email), "lxml")
-    if re.search("Order Confirmation", soup.text):
+    html_body = markup.get_html(email)
+    tree = markup.parse_html(html_body)
+    if re.search("Order Confirmation", utils.get_header(email, "Subject")) or \
+            re.search("Order Confirmation", tree.text_content()):
         email_date = email.get("date")
         try:
 
@@ -23,17 +25,10 @@ def parse_lego_email(email) -> Order:
         cart = []
         prices = []
         quantites = []
-        order_discount = 0.00
-        discounts = set(re.findall("-CDN\$\s.*", str(email)))
-        for discount in discounts:
-            try:
-                amount = float(discount[6:])
-            except:
-                amount = 0
-            order_discount += amount
-        all_td_tags = soup.find_all("td")
+        order_discount = patterns.get_discount(html_body)
+        all_td_tags = tree.iter("td")
         for index, data in enumerate(all_td_tags):
-            text = re.sub("\t", "", html.unescape(data.text))
+            text = re.sub("\t", "", html.unescape(data.text_content()))
             if index in [1, 2, 3, 4]:
                 continue
             if "Order Number" in text:
@@ -41,22 +36,19 @@ def parse_lego_email(email) -> Order:
                 order_number = first_search.group(0)
                 break
 
-        item_names = soup.find_all("td", attrs={"class": "3D=22padT15=22"})
+        item_names = markup.texts(tree.xpath(markup.with_class("td", "padT15")))
         for item in item_names:
-            name = re.sub(global_remover, "", item.text)
-            name = re.sub("\n", "", name)
-            name = " ".join([r.group(0) for r in re.finditer("(\d*?\w+)", name)])
+            name = re.sub("\n", "", item)
+            name = " ".join([r.group(0) for r in patterns.LEGO_ITEM_WORD.finditer(name)])
             items.append(name)
             continue
-        item_prices = soup.find_all("td", attrs={"class": "3D=22w50pc"})
+        item_prices = markup.texts(tree.xpath(markup.with_class("td", "w50pc")))
         for price in item_prices:
-            text = price.text
+            text = price
             if re.search("Qty", text):
-                quantites.append(re.search(r"\d+", text).group(0))
+                quantites.append(patterns.DIGITS.search(text).group(0))
                 continue
-            _ = re.sub("=2E", ".", text)
-            _ = re.sub(global_remover, "", _)
-            item_price = re.search("(\d+.\d+)", _)
+            item_price = patterns.PRICE.search(text)
             prices.append(float(item_price.group(0)))
 
         for item, quantity, price in zip(items, quantites, prices):
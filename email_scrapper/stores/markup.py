@@ -0,0 +1,81 @@
+import typing
+from email.message import Message
+
+import chardet
+import lxml.html
+
+EMPTY_DOCUMENT = "<html></html>"
+
+
+def get_html_part(message: Message) -> typing.Optional[Message]:
+    """
+    Returns
+    -------
+    The first text/html part of the message, or its first text part when there is no html
+    """
+    text_parts = [part for part in message.walk() if part.get_content_maintype() == "text"]
+    html_parts = [part for part in text_parts if part.get_content_subtype() == "html"]
+    for part in html_parts or text_parts[:1]:
+        return part
+    return None
+
+
+def get_html(message: Message) -> str:
+    """
+    Returns
+    -------
+    The html part of the message (see get_html_part) with the transfer encoding and charset decoded. An empty
+    string when the message has no text part
+    """
+    part = get_html_part(message)
+    if part is None:
+        return ""
+    return decode_part(part)
+
+
+def decode_part(part: Message) -> str:
+    """
+    Undo the part's transfer encoding (quoted-printable, base64) and decode it with its declared charset.
+    When the charset is missing, unknown or wrong chardet guesses it instead.
+    """
+    payload = part.get_payload(decode=True) or b""
+    charset = part.get_content_charset()
+    if charset:
+        try:
+            return payload.decode(charset)
+        except (LookupError, UnicodeDecodeError):
+            pass
+    try:
+        return payload.decode("utf-8")
+    except UnicodeDecodeError:
+        pass
+    detected = chardet.detect(payload).get("encoding") or "utf-8"
+    try:
+        return payload.decode(detected, errors="replace")
+    except LookupError:
+        return payload.decode("utf-8", errors="replace")
+
+
+def parse_html(markup: str) -> lxml.html.HtmlElement:
+    """
+    Build an lxml tree of the html. This is the same parser BeautifulSoup(markup, "lxml") sits on, without the
+    cost of converting every node into a python object
+    """
+    if not markup.strip():
+        markup = EMPTY_DOCUMENT
+    try:
+        return lxml.html.document_fromstring(markup)
+    except ValueError:
+        # Unicode strings with an encoding declaration, which lxml refuses
+        return lxml.html.document_fromstring(markup.encode("utf-8"))
+
+
+def with_class(tag: str, class_name: str) -> str:
+    """
+    XPath selecting every tag having class_name among its classes, like soup.find_all(tag, attrs={"class": ...})
+    """
+    return f"//{tag}[contains(concat(' ', normalize-space(@class), ' '), ' {class_name} ')]"
+
+
+def texts(elements: typing.Iterable[lxml.html.HtmlElement]) -> typing.List[str]:
+    return [element.text_content() for element in elements]
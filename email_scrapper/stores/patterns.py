@@ -0,0 +1,39 @@
+"""
+Precompiled regular expressions shared by the store parsers
+"""
+import re
+
+DISCOUNT = re.compile(r"-CDN\$\s.*")
+WALMART_DISCOUNT = re.compile(r"-CDN\$ .*")
+PRICE = re.compile(r"(\d+.\d+)")
+CDN_PRICE = re.compile(r"CDN\$ \d+\.\d+")
+QUANTITY = re.compile(r"\d+(?=[Xx])")
+QUANTITY_PREFIX = re.compile(r"\d+[Xx]")
+WHITESPACE_RUN = re.compile(r"\s{2,}")
+TAG = re.compile(r"<.*?>")
+DIGITS = re.compile(r"\d+")
+
+AMAZON_ORDER_NUMBER = re.compile(r"(?<=Order\s#)(\d*-\d*-\d*)")
+AMAZON_SOLD = re.compile(r"Sold")
+AMAZON_ITEM_NAME = re.compile(r"(\dx)(?<=\dx)(.*)(?=Sold)")
+AMAZON_ITEM_COUNT_PREFIX = re.compile(r"\d+x")
+AMAZON_SOLD_BY = re.compile(r"Sold by Amazon\.com\.ca, [Ii]nc\. ?")
+
+LEGO_ITEM_WORD = re.compile(r"(\d*?\w+)")
+
+# A span holding nothing but an amount, e.g. a cell of the Total column of a Best Buy invoice
+BESTBUY_AMOUNT = re.compile(r"\s*\$?[\d,]+\.\d{2}\s*")
+
+
+def get_discount(text: str, pattern: "re.Pattern" = DISCOUNT) -> float:
+    """
+    Sum of the distinct "-CDN$ 5.00" style discounts found in the text
+    """
+    order_discount = 0.00
+    for discount in set(pattern.findall(text)):
+        try:
+            amount = float(discount[6:])
+        except ValueError:
+            amount = 0
+        order_discount += amount
+    return order_discount
@@ -1,4 +1,7 @@
+import email
 import typing
+from email.header import decode_header, make_header
+from email.message import Message
 
 from email_scrapper.models import Stores, StoreEmail, Order
 
@@ -16,6 +19,58 @@ def get_store_email(store: Stores) -> StoreEmail:
 
 
 def store_to_dict(store_data: typing.List["Order"]) -> list:
+    """
+    Nested dicts of the orders. To write many orders to a file use :mod:`email_scrapper.export`, which streams
+    them into flat tables instead
+    """
     if store_data:
-        return [dict(order) for order in store_data]
+        return [order.to_dict() for order in store_data]
     return []
+
+
+def chunked(iterable: typing.Iterable, size: int) -> typing.Iterator[list]:
+    chunk = []
+    for entry in iterable:
+        chunk.append(entry)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def compress_uids(uids: typing.Iterable[typing.Union[bytes, str, int]]) -> str:
+    """
+    Collapse a list of IMAP UIDs into a UID set, e.g. [101, 102, 103, 300] -> "101:103,300"
+    """
+    numbers = sorted(set(int(uid) for uid in uids))
+    ranges = []
+    for number in numbers:
+        if ranges and ranges[-1][1] == number - 1:
+            ranges[-1][1] = number
+        else:
+            ranges.append([number, number])
+    return ",".join(str(start) if start == end else f"{start}:{end}" for start, end in ranges)
+
+
+def message_from_bytes(raw_email: typing.Union[bytes, memoryview]) -> Message:
+    """
+    Same as email.message_from_bytes, which decodes the bytes this way, but also takes a memoryview without
+    copying it to bytes first
+    """
+    return email.message_from_string(str(raw_email, "ascii", "surrogateescape"))
+
+
+def get_header(message: Message, name: str) -> str:
+    """
+    Returns
+    -------
+    The decoded value of the header, or an empty string when the message doesn't have it
+    """
+    value = message.get(name)
+    if value is None:
+        return ""
+    try:
+        return str(make_header(decode_header(value)))
+    except (UnicodeDecodeError, LookupError, ValueError):
+        return str(value)
@@ -8,8 +8,10 @@ with open("README.md", "r") as fh:
 with open('requirements.txt') as f:
     requirements = f.read().splitlines()
 
-extra_requires = {
-    "gmail": ["google-api-python-client"]
+extras_require = {
+    "bs4": ["beautifulsoup4"],
+    "gmail": ["google-api-python-client"],
+    "parquet": ["pyarrow"]
 }
 
 setuptools.setup(
@@ -20,9 +22,9 @@ setuptools.setup(
     long_description=long_description,
     long_description_content_type="text/markdown",
     url="https://github.com/LucasCLuk/email-scrapper",
-    packages=setuptools.find_packages(),
+    packages=setuptools.find_packages(exclude=["benchmarks", "benchmarks.*", "tests", "tests.*"]),
     install_requires=requirements,
-    extra_requires=extra_requires,
+    extras_require=extras_require,
     classifiers=[
         "Programming Language :: Python :: 3.6",
         "License :: OSI Approved :: MIT License",
@@ -0,0 +1,104 @@
+"""
+A stand-in for the googleapiclient Gmail service that serves a list of raw emails and fails chosen requests
+"""
+import base64
+import email
+import typing
+
+import httplib2
+from googleapiclient import errors
+
+
+def http_error(status: int, reason: str = "") -> errors.HttpError:
+    content = f'{{"error": {{"code": {status}, "errors": [{{"reason": "{reason}"}}]}}}}'.encode()
+    return errors.HttpError(httplib2.Response({"status": status}), content)
+
+
+class Request:
+
+    def __init__(self, service: "GmailService", message_id: typing.Optional[str], execute: typing.Callable):
+        self._service = service
+        self.message_id = message_id
+        self._execute = execute
+
+    def execute(self):
+        failures = self._service.failures.get(self.message_id)
+        if failures:
+            raise failures.pop(0)
+        return self._execute()
+
+
+class BatchRequest:
+
+    def __init__(self, service: "GmailService", callback: typing.Callable):
+        self._service = service
+        self._callback = callback
+        self._requests = []
+
+    def add(self, request: Request, request_id: str = None):
+        self._requests.append((request_id, request))
+
+    def execute(self):
+        self._service.batches.append([request_id for request_id, request in self._requests])
+        for request_id, request in self._requests:
+            try:
+                response = request.execute()
+            except errors.HttpError as error:
+                self._callback(request_id, None, error)
+            else:
+                self._callback(request_id, response, None)
+
+
+class GmailService:
+    """
+    ``failures`` maps a message id to the errors its next requests raise, one per request. ``batches`` holds the
+    message ids of every batch HTTP request
+    """
+
+    def __init__(self, messages: typing.List[bytes], history_id: str = "100"):
+        self.emails = {f"m{index:04d}": raw for index, raw in enumerate(messages)}
+        self.history_id = history_id
+        # The ids history().list returns for a startHistoryId
+        self.added_since: typing.Dict[str, typing.List[str]] = {}
+        self.failures: typing.Dict[typing.Optional[str], typing.List[errors.HttpError]] = {}
+        self.batches: typing.List[typing.List[str]] = []
+
+    def users(self):
+        return self
+
+    def messages(self):
+        return self
+
+    def getProfile(self, userId: str):
+        return Request(self, None, lambda: {"emailAddress": "buyer@example.com", "historyId": self.history_id})
+
+    def history(self):
+        return self
+
+    def list(self, userId: str, q: str = None, maxResults: int = 100, pageToken: str = None,
+             startHistoryId: str = None, historyTypes: str = None):
+        def execute():
+            if startHistoryId is not None:
+                return {"history": [{"messagesAdded": [{"message": {"id": message_id}}]}
+                                    for message_id in self.added_since.get(startHistoryId, [])]}
+            sender = q.split()[0][len("from:"):]
+            ids = [message_id for message_id, raw in sorted(self.emails.items())
+                   if sender in email.message_from_bytes(raw)["From"]]
+            start = int(pageToken or 0)
+            response = {"messages": [{"id": message_id} for message_id in ids[start:start + maxResults]]}
+            if start + maxResults < len(ids):
+                response["nextPageToken"] = str(start + maxResults)
+            return response
+
+        return Request(self, "list", execute)
+
+    def get(self, userId: str, id: str, format: str = "raw", metadataHeaders: typing.List[str] = None):
+        def execute():
+            if id not in self.emails:
+                raise http_error(404, "notFound")
+            return {"id": id, "raw": base64.urlsafe_b64encode(self.emails[id]).decode()}
+
+        return Request(self, id, execute)
+
+    def new_batch_http_request(self, callback: typing.Callable = None) -> BatchRequest:
+        return BatchRequest(self, callback)
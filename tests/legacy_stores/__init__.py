@@ -0,0 +1,4 @@
+"""
+The BeautifulSoup store parsers as they were before they were rewritten over lxml, kept unchanged so the current
+parsers can be checked against them
+"""
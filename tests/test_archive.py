@@ -0,0 +1,64 @@
+import datetime
+
+import pytest
+
+from benchmarks import corpus
+from benchmarks.imap_server import ImapServer
+from email_scrapper.archive import MessageArchive
+from email_scrapper.models import Stores
+from email_scrapper.readers import LocalArchiveReader, SmtpReader
+
+
+def amazon_emails(count: int) -> list:
+    return [corpus.amazon_email(1, corpus.order_number(Stores.AMAZONCA, i)) for i in range(count)]
+
+
+def test_messages_are_read_back_at_their_offsets(tmp_path):
+    raw_emails = amazon_emails(3)
+    with MessageArchive(str(tmp_path)) as archive:
+        for i, raw_email in enumerate(raw_emails):
+            assert archive.put("user", Stores.AMAZONCA, f"key{i}", raw_email)
+        assert not archive.put("user", Stores.AMAZONCA, "key0", raw_emails[1])
+        assert archive.keys(Stores.AMAZONCA) == ["key0", "key1", "key2"]
+        assert [(key, bytes(raw_email)) for key, raw_email in
+                archive.iter_messages(Stores.AMAZONCA, ["key2", "key0", "missing"])] == \
+               [("key0", raw_emails[0]), ("key2", raw_emails[2])]
+        assert bytes(archive.get(Stores.AMAZONCA, "key1", account="user")) == raw_emails[1]
+        assert archive.get(Stores.AMAZONCA, "key1", account="other") is None
+        assert ("user", Stores.AMAZONCA, "key1") in archive
+        assert len(archive) == 3
+
+
+def test_keys_filter_by_date_and_subject(tmp_path):
+    with MessageArchive(str(tmp_path)) as archive:
+        archive.put("user", Stores.AMAZONCA, "order", amazon_emails(1)[0])
+        assert archive.keys(Stores.AMAZONCA, subject="ORDER") == ["order"]
+        assert archive.keys(Stores.AMAZONCA, subject="refund") == []
+        assert archive.keys(Stores.AMAZONCA, date_from=datetime.datetime(2000, 1, 1)) == ["order"]
+        assert archive.keys(Stores.AMAZONCA, date_from=datetime.datetime(2100, 1, 1)) == []
+        assert archive.keys(Stores.WALMART) == []
+
+
+def test_reopened_archive_keeps_its_index(tmp_path):
+    raw_emails = amazon_emails(3)
+    with MessageArchive(str(tmp_path)) as archive:
+        archive.put("user", Stores.AMAZONCA, "key0", raw_emails[0])
+        archive.put("user", Stores.AMAZONCA, "key1", raw_emails[1])
+    with MessageArchive(str(tmp_path)) as archive:
+        assert not archive.put("user", Stores.AMAZONCA, "key1", raw_emails[1])
+        assert archive.put("user", Stores.AMAZONCA, "key2", raw_emails[2])
+        assert [bytes(raw_email) for key, raw_email in
+                archive.iter_messages(Stores.AMAZONCA, archive.keys(Stores.AMAZONCA))] == raw_emails
+
+
+@pytest.mark.parametrize("processes", [0, 2])
+def test_local_archive_reader_matches_the_live_reader(tmp_path, processes):
+    with ImapServer(corpus.mailbox(2, 3)) as server, MessageArchive(str(tmp_path)) as archive:
+        expected = SmtpReader("user", "password", settings=server.settings, email_address=corpus.USER_EMAIL,
+                              use_ssl=False, archive=archive).run()
+        orders = LocalArchiveReader(archive, user_email=corpus.USER_EMAIL, processes=processes).run()
+    assert len(expected) == 10
+    assert [(order.id, order.store, order.purchased, [(item.name, item.quantity) for item in order.cart])
+            for order in orders] == \
+           [(order.id, order.store, order.purchased, [(item.name, item.quantity) for item in order.cart])
+            for order in expected]
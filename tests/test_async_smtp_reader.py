@@ -0,0 +1,94 @@
+import asyncio
+import time
+
+import pytest
+
+from benchmarks import corpus
+from benchmarks.imap_server import ImapServer
+from email_scrapper.models import Stores
+from email_scrapper.readers import AsyncSmtpReader, SmtpReader
+from email_scrapper.state import MemoryStateStore
+from email_scrapper.stores import amazon
+
+
+def make_reader(server: ImapServer, **kwargs) -> AsyncSmtpReader:
+    return AsyncSmtpReader("user", "password", settings=server.settings, email_address=corpus.USER_EMAIL,
+                           use_ssl=False, **kwargs)
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+async def collect(events) -> list:
+    return [event async for event in events]
+
+
+@pytest.fixture
+def server():
+    with ImapServer([corpus.amazon_email(2, corpus.order_number(Stores.AMAZONCA, i)) for i in range(5)]) as server:
+        yield server
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_run_matches_smtp_reader(workers):
+    with ImapServer(corpus.mailbox(2, 3)) as server:
+        expected = SmtpReader("user", "password", settings=server.settings, email_address=corpus.USER_EMAIL,
+                              use_ssl=False).run()
+        orders = run(make_reader(server, workers=workers).run())
+    assert [(order.id, len(order.cart)) for order in orders] == \
+           [(order.id, len(order.cart)) for order in expected]
+    assert len(orders) == 10
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_iter_orders_saves_the_checkpoint(server, workers):
+    state_store = MemoryStateStore()
+    events = run(collect(make_reader(server, state_store=state_store, workers=workers).iter_orders()))
+    assert len(events) == 5
+    assert state_store.get(f"SmtpReader:{corpus.USER_EMAIL}:AMAZONCA")["last_uid"] == 5
+    assert run(collect(make_reader(server, state_store=state_store, workers=workers).iter_orders())) == []
+
+
+def test_slow_parser_does_not_block_the_event_loop(server):
+    def slow_parser(message):
+        time.sleep(0.05)
+        return amazon.get_data(message)
+
+    async def scrape_and_tick():
+        reader = make_reader(server)
+        reader._store_processors[Stores.AMAZONCA] = (slow_parser, None)
+        ticks = 0
+        scrape = asyncio.ensure_future(collect(reader.iter_orders()))
+        while not scrape.done():
+            ticks += 1
+            await asyncio.sleep(0.01)
+        return await scrape, ticks
+
+    events, ticks = run(scrape_and_tick())
+    assert len(events) == 5
+    assert ticks >= 10
+
+
+def test_every_store_of_a_folder_saves_the_folder_checkpoint():
+    messages = corpus.mailbox(2, 1, stores=[Stores.AMAZONCA, Stores.WALMART, Stores.LEGOCA])
+    with ImapServer(messages) as server:
+        state_store = MemoryStateStore()
+        assert len(run(make_reader(server, state_store=state_store).run())) == 6
+        for store in (Stores.AMAZONCA, Stores.WALMART, Stores.LEGOCA):
+            assert state_store.get(f"SmtpReader:{corpus.USER_EMAIL}:{store.name}")["last_uid"] == 6
+
+
+def test_partial_fetch_matches_smtp_reader():
+    with ImapServer(corpus.mailbox(2, 3)) as server:
+        expected = SmtpReader("user", "password", settings=server.settings, email_address=corpus.USER_EMAIL,
+                              use_ssl=False, partial_fetch=True).run()
+        orders = run(make_reader(server, partial_fetch=True, fetch_batch_size=3).run())
+        full = run(make_reader(server).run())
+    assert [(order.id, len(order.cart)) for order in orders] == \
+           [(order.id, len(order.cart)) for order in expected] == \
+           [(order.id, len(order.cart)) for order in full]
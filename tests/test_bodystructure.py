@@ -0,0 +1,27 @@
+import pytest
+
+from email_scrapper import bodystructure
+
+
+def test_parse_bodystructure():
+    root = bodystructure.parse_bodystructure(
+        b'1 (UID 5 BODYSTRUCTURE (("text" "html" ("charset" "utf-8") NIL NIL "quoted-printable" 120 4 NIL NIL NIL)'
+        b'("application" "pdf" ("name" {9}\r\ninv"1.pdf) NIL NIL "base64" 300 NIL ("attachment" NIL) NIL)'
+        b' "mixed" ("boundary" "b") NIL NIL))')
+    assert root.content_type == "multipart/mixed"
+    assert [(part.section, part.content_type) for part in root.parts] == \
+           [("1", "text/html"), ("2", "application/pdf")]
+    assert root.parts[1].params["name"] == 'inv"1.pdf'
+    assert bodystructure.can_fetch_parts(root)
+
+
+@pytest.mark.parametrize("response", [
+    b'1 (UID 5 BODYSTRUCTURE (("text" "html" ("charset" "utf-8',
+    b'1 (UID 5 BODYSTRUCTURE ("text" "html" ("charset" "utf-8\\',
+    b'1 (UID 5 BODYSTRUCTURE ({5}',
+    b'1 (UID 5 BODYSTRUCTURE ({50}\r\ntext "html")',
+    b'1 (UID 5 BODYSTRUCTURE ("text" "html" NIL NIL NIL "7bit" 10 1',
+])
+def test_malformed_bodystructure_is_not_parsed(response):
+    assert bodystructure.parse_bodystructure(response) is None
+    assert not bodystructure.can_fetch_parts(None)
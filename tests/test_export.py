@@ -0,0 +1,95 @@
+import csv
+import datetime
+
+import pytest
+
+from email_scrapper import ArrowExporter, CsvExporter, export_orders
+from email_scrapper.models import Item, Order, Stores
+
+EASTERN = datetime.timezone(datetime.timedelta(hours=-4))
+
+
+@pytest.fixture
+def pa():
+    pyarrow = pytest.importorskip("pyarrow")
+    pytest.importorskip("pyarrow.ipc")
+    pytest.importorskip("pyarrow.parquet")
+    return pyarrow
+
+
+def make_orders(count: int, items: int = 1) -> list:
+    return [Order(f"T{i}", datetime.datetime(2020, 10, 12, 10, i, tzinfo=EASTERN), Stores.LEGOCA,
+                  [Item(f"Brick {i}.{j}", 10.5, j + 1, f"T{i}") for j in range(items)],
+                  tracking=f"1Z{i}" if i % 2 else None, shipped=bool(i % 2), discount=1.25)
+            for i in range(count)]
+
+
+def test_csv_round_trip(tmp_path):
+    orders_path, items_path = str(tmp_path / "orders.csv"), str(tmp_path / "items.csv")
+    exporter = export_orders(make_orders(2, items=2), orders_path, items_path)
+    assert (exporter.orders, exporter.items) == (2, 4)
+    with open(orders_path, newline="", encoding="utf-8") as f:
+        orders = list(csv.DictReader(f))
+    with open(items_path, newline="", encoding="utf-8") as f:
+        items = list(csv.DictReader(f))
+    # Aware dates are written in UTC
+    assert orders == [
+        {"order_id": "T0", "store": "LEGOCA", "purchased": "2020-10-12 14:00:00", "tracking": "", "shipped": "False",
+         "discount": "1.25"},
+        {"order_id": "T1", "store": "LEGOCA", "purchased": "2020-10-12 14:01:00", "tracking": "1Z1", "shipped": "True",
+         "discount": "1.25"}]
+    assert [(item["order_id"], item["name"], float(item["unit_price"]), int(item["quantity"])) for item in items] == \
+           [("T0", "Brick 0.0", 10.5, 1), ("T0", "Brick 0.1", 10.5, 2),
+            ("T1", "Brick 1.0", 10.5, 1), ("T1", "Brick 1.1", 10.5, 2)]
+
+
+def test_csv_without_items_table(tmp_path):
+    orders_path = str(tmp_path / "orders.csv")
+    with CsvExporter(orders_path) as exporter:
+        exporter.write_many(make_orders(3))
+    with open(orders_path, newline="", encoding="utf-8") as f:
+        assert len(list(csv.reader(f))) == 4
+
+
+def test_unknown_format(tmp_path):
+    with pytest.raises(ValueError):
+        export_orders(make_orders(1), str(tmp_path / "orders.xlsx"))
+
+
+@pytest.mark.parametrize("extension", ["parquet", "arrow"])
+def test_arrow_schema_and_types(pa, tmp_path, extension):
+    orders_path, items_path = str(tmp_path / f"orders.{extension}"), str(tmp_path / f"items.{extension}")
+    export_orders(make_orders(2), orders_path, items_path)
+    orders, items = read_table(pa, orders_path), read_table(pa, items_path)
+    assert orders.schema.equals(ArrowExporter.order_schema())
+    assert items.schema.equals(ArrowExporter.item_schema())
+    assert orders.column("purchased").to_pylist() == [datetime.datetime(2020, 10, 12, 14, 0),
+                                                      datetime.datetime(2020, 10, 12, 14, 1)]
+    assert orders.column("tracking").to_pylist() == [None, "1Z1"]
+    assert items.column("quantity").to_pylist() == [1, 1]
+
+
+@pytest.mark.parametrize("extension", ["parquet", "arrow"])
+def test_record_batches_are_flushed_at_the_batch_size(pa, tmp_path, extension):
+    orders_path = str(tmp_path / f"orders.{extension}")
+    with ArrowExporter(orders_path, file_format=extension, batch_size=2) as exporter:
+        for order in make_orders(5):
+            exporter.write(order)
+            # Nothing is left buffered once a batch is full
+            assert len(exporter._orders_table) == exporter.orders % 2
+    assert batch_sizes(pa, orders_path) == [2, 2, 1]
+
+
+def read_table(pa, path: str):
+    if path.endswith(".parquet"):
+        return pa.parquet.read_table(path)
+    with pa.ipc.open_file(path) as reader:
+        return reader.read_all()
+
+
+def batch_sizes(pa, path: str) -> list:
+    if path.endswith(".parquet"):
+        metadata = pa.parquet.ParquetFile(path).metadata
+        return [metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)]
+    with pa.ipc.open_file(path) as reader:
+        return [reader.get_batch(i).num_rows for i in range(reader.num_record_batches)]
@@ -0,0 +1,117 @@
+import pytest
+from googleapiclient import errors
+
+from benchmarks import corpus
+from email_scrapper.models import Stores
+from email_scrapper.readers import GmailReader
+from email_scrapper.state import MemoryStateStore
+from tests.fake_gmail import GmailService, http_error
+
+
+def make_reader(service: GmailService, **kwargs) -> GmailReader:
+    reader = GmailReader(service, user_email=corpus.USER_EMAIL, **kwargs)
+    reader.RETRY_DELAY = 0
+    return reader
+
+
+@pytest.fixture
+def service() -> GmailService:
+    return GmailService([corpus.amazon_email(2, corpus.order_number(Stores.AMAZONCA, i)) for i in range(8)])
+
+
+def test_default_batch_size_is_below_rate_limit():
+    assert GmailReader(None).batch_size == GmailReader.DEFAULT_BATCH_SIZE <= 50
+
+
+def test_rate_limited_messages_are_retried(service):
+    service.failures["m0002"] = [http_error(429, "rateLimitExceeded")]
+    service.failures["m0005"] = [http_error(403, "userRateLimitExceeded"), http_error(503)]
+    reader = make_reader(service, batch_size=4)
+    keys = reader.search_store_emails(Stores.AMAZONCA)
+    fetched = [key for key, raw_email in reader.fetch_store_emails(Stores.AMAZONCA, keys)]
+    assert fetched == keys
+    assert service.batches == [["m0000", "m0001", "m0002", "m0003"], ["m0002"],
+                               ["m0004", "m0005", "m0006", "m0007"], ["m0005"], ["m0005"]]
+
+
+def test_orders_of_retried_messages_are_kept(service):
+    service.failures["m0003"] = [http_error(429, "rateLimitExceeded")] * 2
+    orders = make_reader(service).run()
+    assert len(orders) == 8
+
+
+def test_retries_are_limited(service):
+    service.failures["m0001"] = [http_error(429, "rateLimitExceeded")] * (GmailReader.MAX_RETRIES + 1)
+    reader = make_reader(service)
+    with pytest.raises(errors.HttpError):
+        list(reader._get_messages(reader.search_store_emails(Stores.AMAZONCA), format="raw"))
+
+
+def test_other_errors_are_not_retried(service):
+    service.failures["m0001"] = [http_error(400, "invalidArgument")]
+    reader = make_reader(service)
+    with pytest.raises(errors.HttpError):
+        list(reader._get_messages(reader.search_store_emails(Stores.AMAZONCA), format="raw"))
+    assert len(service.batches) == 1
+
+
+def test_deleted_messages_are_skipped(service):
+    reader = make_reader(service)
+    keys = reader.search_store_emails(Stores.AMAZONCA)
+    del service.emails["m0004"]
+    assert [key for key, raw_email in reader.fetch_store_emails(Stores.AMAZONCA, keys)] == \
+        [key for key in keys if key != "m0004"]
+
+
+@pytest.mark.parametrize("batch_size", [1, 3])
+def test_single_and_batch_requests_retry(service, batch_size):
+    service.failures["m0000"] = [http_error(500)]
+    service.failures["list"] = [http_error(503)]
+    reader = make_reader(service, batch_size=batch_size)
+    keys = reader.search_store_emails(Stores.AMAZONCA)
+    assert [key for key, raw_email in reader.fetch_store_emails(Stores.AMAZONCA, keys)] == keys
+
+
+def test_workers_need_a_service_factory(service):
+    assert make_reader(service, workers=4).workers == 1
+    assert make_reader(service, workers=4, service_factory=lambda: service).workers == 4
+
+
+def test_every_worker_thread_gets_its_own_service(service):
+    services = []
+
+    def service_factory():
+        services.append(GmailService(list(service.emails.values())))
+        return services[-1]
+
+    orders = make_reader(service, workers=4, service_factory=service_factory).run()
+    assert len(orders) == 8
+    assert services and not service.batches
+
+
+def test_failed_fetch_keeps_the_checkpoint(service):
+    state_store = MemoryStateStore()
+    service.failures["m0006"] = [http_error(400, "invalidArgument")]
+    with pytest.raises(errors.HttpError):
+        make_reader(service, state_store=state_store).run()
+    assert state_store.get(f"GmailReader:{corpus.USER_EMAIL}:AMAZONCA") is None
+
+
+def test_failed_search_keeps_the_checkpoint(service):
+    state_store = MemoryStateStore()
+    make_reader(service, state_store=state_store).run()
+    key = f"GmailReader:{corpus.USER_EMAIL}:AMAZONCA"
+    assert state_store.get(key)["history_id"] == "100"
+    service.history_id = "200"
+    service.failures["list"] = [http_error(400, "invalidArgument")]
+    with pytest.raises(errors.HttpError):
+        make_reader(service, state_store=state_store).run()
+    assert state_store.get(key)["history_id"] == "100"
+
+
+def test_checkpoint_only_lists_added_messages(service):
+    state_store = MemoryStateStore()
+    assert len(make_reader(service, state_store=state_store).run()) == 8
+    service.added_since["100"] = ["m0003"]
+    orders = make_reader(service, state_store=state_store).run()
+    assert [order.id for order in orders] == [corpus.order_number(Stores.AMAZONCA, 3)]
@@ -0,0 +1,86 @@
+import asyncio
+import imaplib
+
+import pytest
+
+from benchmarks import corpus
+from benchmarks.imap_server import ImapServer
+from email_scrapper.aioimap import IMAP4Error
+from email_scrapper.imap_pool import AsyncImapPool, ImapPool
+from email_scrapper.readers import AsyncSmtpReader
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+@pytest.fixture
+def server():
+    with ImapServer(corpus.mailbox(2, 1)) as server:
+        server.missing_folders.add("missing")
+        yield server
+
+
+def test_select_of_a_missing_folder_fails(server):
+    pool = ImapPool("user", "password", server.settings, use_ssl=False)
+    with pool.session() as session:
+        session.select("inbox")
+        with pytest.raises(imaplib.IMAP4.error):
+            session.select("missing")
+        # The session no longer takes the inbox for selected
+        assert session.folder is None
+        assert session.select("inbox") == ("1", len(server.messages) + 1)
+        assert session.folder == "inbox"
+    # A failed command leaves the session usable, it went back to the pool
+    assert len(pool) == 1
+    with pool.session() as session:
+        assert session.select("inbox") == ("1", None)
+    pool.close()
+    assert pool.connects == 1
+
+
+def test_async_select_of_a_missing_folder_fails(server):
+    async def select():
+        pool = AsyncImapPool("user", "password", server.settings, use_ssl=False)
+        session = await pool.acquire()
+        try:
+            with pytest.raises(IMAP4Error):
+                await session.select("missing")
+            assert session.folder is None
+            assert await session.select("inbox") == ("1", len(server.messages) + 1)
+            assert session.folder == "inbox"
+        finally:
+            await pool.release(session)
+            await pool.close()
+        return pool
+
+    pool = run(select())
+    assert pool.connects == 1
+    assert len(pool) == 0
+
+
+@pytest.mark.parametrize("max_sessions", [None, 1])
+def test_async_readers_share_the_pool_sessions(server, max_sessions):
+    async def scrape():
+        pool = AsyncImapPool("user", "password", server.settings, use_ssl=False, max_sessions=max_sessions)
+        readers = [AsyncSmtpReader("user", "password", settings=server.settings, email_address=corpus.USER_EMAIL,
+                                   use_ssl=False, workers=4, pool=pool) for _ in range(2)]
+        first = await readers[0].run()
+        connects = pool.connects
+        second = await readers[1].run()
+        # The second reader only borrowed the sessions the first one returned
+        assert pool.connects == connects
+        assert len(pool) == connects
+        await pool.close()
+        return pool, first, second
+
+    pool, first, second = run(scrape())
+    assert len(first) == 10
+    assert [order.id for order in first] == [order.id for order in second]
+    if max_sessions:
+        assert pool.connects == max_sessions
+    assert len(pool) == 0
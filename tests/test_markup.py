@@ -0,0 +1,40 @@
+import base64
+import quopri
+from email.message import Message
+
+import pytest
+
+from email_scrapper.stores import markup
+
+TEXT = "Votre commande a été expédiée. Merci d'avoir magasiné chez nous, à bientôt! Qté: 2, Prix: 10,99 $"
+
+
+def make_part(payload: bytes, charset: str = None, encoding: str = None) -> Message:
+    part = Message()
+    part["Content-Type"] = f'text/html; charset="{charset}"' if charset else "text/html"
+    if encoding == "base64":
+        payload = base64.encodebytes(payload)
+    elif encoding == "quoted-printable":
+        payload = quopri.encodestring(payload)
+    if encoding:
+        part["Content-Transfer-Encoding"] = encoding
+    part.set_payload(payload.decode("ascii", "surrogateescape"))
+    return part
+
+
+@pytest.mark.parametrize("encoding", [None, "base64", "quoted-printable"])
+def test_declared_charset(encoding):
+    assert markup.decode_part(make_part(TEXT.encode("latin-1"), "iso-8859-1", encoding)) == TEXT
+
+
+@pytest.mark.parametrize("charset", [None, "x-unknown-charset"])
+def test_missing_or_unknown_charset_falls_back_to_utf8(charset):
+    assert markup.decode_part(make_part(TEXT.encode("utf-8"), charset, "base64")) == TEXT
+
+
+def test_wrong_charset_is_detected():
+    assert markup.decode_part(make_part(TEXT.encode("cp1252"), "utf-8", "base64")) == TEXT
+
+
+def test_empty_part():
+    assert markup.decode_part(make_part(b"")) == ""
@@ -0,0 +1,96 @@
+import email
+import email.policy
+from email.utils import parsedate_to_datetime
+
+from benchmarks import corpus
+from benchmarks.imap_server import ImapServer
+from email_scrapper.memo import ContentMemo, apply_email_fields, content_digest
+from email_scrapper.models import Item, Order, Stores
+from email_scrapper.readers import SmtpReader, base_reader
+from email_scrapper.stores import amazon
+
+RESENT_DATE = "Tue, 20 Oct 2020 09:30:00 -0400"
+
+
+def resent(raw_email: bytes, date: str = RESENT_DATE) -> bytes:
+    message = email.message_from_bytes(raw_email, policy=email.policy.compat32)
+    message.replace_header("Date", date)
+    return message.as_bytes()
+
+
+def make_order(order_id: str) -> Order:
+    return Order(order_id, None, Stores.LEGOCA, [Item("Brick", 1.0, 1, order_id)])
+
+
+def test_lru_evicts_the_least_recently_used():
+    memo = ContentMemo(max_entries=2)
+    memo.put("a", make_order("a"))
+    memo.put("b", make_order("b"))
+    assert memo.get("a")[0]
+    memo.put("c", make_order("c"))
+    assert [memo.get(digest)[0] for digest in ("a", "b", "c")] == [True, False, True]
+    assert len(memo) == 2
+
+
+def test_disk_tier_survives_a_new_memo(tmp_path):
+    path = str(tmp_path / "memo.sqlite3")
+    with ContentMemo(max_entries=1, path=path) as memo:
+        memo.put("order", make_order("1"))
+        memo.put("not an order", None)
+    with ContentMemo(path=path) as memo:
+        hit, order = memo.get("order")
+        assert hit and order == make_order("1")
+        assert order.cart == make_order("1").cart
+        assert memo.get("not an order") == (True, None)
+        assert memo.get("missing") == (False, None)
+
+
+def test_disk_tier_keeps_max_disk_entries(tmp_path):
+    with ContentMemo(path=str(tmp_path / "memo.sqlite3"), max_disk_entries=2) as memo:
+        for digest in "abc":
+            memo.put(digest, None)
+        memo.evict()
+        assert len(memo) == 2
+
+
+def test_parser_version_changes_the_digest():
+    message = email.message_from_bytes(corpus.amazon_email(2, corpus.order_number(Stores.AMAZONCA, 0)))
+    assert content_digest(Stores.AMAZONCA, 1, message) == content_digest(Stores.AMAZONCA, 1, message)
+    assert content_digest(Stores.AMAZONCA, 1, message) != content_digest(Stores.AMAZONCA, 2, message)
+
+
+def test_resent_email_hits_with_its_own_date():
+    raw_email = corpus.amazon_email(2, corpus.order_number(Stores.AMAZONCA, 0))
+    first, second = email.message_from_bytes(raw_email), email.message_from_bytes(resent(raw_email))
+    assert content_digest(Stores.AMAZONCA, 1, first) == content_digest(Stores.AMAZONCA, 1, second)
+    memo = ContentMemo()
+    memo.put("digest", amazon.get_data(first))
+    hit, order = memo.get("digest")
+    assert apply_email_fields(Stores.AMAZONCA, second, order)
+    assert order.purchased == parsedate_to_datetime(RESENT_DATE)
+    del second["Date"]
+    assert not apply_email_fields(Stores.AMAZONCA, second, order)
+
+
+def count_amazon_parses(server: ImapServer, memo: ContentMemo) -> int:
+    parses = []
+
+    def parser(message):
+        parses.append(message)
+        return amazon.get_data(message)
+
+    reader = SmtpReader("user", "password", settings=server.settings, email_address=corpus.USER_EMAIL,
+                        use_ssl=False, memo=memo)
+    reader._store_processors[Stores.AMAZONCA] = (parser, None)
+    reader.run()
+    return len(parses)
+
+
+def test_reader_parses_identical_content_once(monkeypatch):
+    raw_email = corpus.amazon_email(2, corpus.order_number(Stores.AMAZONCA, 0))
+    memo = ContentMemo()
+    with ImapServer([raw_email, resent(raw_email)]) as server:
+        assert count_amazon_parses(server, memo) == 1
+        assert count_amazon_parses(server, memo) == 0
+        monkeypatch.setitem(base_reader.parser_versions, Stores.AMAZONCA, amazon.PARSER_VERSION + 1)
+        assert count_amazon_parses(server, memo) == 1
@@ -0,0 +1,97 @@
+import datetime
+
+import pytest
+
+from email_scrapper.models import Item, Order, Stores
+
+PURCHASED = datetime.datetime(2020, 10, 12)
+
+
+def make_order(order_id: str, *items: tuple, store: Stores = Stores.LEGOCA) -> Order:
+    return Order(order_id, PURCHASED, store, [Item(name, price, quantity, order_id) for name, price, quantity in items])
+
+
+def quantities(order: Order) -> list:
+    return [(item.name, item.quantity) for item in order.cart]
+
+
+def test_merge_adds_the_quantity_of_items_with_the_same_name():
+    order = make_order("T1", ("Castle 10305", 10.0, 1), ("Bricks", 5.0, 2))
+    order += make_order("T1", ("bricks!", 5.0, 3), ("CASTLE 10305", 10.0, 1))
+    assert quantities(order) == [("Castle 10305", 2), ("Bricks", 5)]
+
+
+def test_merge_matches_near_duplicate_names():
+    order = make_order("T1", ("LEGO Star Wars X-Wing Starfighter 75218", 99.0, 1), ("Castle 10305", 10.0, 1))
+    order += make_order("T1", ("LEGO Star Wars X-Wing Starfightr 75218", 99.0, 2))
+    assert quantities(order) == [("LEGO Star Wars X-Wing Starfighter 75218", 3), ("Castle 10305", 1)]
+
+
+def test_merge_matches_every_item_once():
+    order = make_order("T1", ("LEGO Star Wars X-Wing Starfighter 75218", 99.0, 1))
+    order += make_order("T1", ("LEGO Star Wars X-Wing Starfighter 75218 ", 99.0, 1),
+                        ("LEGO Star Wars X-Wing Starfightr 75218", 99.0, 1))
+    assert quantities(order) == [("LEGO Star Wars X-Wing Starfighter 75218", 2),
+                                 ("LEGO Star Wars X-Wing Starfightr 75218", 1)]
+
+
+def test_merge_appends_items_without_a_match():
+    order = make_order("T1", ("Castle 10305", 10.0, 1))
+    order += make_order("T1", ("Millennium Falcon 75192", 849.0, 1), ("Castle 10305", 10.0, 1),
+                        ("Castle 10305", 10.0, 2))
+    assert quantities(order) == [("Castle 10305", 2), ("Millennium Falcon 75192", 1), ("Castle 10305", 2)]
+
+
+def test_merge_of_different_names_keeps_both():
+    order = make_order("T1", ("Castle 10305", 10.0, 1))
+    order += make_order("T1", ("Pirate Ship 31109", 10.0, 1))
+    assert quantities(order) == [("Castle 10305", 1), ("Pirate Ship 31109", 1)]
+
+
+def test_orders_with_lego_ids_hash_and_compare_by_id_store_and_cart():
+    order = make_order("T123456789", ("Castle 10305", 10.0, 1))
+    same = make_order("T123456789", ("Castle 10305", 12.0, 2))
+    assert order == same and hash(order) == hash(same)
+    assert len({order, same}) == 1
+    assert order != make_order("T123456789", ("Castle 10305", 10.0, 1), store=Stores.AMAZONCA)
+    assert order != make_order("T123456789", ("Pirate Ship 31109", 10.0, 1))
+    assert order != make_order("T987654321", ("Castle 10305", 10.0, 1))
+    assert order != "T123456789"
+
+
+def test_items_compare_by_order_and_name():
+    item = Item("Castle 10305", 10.0, 1, "T1")
+    assert item == Item("Castle 10305", 12.0, 2, "T1") and hash(item) == hash(Item("Castle 10305", 12.0, 2, "T1"))
+    assert item != Item("Castle 10305", 10.0, 1, "T2")
+
+
+def test_orders_sort_by_purchase_date():
+    first = Order("T1", PURCHASED, Stores.LEGOCA)
+    second = Order("T2", PURCHASED + datetime.timedelta(days=1), Stores.LEGOCA)
+    assert first < second and second > first
+    assert not first > second
+    assert sorted([second, first]) == [first, second]
+
+
+def test_to_tuple_and_to_dict():
+    order = Order("T1", PURCHASED, Stores.LEGOCA, [Item("Castle 10305", 10.004, 2, "T1", "https://lego.com/1")],
+                  tracking="1Z", shipped=True, discount=5.004)
+    item = order.cart[0]
+    assert order.to_tuple() == ("T1", PURCHASED, Stores.LEGOCA, "1Z", True, 5.0, [item])
+    assert item.to_tuple() == ("Castle 10305", "T1", 10.0, 2, "https://lego.com/1")
+    assert len(order.to_tuple()) == len(Order.FIELDS) and len(item.to_tuple()) == len(Item.FIELDS)
+    assert order.to_dict() == {
+        "id": "T1", "purchased": "2020-10-12", "store": Stores.LEGOCA.value, "tracking": "1Z", "shipped": True,
+        "discount": 5.0,
+        "cart": [{"name": "Castle 10305", "order": "T1", "unit_price": 10.0, "quantity": 2,
+                  "item_page": "https://lego.com/1"}]
+    }
+    assert dict(order) == order.to_dict() and dict(item) == item.to_dict()
+    assert order["tracking"] == "1Z"
+    with pytest.raises(KeyError):
+        order["missing"]
+
+
+def test_models_are_slotted():
+    assert not hasattr(make_order("T1", ("Castle 10305", 10.0, 1)), "__dict__")
+    assert not hasattr(Item("Castle 10305", 10.0, 1, "T1"), "__dict__")
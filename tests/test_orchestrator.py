@@ -0,0 +1,101 @@
+import threading
+import time
+
+import pytest
+
+from email_scrapper.models import Order, Stores
+from email_scrapper.orchestrator import Account, Orchestrator, merge_results
+
+
+class FakeReader:
+    """
+    Stands in for a reader, failing with the next error of errors on every run until there are none left
+    """
+
+    def __init__(self, tracker: "Tracker", orders: list, errors: list):
+        self.tracker = tracker
+        self.orders = orders
+        self.errors = errors
+
+    def run(self) -> list:
+        with self.tracker.lock:
+            self.tracker.running += 1
+            self.tracker.most_running = max(self.tracker.most_running, self.tracker.running)
+        try:
+            time.sleep(0.02)
+            if self.errors:
+                raise self.errors.pop(0)
+            return self.orders
+        finally:
+            with self.tracker.lock:
+                self.tracker.running -= 1
+
+
+class Tracker:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = 0
+        self.most_running = 0
+
+    def account(self, name: str, orders: list = (), errors: list = (), **kwargs) -> Account:
+        errors = list(errors)
+        return Account(name, lambda: FakeReader(self, list(orders), errors), **kwargs)
+
+
+@pytest.mark.parametrize("usernames, most_running", [(["a", "a", "a"], 1), (["a", "b", "c"], 3)])
+def test_host_limit_is_per_login(usernames, most_running):
+    tracker = Tracker()
+    accounts = [tracker.account(f"account {i}", host="imap.example.com", connections=2, username=username)
+                for i, username in enumerate(usernames)]
+    results = Orchestrator(accounts, workers=3, host_limits={"imap.example.com": 3}).run()
+    assert [result.account for result in results] == accounts
+    assert tracker.most_running == most_running
+
+
+def test_account_over_the_limit_runs_alone():
+    tracker = Tracker()
+    accounts = [tracker.account(f"account {i}", host="imap.example.com", connections=20, username="a")
+                for i in range(2)]
+    results = Orchestrator(accounts, workers=2, host_limits={"imap.example.com": 15}).run()
+    assert [result.error for result in results] == [None, None]
+    assert tracker.most_running == 1
+
+
+def test_transient_errors_are_retried_after_a_backoff():
+    tracker = Tracker()
+    orders = [Order("1", None, Stores.LEGOCA)]
+    account = tracker.account("account", orders, errors=[ConnectionError(), ConnectionError()])
+    start = time.monotonic()
+    result, = Orchestrator([account], backoff=0.1).run()
+    assert result.error is None
+    assert result.orders == orders
+    assert result.attempts == 3
+    # Every retry waits at least half of its backoff, 0.1 and then 0.2 seconds
+    assert time.monotonic() - start >= 0.05 + 0.1
+
+
+def test_retries_give_up():
+    tracker = Tracker()
+    errors = [ConnectionError(), ConnectionError()]
+    result, = Orchestrator([tracker.account("account", errors=errors)], retries=1, backoff=0.01).run()
+    assert isinstance(result.error, ConnectionError)
+    assert result.orders == []
+    assert result.attempts == 2
+
+
+def test_other_errors_are_not_retried():
+    tracker = Tracker()
+    result, = Orchestrator([tracker.account("account", errors=[ValueError("parser bug")])], backoff=0.01).run()
+    assert isinstance(result.error, ValueError)
+    assert result.attempts == 1
+
+
+def test_merge_results():
+    tracker = Tracker()
+    first = [Order("1", None, Stores.LEGOCA), Order("2", None, Stores.LEGOCA)]
+    second = [Order("3", None, Stores.AMAZONCA)]
+    accounts = [tracker.account("first", first), tracker.account("failing", errors=[ValueError()]),
+                tracker.account("second", second)]
+    results = Orchestrator(accounts).run()
+    assert merge_results(results) == [("first", first[0]), ("first", first[1]), ("second", second[0])]
@@ -0,0 +1,87 @@
+import datetime
+import logging
+
+import pytest
+
+from email_scrapper.models import Item, Order, OrderEvent, Stores
+from email_scrapper.order_store import OrderStore
+from email_scrapper.readers import BaseReader
+
+EASTERN = datetime.timezone(datetime.timedelta(hours=-4))
+
+
+def first_email() -> Order:
+    return Order("T1", datetime.datetime(2020, 10, 12, 10, tzinfo=EASTERN), Stores.LEGOCA,
+                 [Item("Millennium Falcon", 199.99, 1, "T1")])
+
+
+def second_email() -> Order:
+    return Order("T1", datetime.datetime(2020, 10, 12, 10, tzinfo=EASTERN), Stores.LEGOCA,
+                 [Item("Millennium  Falcon", 199.99, 1, "T1"), Item("Brick Box", 5.0, 2, "T1")],
+                 tracking="1Z1", shipped=True, discount=10.0)
+
+
+def summary(order: Order) -> tuple:
+    return (order.id, order.store, order.purchased, order.tracking, order.shipped, order.discount,
+            [(item.name, item.unit_price, item.quantity) for item in order.cart])
+
+
+@pytest.fixture
+def store():
+    with OrderStore(":memory:") as store:
+        yield store
+
+
+def test_upsert_merges_like_the_readers(store):
+    merged = {}
+    BaseReader._save_order(merged, first_email())
+    BaseReader._save_order(merged, second_email())
+    assert store.upsert(first_email()) == OrderEvent.NEW
+    assert store.upsert(second_email()) == OrderEvent.UPDATED
+    assert summary(store.get("T1")) == summary(merged["T1"])
+    assert store.get("T1").cart[0].quantity == 2
+    assert len(store) == 1
+
+
+def test_replace_does_not_merge(store):
+    store.upsert(first_email())
+    assert store.replace([second_email()]) == 1
+    assert summary(store.get("T1")) == summary(second_email())
+
+
+def test_accounts_are_kept_apart(store):
+    store.upsert(first_email(), account="a")
+    store.upsert(second_email(), account="b")
+    assert summary(store.get("T1", account="a")) == summary(first_email())
+    assert summary(store.get("T1", account="b")) == summary(second_email())
+
+
+def test_orders_without_an_id_are_skipped(store, caplog):
+    with caplog.at_level(logging.WARNING):
+        assert store.upsert_many([Order(None, None, Stores.LEGOCA), first_email()]) == [None, OrderEvent.NEW]
+        assert store.replace([Order(None, None, Stores.LEGOCA)]) == 0
+    assert "without an id" in caplog.text
+    assert len(store) == 1
+
+
+def test_orders_by_date_range_and_store(store):
+    store.replace([Order(f"A{day}", datetime.datetime(2020, 10, day), Stores.AMAZONCA) for day in (1, 2, 3)] +
+                  [Order("T1", datetime.datetime(2020, 10, 2, 2, tzinfo=EASTERN), Stores.LEGOCA)])
+    ids = [order.id for order in store.orders(date_from=datetime.datetime(2020, 10, 2),
+                                              date_to=datetime.datetime(2020, 10, 3))]
+    assert ids == ["A2", "T1"]
+    assert [order.id for order in store.orders(store=Stores.AMAZONCA)] == ["A1", "A2", "A3"]
+    # Aware dates keep their offset, naive ones stay naive
+    assert store.get("T1").purchased == datetime.datetime(2020, 10, 2, 2, tzinfo=EASTERN)
+    assert store.get("A1").purchased.tzinfo is None
+
+
+def test_item_totals(store):
+    store.replace([second_email(),
+                   Order("A1", datetime.datetime(2020, 10, 1), Stores.AMAZONCA, [Item("Brick Box", 4.0, 1, "A1")])])
+    totals = [(total.name, total.store, total.quantity, total.spent, total.orders) for total in store.item_totals()]
+    assert totals == [("Millennium  Falcon", Stores.LEGOCA, 1, 199.99, 1),
+                      ("Brick Box", Stores.LEGOCA, 2, 10.0, 1),
+                      ("Brick Box", Stores.AMAZONCA, 1, 4.0, 1)]
+    assert [item.order for item in store.items_named("brick  box")] == ["T1", "A1"]
+    assert store.store_totals() == {Stores.LEGOCA: (1, 199.99), Stores.AMAZONCA: (1, 4.0)}
@@ -0,0 +1,33 @@
+import itertools
+
+from benchmarks import corpus
+from email_scrapper.models import Stores
+from email_scrapper.pipeline import ParserPool
+
+
+def get_subject(message) -> str:
+    return message["Subject"]
+
+
+def test_imap_keeps_the_input_order():
+    raw_emails = [(str(i), corpus.amazon_email(1 + i % 3, corpus.order_number(Stores.AMAZONCA, i))) for i in range(12)]
+    with ParserPool(2) as pool:
+        results = [(key, parse()) for key, parse in pool.imap(get_subject, raw_emails)]
+    assert [key for key, subject in results] == [str(i) for i in range(12)]
+    assert all(subject for key, subject in results)
+
+
+def test_imap_waits_on_the_parsers_once_max_pending_emails_are_in_flight():
+    taken = itertools.count()
+    raw_email = corpus.amazon_email(1)
+
+    def raw_emails():
+        for i in range(10):
+            next(taken)
+            yield str(i), raw_email
+
+    with ParserPool(1, max_pending=3) as pool:
+        results = pool.imap(get_subject, raw_emails())
+        next(results)
+        assert next(taken) == 3
+        assert len(list(results)) == 9
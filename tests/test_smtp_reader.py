@@ -0,0 +1,135 @@
+import email
+import imaplib
+import itertools
+import logging
+import math
+
+import pytest
+
+from benchmarks import corpus
+from benchmarks.imap_server import ImapServer
+from email_scrapper.models import Stores
+from email_scrapper.readers import SmtpReader
+from email_scrapper.state import MemoryStateStore
+
+
+def make_reader(server: ImapServer, **kwargs) -> SmtpReader:
+    return SmtpReader("user", "password", settings=server.settings, email_address=corpus.USER_EMAIL,
+                      use_ssl=False, **kwargs)
+
+
+@pytest.fixture
+def server():
+    with ImapServer([corpus.amazon_email(2, corpus.order_number(Stores.AMAZONCA, i)) for i in range(5)]) as server:
+        yield server
+
+
+@pytest.mark.parametrize("fetch_batch_size, uid_sets", [
+    (2, ["1:2", "3:4", "5"]),
+    (5, ["1:5"]),
+    (100, ["1:5"]),
+    (1, ["1", "2", "3", "4", "5"]),
+])
+def test_emails_are_fetched_in_batches(server, fetch_batch_size, uid_sets):
+    assert len(make_reader(server, fetch_batch_size=fetch_batch_size).run()) == 5
+    assert server.fetched_uid_sets == uid_sets
+    assert len(server.fetched_uid_sets) == math.ceil(5 / fetch_batch_size)
+
+
+def test_nothing_is_fetched_without_uids():
+    with ImapServer([]) as server:
+        assert make_reader(server).run() == []
+    assert server.fetched_uid_sets == []
+
+
+def test_failed_fetch_keeps_the_checkpoint(server):
+    state_store = MemoryStateStore()
+    server.failing_uids.add(4)
+    with pytest.raises(imaplib.IMAP4.error):
+        make_reader(server, state_store=state_store, fetch_batch_size=2).run()
+    assert state_store.get(f"SmtpReader:{corpus.USER_EMAIL}:AMAZONCA") is None
+    server.failing_uids.clear()
+    assert len(make_reader(server, state_store=state_store).run()) == 5
+    assert state_store.get(f"SmtpReader:{corpus.USER_EMAIL}:AMAZONCA")["last_uid"] == 5
+
+
+@pytest.mark.parametrize("updates", [True, False])
+@pytest.mark.parametrize("workers", [1, 4])
+def test_checkpoint_is_saved_once_the_events_are_consumed(server, workers, updates):
+    state_store = MemoryStateStore()
+    key = f"SmtpReader:{corpus.USER_EMAIL}:AMAZONCA"
+    events = make_reader(server, state_store=state_store, workers=workers).iter_orders(updates=updates)
+    orders = [order for event, order in itertools.islice(events, 5)]
+    events.close()
+    assert len(orders) == 5
+    assert state_store.get(key) is None
+    events = make_reader(server, state_store=state_store, workers=workers).iter_orders(updates=updates)
+    assert len(list(events)) == 5
+    assert state_store.get(key)["last_uid"] == 5
+    assert list(make_reader(server, state_store=state_store, workers=workers).iter_orders(updates=updates)) == []
+
+
+def test_every_store_of_a_folder_saves_the_folder_checkpoint():
+    messages = corpus.mailbox(2, 1, stores=[Stores.AMAZONCA, Stores.WALMART, Stores.LEGOCA])
+    with ImapServer(messages) as server:
+        state_store = MemoryStateStore()
+        assert len(make_reader(server, state_store=state_store).run()) == 6
+        for store in (Stores.AMAZONCA, Stores.WALMART, Stores.LEGOCA):
+            assert state_store.get(f"SmtpReader:{corpus.USER_EMAIL}:{store.name}")["last_uid"] == 6
+        assert make_reader(server, state_store=state_store).run() == []
+
+
+def test_emails_that_are_not_orders_are_not_logged_as_errors(server, caplog):
+    def not_an_order(message):
+        raise TypeError("not an order")
+
+    reader = make_reader(server)
+    reader._store_processors[Stores.AMAZONCA] = (not_an_order, None)
+    with caplog.at_level(logging.DEBUG):
+        assert reader.run() == []
+    assert "not an order" in caplog.text
+    assert not [record for record in caplog.records if record.levelno >= logging.ERROR]
+
+
+def with_subject(raw_email: bytes, subject: str) -> bytes:
+    message = email.message_from_bytes(raw_email)
+    message.replace_header("Subject", subject)
+    return message.as_bytes()
+
+
+def test_prefilter_keeps_the_emails_the_parsers_take():
+    messages = [with_subject(corpus.lego_email(2, corpus.order_number(Stores.LEGOCA, 1)), "Your LEGO order"),
+                corpus.lego_email(2, corpus.order_number(Stores.LEGOCA, 2)),
+                corpus.walmart_email(2, corpus.order_number(Stores.WALMART, 1)),
+                with_subject(corpus.walmart_email(2, corpus.order_number(Stores.WALMART, 2)), "Deals this week")]
+    with ImapServer(messages) as server:
+        expected = make_reader(server).run()
+        assert len(expected) == 3
+        orders = make_reader(server, prefilter=True).run()
+    assert [order.id for order in orders] == [order.id for order in expected]
+
+
+def test_prefilter_drops_emails_by_their_subject():
+    messages = [corpus.walmart_email(2, corpus.order_number(Stores.WALMART, 1)),
+                with_subject(corpus.walmart_email(2, corpus.order_number(Stores.WALMART, 2)), "Deals this week")]
+    with ImapServer(messages) as server:
+        reader = make_reader(server, prefilter=True)
+        try:
+            keys = reader.search_store_emails(Stores.WALMART)
+            assert len(keys) == 2
+            assert reader._prefilter(Stores.WALMART, keys, "shipped") == keys[:1]
+        finally:
+            reader._finish()
+    assert server.fetched_uid_sets == ["1:2"]
+
+
+@pytest.mark.parametrize("locations, searches", [(None, 1), ({Stores.AMAZONCA: "amazon"}, 2)])
+def test_combined_search_searches_every_folder_once(locations, searches):
+    with ImapServer(corpus.mailbox(2, 2)) as server:
+        expected = make_reader(server, locations=locations).run()
+        server.searches.clear()
+        orders = make_reader(server, locations=locations, combined_search=True).run()
+    assert len(server.searches) == searches
+    assert sorted((order.store.name, order.id) for order in orders) == \
+           sorted((order.store.name, order.id) for order in expected)
+    assert len(orders) == 10
@@ -0,0 +1,86 @@
+import email
+import io
+import logging
+import warnings
+
+import pytest
+
+from benchmarks import corpus
+from email_scrapper.models import Stores
+from email_scrapper.stores import amazon, bestbuy, ebgames, lego, walmart
+
+pytest.importorskip("bs4", reason="the legacy parsers need beautifulsoup4")
+
+with warnings.catch_warnings():  # Their regexes aren't raw strings
+    warnings.simplefilter("ignore", DeprecationWarning)
+    from tests.legacy_stores import amazon as legacy_amazon, ebgames as legacy_ebgames, lego as legacy_lego, \
+        walmart as legacy_walmart
+
+parsers = {
+    Stores.AMAZONCA: (legacy_amazon.get_data, amazon.get_data),
+    Stores.EBGAMES: (legacy_ebgames.parse_ebgames_email, ebgames.parse_ebgames_email),
+    Stores.LEGOCA: (legacy_lego.parse_lego_email, lego.parse_lego_email),
+    Stores.WALMART: (legacy_walmart.parse_walmart_email, walmart.parse_walmart_email)
+}
+
+
+def summary(order) -> tuple:
+    return (order.id, order.purchased, order.store, order.discount,
+            [(item.name, item.unit_price, item.quantity, item.order) for item in order.cart])
+
+
+@pytest.mark.parametrize("items", [1, 3, 40])
+@pytest.mark.parametrize("store", list(parsers), ids=lambda store: store.name)
+def test_parsers_match_the_legacy_parsers(store, items):
+    raw_email = corpus.store_email(store, items, corpus.order_number(store, items))
+    legacy_parser, parser = parsers[store]
+    expected = legacy_parser(email.message_from_bytes(raw_email))
+    order = parser(email.message_from_bytes(raw_email))
+    assert order is not None and order.cart
+    assert summary(order) == summary(expected)
+
+
+def test_bestbuy_reads_every_page_of_the_order_table():
+    items = corpus.PDF_ROWS_PER_PAGE * 6 + 1
+    spans = bestbuy.extract_spans(corpus.bestbuy_invoice(items))
+    assert any(f"Widget Model {items - 1} & Co" in text for text in spans)
+
+
+def test_bestbuy_reads_table_pages_without_labels():
+    items = corpus.PDF_ROWS_PER_PAGE * 3 + 1
+    spans = bestbuy.extract_spans(corpus.bestbuy_invoice(items, repeat_labels=False))
+    assert any(f"Widget Model {items - 1} & Co" in text for text in spans)
+    # The first page of terms ends the table, the second one is not analysed
+    assert not any("Terms and conditions 1." in text for text in spans)
+
+
+def test_bestbuy_page_limit_is_logged(caplog):
+    pdf = corpus.bestbuy_invoice(corpus.PDF_ROWS_PER_PAGE * 3)
+    with caplog.at_level(logging.WARNING):
+        bestbuy.extract_spans(pdf, max_pages=2)
+    assert "first 2 pages" in caplog.text
+
+
+def test_bestbuy_html_parser_matches_the_span_parser():
+    reader = bestbuy.BestBuyReader()
+    pdf = corpus.bestbuy_invoice(3)
+    html_file, = reader.extract_text({"invoice.pdf": io.BytesIO(pdf)}, output_type="html")
+    order = reader.bs4method(html_file.read().decode("utf-8"))
+    assert order.cart
+    assert summary(order) == summary(reader.parse_spans(bestbuy.extract_spans(pdf)))
+
+
+def test_bestbuy_discount():
+    spans = ["", "Order Number:\n", "1234567890\n", "Discount\n", "-CDN$ 5.00\n"]
+    assert bestbuy.BestBuyReader().parse_spans(spans).discount == 5.00
+
+
+def test_bestbuy_extract_text_takes_the_laparams():
+    reader = bestbuy.BestBuyReader()
+    pdf = corpus.bestbuy_invoice(3)
+    text_file, = reader.extract_text({"invoice.pdf": io.BytesIO(pdf)}, char_margin=1.0, word_margin=0.2)
+    no_layout_file, = reader.extract_text({"invoice.pdf": io.BytesIO(pdf)}, no_laparams=True)
+    assert b"Widget Model 2 & Co" in text_file.read()
+    assert b"Widget Model 2 & Co" in no_layout_file.read()
+    with pytest.raises(ValueError):
+        reader.extract_text({"invoice.pdf": io.BytesIO(pdf)}, True)
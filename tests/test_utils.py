@@ -0,0 +1,20 @@
+import pytest
+
+from email_scrapper import utils
+
+
+@pytest.mark.parametrize("uids, uid_set", [
+    (list(range(101, 251)) + [300], "101:250,300"),
+    ([b"300", b"102", b"101", b"101"], "101:102,300"),
+    (["7"], "7"),
+    ([1, 3, 5], "1,3,5"),
+    ([], ""),
+])
+def test_compress_uids(uids, uid_set):
+    assert utils.compress_uids(uids) == uid_set
+
+
+def test_chunked():
+    assert list(utils.chunked(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(utils.chunked(range(4), 2)) == [[0, 1], [2, 3]]
+    assert list(utils.chunked([], 2)) == []